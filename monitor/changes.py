@@ -0,0 +1,95 @@
+from typing import Callable, FrozenSet, Hashable, Iterable, Optional
+
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from twisted.logger import Logger
+
+# Inputs collectors may depend on
+BLOCK = 'block'      # any new block
+STAKING = 'staking'  # StakingEscrow state: stakes, commitments, workers
+STORAGE = 'storage'  # the crawler's node and fleet state db
+PERIOD = 'period'    # staking period rollover
+
+ALL_INPUTS = frozenset((BLOCK, STAKING, STORAGE, PERIOD))
+
+
+class ChangeDetector:
+    """
+    Works out which collector inputs may have changed since the last round.
+
+    A new block alone doesn't mean staking data changed: StakingEscrow only changes through transactions,
+    and every state changing transaction emits an event, so the contract's logs over the new blocks are
+    checked. Without log watching, every new block counts as a staking change.
+
+    The stakers named by those logs (StakingEscrow events index the staker first) are kept as `changed_stakers`.
+    """
+
+    def __init__(self,
+                 staking_agent: StakingEscrowAgent,
+                 storage_version: Callable[[], Hashable],
+                 watch_logs: bool = True):
+        self.log = Logger(self.__class__.__name__)
+        self.staking_agent = staking_agent
+        self.storage_version = storage_version
+        self.watch_logs = watch_logs
+
+        self._block_number = None
+        self._period = None
+        self._storage_version = None
+        self._changed_stakers = None
+
+    @staticmethod
+    def _stakers(logs: Iterable) -> FrozenSet[str]:
+        """The first indexed argument of each log, the staker for every StakingEscrow event about one"""
+        return frozenset(to_checksum_address(HexBytes(log['topics'][1])[-20:])
+                         for log in logs if len(log.get('topics', ())) > 1)
+
+    def _staking_logs(self, from_block: int, to_block: int) -> Optional[list]:
+        """StakingEscrow logs of the blocks, None if unknown"""
+        if not self.watch_logs:
+            return None
+        try:
+            logs = self.staking_agent.blockchain.client.w3.eth.getLogs({'address': self.staking_agent.contract_address,
+                                                                        'fromBlock': from_block,
+                                                                        'toBlock': to_block})
+        except Exception as e:
+            self.log.warn(f"Unable to get StakingEscrow logs ({e}); assuming staking state changed")
+            return None
+        return logs
+
+    def poll(self, block_number: int, period: int) -> FrozenSet[str]:
+        """Returns the inputs that changed since the previous poll; everything on the first poll"""
+        storage_version = self.storage_version()
+        first_poll = self._block_number is None
+
+        changed, changed_stakers = set(), frozenset()
+        if first_poll:
+            changed.update(ALL_INPUTS)
+            changed_stakers = None
+        else:
+            if block_number != self._block_number:
+                changed.add(BLOCK)
+                logs = None  # reorg to an earlier head
+                if block_number > self._block_number:
+                    logs = self._staking_logs(from_block=self._block_number + 1, to_block=block_number)
+                if logs is None or logs:
+                    changed.add(STAKING)
+                changed_stakers = None if logs is None else self._stakers(logs)
+            if period != self._period:
+                changed.add(PERIOD)
+            if storage_version != self._storage_version:
+                changed.add(STORAGE)
+
+        self._block_number, self._period, self._storage_version = block_number, period, storage_version
+        self._changed_stakers = changed_stakers
+        return frozenset(changed)
+
+    @property
+    def changed_stakers(self) -> Optional[FrozenSet[str]]:
+        """Stakers with StakingEscrow events since the previous poll, as of the last poll; None if unknown"""
+        return self._changed_stakers
+
+    @property
+    def last_block_number(self) -> Optional[int]:
+        return self._block_number
@@ -1,9 +1,14 @@
+from typing import Optional, Sequence
+
 import IP2Location
 import maya
+import numpy as np
 import plotly.graph_objs as go
 from dash import dcc
 from nucypher.blockchain.eth.token import NU
 
+from monitor.db import KnownNodesColumns
+
 GRAPH_CONFIG = {'displaylogo': False,
                 'autosizable': True,
                 'responsive': True,
@@ -128,42 +133,45 @@ def top_stakers_chart(data: dict):
     return graph
 
 
-def nodes_geolocation_map(nodes_dict: dict, ip2loc: IP2Location):
-    longitudes = []
-    latitudes = []
-    staker_text = []
-    status_colors = []
-
-    # determine geo locations
-    for bucket in nodes_dict:
-        nodes = nodes_dict[bucket]
-        for node_info in nodes:
-            rest_url = node_info['rest_url'][:-5]  # remove port number
-            try:
-                # get_all is called even if more specific element is requested eg. get_longitude
-                geo_info = ip2loc.get_all(rest_url)
-                long = geo_info.longitude
-                lat = geo_info.latitude
-                country = geo_info.country_long
-
-                longitudes.append(long)
-                latitudes.append(lat)
-                staker_text.append(f"{node_info['staker_address']} ({country})")
-                status_colors.append(node_info['status']['color'])
-            except OSError:
-                # TODO: log something? nothing to see here
-                pass
+def nodes_geolocation_map(nodes: KnownNodesColumns, status_colors: Sequence[Optional[str]], ip2loc: IP2Location):
+    """
+    Locations of the nodes of the node table's columns (see `CrawlerStorageClient.get_known_nodes_columns`), in
+    the color of their status; `status_colors` follows the columns' order, nodes without one are left out
+    """
+    # determine geo locations, once per host
+    host_urls = np.array([rest_url[:-5] for rest_url in nodes.rest_url], dtype=str)  # remove port number
+    hosts, host_rows = np.unique(host_urls, return_inverse=True)
+    host_longitudes = np.full(len(hosts), np.nan)
+    host_latitudes = np.full(len(hosts), np.nan)
+    host_countries = np.empty(len(hosts), dtype=object)
+    for idx, host in enumerate(hosts):
+        try:
+            # get_all is called even if more specific element is requested eg. get_longitude
+            geo_info = ip2loc.get_all(str(host))
+            host_longitudes[idx] = geo_info.longitude
+            host_latitudes[idx] = geo_info.latitude
+            host_countries[idx] = geo_info.country_long
+        except OSError:
+            # TODO: log something? nothing to see here
+            pass
+
+    status_colors = np.array(status_colors, dtype=object).reshape(-1)
+    host_rows = host_rows.reshape(-1)
+    located = np.flatnonzero(~np.isnan(host_longitudes[host_rows]) & np.not_equal(status_colors, None))
+    longitudes = host_longitudes[host_rows[located]]
+    latitudes = host_latitudes[host_rows[located]]
+    staker_text = [f"{nodes.checksum_address[row]} ({host_countries[host_rows[row]]})" for row in located]
 
     fig = go.Figure(
         data=go.Scattergeo(
-            lon=longitudes,
-            lat=latitudes,
+            lon=list(longitudes),
+            lat=list(latitudes),
             text=staker_text,
             hoverinfo='text',
             mode='markers',
             marker=dict(
                 opacity=0.5,
-                color=status_colors
+                color=list(status_colors[located])
             )
         ),
         layout=go.Layout(
@@ -3,8 +3,11 @@ import os
 import click
 from flask import Flask
 from monitor.cli._utils import _get_registry, _get_deployer
-from monitor.crawler import Crawler
+from monitor.crawler import Crawler, CrawlerStorage
 from monitor.dashboard import Dashboard
+from monitor.indexer import StakingEscrowIndexer
+from monitor.rounds import RoundExecutor
+from monitor.rpc import StakingEscrowBatchReader
 from nucypher.blockchain.eth.interfaces import BlockchainInterfaceFactory
 from nucypher.blockchain.eth.networks import NetworksInventory
 from nucypher.characters.lawful import Ursula
@@ -12,9 +15,8 @@ from nucypher.cli.config import group_general_config
 from nucypher.cli.painting.help import echo_version
 from nucypher.cli.types import NETWORK_PORT, EXISTING_READABLE_FILE
 from nucypher.network.middleware import RestMiddleware
-from twisted.internet import reactor
 
-# CRAWLER = "Crawler"
+CRAWLER = "Crawler"
 DASHBOARD = "Dashboard"
 
 MONITOR_BANNER = r"""
@@ -33,66 +35,100 @@ def monitor():
     pass
 
 
-# @monitor.command()
-# @group_general_config
-# @click.option('--teacher', 'teacher_uri', help="An Ursula URI to start learning from (seednode)", type=click.STRING)
-# @click.option('--registry-filepath', help="Custom contract registry filepath", type=EXISTING_READABLE_FILE)
-# @click.option('--min-stake', help="The minimum stake the teacher must have to be a teacher", type=click.INT, default=0)
-# @click.option('--network', help="Network Domain Name", type=click.Choice(choices=NetworksInventory.NETWORKS), required=True)
-# @click.option('--learn-on-launch', help="Conduct first learning loop on main thread at launch.", is_flag=True)
-# @click.option('--provider', 'provider_uri', help="Blockchain provider's URI", type=click.STRING, required=True)
-# @click.option('--http-port', help="Crawler HTTP port for JSON endpoint", type=NETWORK_PORT, default=Crawler.DEFAULT_CRAWLER_HTTP_PORT)
-# @click.option('--dry-run', '-x', help="Execute normally without actually starting the crawler", is_flag=True)
-# @click.option('--eager', help="Start learning and scraping before starting up other services", is_flag=True, default=False)
-# def crawl(general_config,
-#           teacher_uri,
-#           registry_filepath,
-#           min_stake,
-#           network,
-#           learn_on_launch,
-#           provider_uri,
-#           http_port,
-#           dry_run,
-#           eager
-#           ):
-#     """
-#     Gather NuCypher network information.
-#     """
-#
-#     # Banner
-#     emitter = general_config.emitter
-#     emitter.clear()
-#     emitter.banner(MONITOR_BANNER.format(CRAWLER))
-#
-#     # Setup
-#     BlockchainInterfaceFactory.initialize_interface(provider_uri=provider_uri)
-#     registry = _get_registry(registry_filepath, network)
-#     middleware = RestMiddleware(registry=registry)
-#
-#     # Teacher Ursula
-#     sage_node = None
-#     if teacher_uri:
-#         sage_node = Ursula.from_teacher_uri(teacher_uri=teacher_uri,
-#                                             min_stake=0,  # TODO: Where to get this?
-#                                             federated_only=False,  # always False
-#                                             network_middleware=middleware,
-#                                             registry=registry)
-#
-#     crawler = Crawler(domain=network if network else None,
-#                       network_middleware=middleware,
-#                       known_nodes=[sage_node] if sage_node else None,
-#                       registry=registry,
-#                       start_learning_now=eager,
-#                       learn_on_same_thread=learn_on_launch)
-#
-#     emitter.message(f"Network: {network.capitalize()}", color='blue')
-#     emitter.message(f"Provider: {provider_uri}", color='blue')
-#     emitter.message(f"Refresh Rate: {crawler._refresh_rate}s", color='blue')
-#     message = f"Running Nucypher Crawler JSON endpoint at http://localhost:{http_port}/stats"
-#     emitter.message(message, color='green', bold=True)
-#     if not dry_run:
-#         crawler.start(eager=eager)
-#         reactor.run()
+@monitor.command()
+@group_general_config
+@click.option('--teacher', 'teacher_uri', help="An Ursula URI to start learning from (seednode)", type=click.STRING)
+@click.option('--registry-filepath', help="Custom contract registry filepath", type=EXISTING_READABLE_FILE)
+@click.option('--min-stake', help="The minimum stake the teacher must have to be a teacher", type=click.INT, default=0)
+@click.option('--network', help="Network Domain Name", type=click.Choice(choices=NetworksInventory.NETWORKS), required=True)
+@click.option('--learn-on-launch', help="Conduct first learning loop on main thread at launch.", is_flag=True)
+@click.option('--provider', 'provider_uri', help="Blockchain provider's URI", type=click.STRING, required=True)
+@click.option('--http-port', help="Crawler HTTP port for JSON endpoint", type=NETWORK_PORT, default=Crawler.DEFAULT_CRAWLER_HTTP_PORT)
+@click.option('--db-filepath', help="Crawler node status DB filepath", type=click.STRING, default=CrawlerStorage.DEFAULT_DB_FILEPATH)
+@click.option('--stats-filepath', help="File the stats of each round are written to, for the dashboard", type=click.STRING, default=Crawler.DEFAULT_STATS_FILEPATH)
+@click.option('--mapped-stats-filepath', help="File the stats of each round are written to in a memory mappable format", type=click.STRING, default=Crawler.DEFAULT_MAPPED_STATS_FILEPATH)
+@click.option('--persistent-storage', help="Keep the node status DB and the last stats across restarts", is_flag=True)
+@click.option('--storage-write-behind', help="Batch node status DB writes in a background thread", is_flag=True)
+@click.option('--rpc-batch-size', help="Contract calls per JSON-RPC batch request", type=click.IntRange(min=1), default=StakingEscrowBatchReader.DEFAULT_CHUNK_SIZE)
+@click.option('--collector-threads', help="Collectors run concurrently in each round", type=click.IntRange(min=1), default=RoundExecutor.DEFAULT_MAX_WORKERS)
+@click.option('--index-staking-events', help="Read staker workers and commitments from an index of StakingEscrow events", is_flag=True)
+@click.option('--index-start-block', help="StakingEscrow deployment block, where indexing starts", type=click.IntRange(min=0), default=0)
+@click.option('--index-confirmations', help="Blocks on top of an event before it is stored in the index", type=click.IntRange(min=0), default=StakingEscrowIndexer.DEFAULT_CONFIRMATIONS)
+@click.option('--trace-rpc', help="Record blockchain calls per collector, served at /rpc_trace", is_flag=True)
+@click.option('--dry-run', '-x', help="Execute normally without actually starting the crawler", is_flag=True)
+@click.option('--eager', help="Start learning and scraping before starting up other services", is_flag=True, default=False)
+def crawl(general_config,
+          teacher_uri,
+          registry_filepath,
+          min_stake,
+          network,
+          learn_on_launch,
+          provider_uri,
+          http_port,
+          db_filepath,
+          stats_filepath,
+          mapped_stats_filepath,
+          persistent_storage,
+          storage_write_behind,
+          rpc_batch_size,
+          collector_threads,
+          index_staking_events,
+          index_start_block,
+          index_confirmations,
+          trace_rpc,
+          dry_run,
+          eager
+          ):
+    """
+    Gather NuCypher network information.
+    """
+
+    # Banner
+    emitter = general_config.emitter
+    emitter.clear()
+    emitter.banner(MONITOR_BANNER.format(CRAWLER))
+
+    # Setup
+    BlockchainInterfaceFactory.initialize_interface(provider_uri=provider_uri)
+    registry = _get_registry(registry_filepath, network)
+    middleware = RestMiddleware(registry=registry)
+
+    # Teacher Ursula
+    sage_node = None
+    if teacher_uri:
+        sage_node = Ursula.from_teacher_uri(teacher_uri=teacher_uri,
+                                            min_stake=min_stake,
+                                            federated_only=False,  # always False
+                                            network_middleware=middleware,
+                                            registry=registry)
+
+    crawler = Crawler(domain=network if network else None,
+                      network_middleware=middleware,
+                      known_nodes=[sage_node] if sage_node else None,
+                      registry=registry,
+                      crawler_http_port=http_port,
+                      db_filepath=db_filepath,
+                      stats_filepath=stats_filepath,
+                      mapped_stats_filepath=mapped_stats_filepath,
+                      persistent_storage=persistent_storage,
+                      storage_write_behind=storage_write_behind,
+                      rpc_batch_size=rpc_batch_size,
+                      collector_threads=collector_threads,
+                      index_staking_events=index_staking_events,
+                      index_start_block=index_start_block,
+                      index_confirmations=index_confirmations,
+                      trace_rpc=trace_rpc,
+                      start_learning_now=eager,
+                      learn_on_same_thread=learn_on_launch)
+
+    emitter.message(f"Network: {network.capitalize()}", color='blue')
+    emitter.message(f"Provider: {provider_uri}", color='blue')
+    emitter.message(f"Refresh Rate: {crawler._refresh_rate}s", color='blue')
+    emitter.message(f"Stats File: {stats_filepath}", color='blue')
+    message = f"Running Nucypher Crawler JSON endpoint at http://localhost:{http_port}/stats"
+    emitter.message(message, color='green', bold=True)
+    if not dry_run:
+        crawler.start(eager=eager)  # <--- Blocking
 
 
 @monitor.command()
@@ -105,6 +141,9 @@ def monitor():
 @click.option('--provider', 'provider_uri', help="Blockchain provider's URI", type=click.STRING, required=True)
 @click.option('--network', help="Network Domain Name", type=click.Choice(choices=(NetworksInventory.MAINNET,)), required=True)  # limit to mainnet
 @click.option('--dry-run', '-x', help="Execute normally without actually starting the dashboard", is_flag=True)
+@click.option('--trace-rpc', help="Record blockchain calls per dash callback, served at /rpc_trace", is_flag=True)
+@click.option('--stats-filepath', help="Serve the stats written by a separate crawler process at /stats", type=click.STRING)
+@click.option('--mapped-stats-filepath', help="Serve node details from a crawler's memory mapped stats file at /stats/nodes", type=click.STRING)
 def dashboard(general_config,
               host,
               http_port,
@@ -114,6 +153,9 @@ def dashboard(general_config,
               provider_uri,
               network,
               dry_run,
+              trace_rpc,
+              stats_filepath,
+              mapped_stats_filepath,
               ):
     """
     Run UI dashboard of NuCypher network.
@@ -135,10 +177,14 @@ def dashboard(general_config,
     if general_config.debug:
         os.environ['FLASK_ENV'] = 'development'
 
-    Dashboard(flask_server=rest_app,
-              route_url='/',
-              registry=registry,
-              network=network)
+    monitor_dashboard = Dashboard(flask_server=rest_app,
+                                  route_url='/',
+                                  registry=registry,
+                                  network=network,
+                                  trace_rpc=trace_rpc,
+                                  stats_filepath=stats_filepath,
+                                  mapped_stats_filepath=mapped_stats_filepath)
+    monitor_dashboard.profiler.install_signal_handler()  # `kill -USR2` profiles the next few requests
 
     #
     # Server
@@ -1,12 +1,15 @@
 import os
 import random
 import sqlite3
-from collections import defaultdict
+import threading
+import time
+from collections import defaultdict, OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional
 
 import click
 import maya
-from eth_typing import ChecksumAddress
-from flask import Flask, jsonify
+import numpy as np
+from flask import Flask, request
 from hendrix.deploy.base import HendrixDeploy
 from nucypher.acumen.perception import FleetSensor, ArchivedFleetState, RemoteUrsulaStatus
 from nucypher.blockchain.economics import EconomicsFactory
@@ -16,7 +19,6 @@ from nucypher.blockchain.eth.agents import (
 from nucypher.blockchain.eth.constants import NULL_ADDRESS
 from nucypher.blockchain.eth.decorators import validate_checksum_address
 from nucypher.blockchain.eth.registry import InMemoryContractRegistry, BaseContractRegistry
-from nucypher.blockchain.eth.token import NU
 from nucypher.blockchain.eth.utils import datetime_at_period, datetime_to_period
 from nucypher.config.constants import DEFAULT_CONFIG_ROOT
 from nucypher.config.storages import ForgetfulNodeStorage
@@ -24,6 +26,42 @@ from nucypher.network.nodes import Teacher, Learner
 from twisted.internet import reactor
 from twisted.logger import Logger
 
+from monitor.changes import ChangeDetector, PERIOD, STAKING, STORAGE
+from monitor.events import StatsEventResource
+from monitor.indexer import StakingEscrowIndexer
+from monitor.metrics import (
+    CONTENT_TYPE,
+    install_rpc_metrics,
+    NOOP_ROUNDS,
+    REGISTRY,
+    ROUND_DURATION,
+    ROUNDS,
+    STORAGE_COMMITS,
+    STORAGE_ROWS_WRITTEN
+)
+from monitor.profiling import add_profile_endpoint, SamplingProfiler
+from monitor.projection import LockedTokensProjection
+from monitor.rounds import CollectorTask, Every, EveryBlock, EveryPeriod, RoundContext, RoundExecutor
+from monitor.rpc import (
+    BlockPinnedAgent,
+    BlockReadCache,
+    JSONRPCBatchTransport,
+    StakerInfo,
+    StakingEscrowBatchReader
+)
+from monitor.snapshots import (
+    iter_ndjson,
+    parse_list,
+    restored_stats,
+    SerializedSnapshot,
+    serialize,
+    SnapshotFile,
+    SnapshotHistory,
+    StatsSnapshot,
+    write_mapped_snapshot_file,
+    write_snapshot_file
+)
+from monitor.tracing import add_trace_endpoint, format_summary, RPCTracer
 from monitor.utils import collector, DelayedLoopingCall
 
 
@@ -32,42 +70,174 @@ class CrawlerStorage:
     DB_FILE_NAME = 'crawler-storage.sqlite'
     DEFAULT_DB_FILEPATH = os.path.join(DEFAULT_CONFIG_ROOT, DB_FILE_NAME)
 
+    # Bump whenever a table definition changes; persistent dbs with a different version are recreated.
+    SCHEMA_VERSION = 3
+
     NODE_DB_NAME = 'node_info'
     NODE_DB_SCHEMA = [('staker_address', 'text primary key'), ('rest_url', 'text'), ('nickname', 'text'),
-                      ('timestamp', 'text'), ('last_seen', 'text'), ('fleet_state_icon', 'text')]
+                      ('timestamp', 'text'), ('last_seen', 'text'), ('fleet_state_icon', 'text'),
+                      ('stale', 'integer'),  # restored from a previous run and not yet seen again
+                      ('change_seq', 'integer')]  # monotonically increasing across inserts, updates and removals
+
+    # Removed stakers, so that incremental readers also learn about removals
+    NODE_TOMBSTONE_DB_NAME = 'node_tombstone'
+    NODE_TOMBSTONE_DB_SCHEMA = [('staker_address', 'text primary key'), ('change_seq', 'integer')]
 
     STATE_DB_NAME = 'fleet_state'
     STATE_DB_SCHEMA = [('nickname', 'text primary key'),
                        ('symbol', 'text'),
                        ('color_hex', 'text'),
                        ('color_name', 'text'),
-                       ('updated', 'text')]
+                       ('updated', 'integer')]  # epoch
 
     TEACHER_DB_NAME = 'teacher'
     TEACHER_ID = 'current_teacher'
     TEACHER_DB_SCHEMA = [('id', 'text primary key'), ('checksum_address', 'text')]
 
-    def __init__(self, db_filepath: str = DEFAULT_DB_FILEPATH):
-        self.db_filepath = db_filepath
-
-        if os.path.exists(self.db_filepath):
-            os.remove(self.db_filepath)
+    # Event indexers: the last block each has fully indexed, so a persistent db resumes where it stopped
+    INDEXER_CURSOR_DB_NAME = 'indexer_cursor'
+    INDEXER_CURSOR_DB_SCHEMA = [('name', 'text primary key'), ('block_number', 'integer')]
+
+    # Staker state materialized from StakingEscrow events
+    STAKER_STATE_DB_NAME = 'staker_state'
+    STAKER_STATE_DB_SCHEMA = [('staker_address', 'text primary key'),
+                              ('worker', 'text'),
+                              ('last_committed_period', 'integer'),
+                              ('first_block', 'integer'),  # first event seen for the staker
+                              ('updated_block', 'integer')]  # latest event seen for the staker
+
+    # SQL is kept constant so that sqlite3's per-connection statement cache can reuse the prepared statements
+    NODE_REPLACE_SQL = f'REPLACE INTO {NODE_DB_NAME} VALUES(?,?,?,?,?,?,0,?)'
+    NODE_MARK_STALE_SQL = f'UPDATE {NODE_DB_NAME} SET stale = 1, change_seq = ?'
+    NODE_DELETE_SQL = f'DELETE FROM {NODE_DB_NAME} WHERE staker_address = ?'
+    NODE_TOMBSTONE_REPLACE_SQL = f'REPLACE INTO {NODE_TOMBSTONE_DB_NAME} VALUES(?,?)'
+    NODE_TOMBSTONE_DELETE_SQL = f'DELETE FROM {NODE_TOMBSTONE_DB_NAME} WHERE staker_address = ?'
+    LAST_CHANGE_SEQ_SQL = (f'SELECT max(coalesce((SELECT max(change_seq) FROM {NODE_DB_NAME}), 0), '
+                           f'coalesce((SELECT max(change_seq) FROM {NODE_TOMBSTONE_DB_NAME}), 0))')
+    STATE_REPLACE_SQL = f'REPLACE INTO {STATE_DB_NAME} VALUES(?,?,?,?,?)'
+    STATE_DELETE_OLDER_THAN_SQL = f'DELETE FROM {STATE_DB_NAME} WHERE updated < ?'
+    STATE_DELETE_BEYOND_ROWS_SQL = (f'DELETE FROM {STATE_DB_NAME} WHERE updated < '
+                                    f'(SELECT updated FROM {STATE_DB_NAME} ORDER BY updated DESC LIMIT 1 OFFSET ?)')
+    TEACHER_REPLACE_SQL = f'REPLACE INTO {TEACHER_DB_NAME} VALUES (?,?)'
+    INDEXER_CURSOR_SELECT_SQL = f'SELECT block_number FROM {INDEXER_CURSOR_DB_NAME} WHERE name = ?'
+    INDEXER_CURSOR_REPLACE_SQL = f'REPLACE INTO {INDEXER_CURSOR_DB_NAME} VALUES (?,?)'
+    STAKER_STATE_SELECT_SQL = f'SELECT * FROM {STAKER_STATE_DB_NAME} WHERE staker_address = ?'
+    STAKER_STATE_REPLACE_SQL = f'REPLACE INTO {STAKER_STATE_DB_NAME} VALUES (?,?,?,?,?)'
+
+    JOURNAL_MODE = 'WAL'
+    SYNCHRONOUS = 'NORMAL'  # with WAL, only a checkpoint fsyncs; a power loss can lose the latest commits, not the db
+
+    DEFAULT_FLUSH_SIZE = 500  # pending rows
+    DEFAULT_FLUSH_INTERVAL = 2  # seconds
+
+    # Fleet state retention
+    DEFAULT_STATE_MAX_ROWS = 1000
+    DEFAULT_STATE_MAX_AGE = 60 * 60 * 24 * 7  # seconds
+    STATE_COMPACTION_INTERVAL = 100  # fleet state writes between compactions
 
-        with self._connect() as db_conn:
+    def __init__(self,
+                 db_filepath: str = DEFAULT_DB_FILEPATH,
+                 write_behind: bool = False,
+                 flush_size: int = DEFAULT_FLUSH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 state_max_rows: Optional[int] = DEFAULT_STATE_MAX_ROWS,
+                 state_max_age: Optional[int] = DEFAULT_STATE_MAX_AGE,
+                 persistent: bool = False):
+        self.log = Logger(self.__class__.__name__)
+        self.db_filepath = db_filepath
+        self.persistent = persistent
+        self.state_max_rows = state_max_rows
+        self.state_max_age = state_max_age
+        self._state_writes_since_compaction = 0
+
+        # single long-lived writer connection, shared by the learning thread and the stats collection thread
+        self._lock = threading.RLock()
+        self._db_conn = None
+
+        # Warm restart: keep an existing db with a matching schema and serve its rows right away
+        self.restored = False
+        if self.persistent and os.path.exists(self.db_filepath):
+            self._db_conn = self._connect()
+            schema_version = self._db_conn.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version == self.SCHEMA_VERSION:
+                self.restored = True
+            else:
+                self._db_conn.close()
+
+        self._change_seq = 0
+        if self.restored:
+            with self._lock, self._db_conn as db_conn:
+                # nodes are kept, but flagged until the learner sees them again
+                self._change_seq = db_conn.execute(self.LAST_CHANGE_SEQ_SQL).fetchone()[0] + 1
+                db_conn.execute(self.NODE_MARK_STALE_SQL, (self._change_seq,))
+        else:
+            self._remove_db_files()
+            self._db_conn = self._connect()
+            self._create_tables()
+
+        # Write-behind: pending rows are keyed so that a later update replaces an earlier one that
+        # has not been written yet; a pending node row of None is a removal.
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = threading.Condition()
+        self._flush_lock = threading.Lock()  # a batch is committed before the next one is taken
+        self._pending_nodes = OrderedDict()
+        self._pending_states = OrderedDict()
+        self._pending_teacher = None
+        self._pending_since = None
+        self._closed = False
+
+        self.queued_rows = 0
+        self.coalesced_rows = 0
+        self.flushed_rows = 0
+
+        self._writer = None
+        if self.write_behind:
+            self._writer = threading.Thread(target=self._write_behind_loop, name='crawler-storage-writer', daemon=True)
+            self._writer.start()
+
+    def _create_tables(self):
+        with self._lock, self._db_conn as db_conn:
 
             node_db_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.NODE_DB_SCHEMA)
             db_conn.execute(f"CREATE TABLE {self.NODE_DB_NAME} ({node_db_schema})")
+            db_conn.execute(f"CREATE INDEX {self.NODE_DB_NAME}_change_seq ON {self.NODE_DB_NAME} (change_seq)")
+
+            tombstone_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.NODE_TOMBSTONE_DB_SCHEMA)
+            db_conn.execute(f"CREATE TABLE {self.NODE_TOMBSTONE_DB_NAME} ({tombstone_schema})")
+            db_conn.execute(f"CREATE INDEX {self.NODE_TOMBSTONE_DB_NAME}_change_seq "
+                            f"ON {self.NODE_TOMBSTONE_DB_NAME} (change_seq)")
 
             state_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.STATE_DB_SCHEMA)
             db_conn.execute(f"CREATE TABLE {self.STATE_DB_NAME} ({state_schema})")
+            db_conn.execute(f"CREATE INDEX {self.STATE_DB_NAME}_updated ON {self.STATE_DB_NAME} (updated)")
 
             teacher_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.TEACHER_DB_SCHEMA)
             db_conn.execute(f"CREATE TABLE {self.TEACHER_DB_NAME} ({teacher_schema})")
 
+            cursor_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.INDEXER_CURSOR_DB_SCHEMA)
+            db_conn.execute(f"CREATE TABLE {self.INDEXER_CURSOR_DB_NAME} ({cursor_schema})")
+
+            staker_state_schema = ", ".join(f"{schema[0]} {schema[1]}" for schema in self.STAKER_STATE_DB_SCHEMA)
+            db_conn.execute(f"CREATE TABLE {self.STAKER_STATE_DB_NAME} ({staker_state_schema})")
+
+            db_conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
     def _connect(self) -> sqlite3.Connection:
-        return sqlite3.connect(self.db_filepath)
+        db_conn = sqlite3.connect(self.db_filepath, check_same_thread=False)
+        db_conn.execute(f"PRAGMA journal_mode={self.JOURNAL_MODE}")
+        db_conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS}")
+        return db_conn
 
-    def store_node_status(self, node_status: RemoteUrsulaStatus):
+    def _remove_db_files(self):
+        # WAL mode keeps its write-ahead log and shared memory index next to the db file
+        for filepath in (self.db_filepath, f'{self.db_filepath}-wal', f'{self.db_filepath}-shm'):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    @staticmethod
+    def _node_status_row(node_status: RemoteUrsulaStatus) -> tuple:
 
         # TODO: these DB fields should really be nullable
         if node_status.recorded_fleet_state:
@@ -86,36 +256,227 @@ class CrawlerStorage:
                   node_status.timestamp.iso8601(),
                   last_learned_from,
                   fleet_state_icon)
+        return db_row
 
-        with self._connect() as db_conn:
-            db_conn.execute(f'REPLACE INTO {self.NODE_DB_NAME} VALUES(?,?,?,?,?,?)', db_row)
+    @staticmethod
+    def _fleet_state_row(state: ArchivedFleetState) -> tuple:
+        db_row = (str(state.nickname),
+                  state.nickname.characters[0].symbol,
+                  state.nickname.characters[0].color_hex,
+                  state.nickname.characters[0].color_name,
+                  # epoch for indexed sorting; we lose sub-second precision, but meh!
+                  int(state.timestamp.epoch))
+        return db_row
+
+    def store_node_status(self, node_status: RemoteUrsulaStatus):
+        db_row = self._node_status_row(node_status)
+        self._write(node_rows={node_status.staker_address: db_row})
 
     @validate_checksum_address
     def remove_node_status(self, checksum_address: str):
-        with self._connect() as db_conn:
-            db_conn.execute(f"DELETE FROM {self.NODE_DB_NAME} WHERE staker_address='{checksum_address}'")
+        self._write(node_rows={checksum_address: None})
 
     def store_fleet_state(self, state: ArchivedFleetState):
-        # TODO Limit the size of this table - no reason to store really old state values
-
-        db_row = (str(state.nickname),
-                  state.nickname.characters[0].symbol,
-                  state.nickname.characters[0].color_hex,
-                  state.nickname.characters[0].color_name,
-                  # convert to rfc3339 for ease of sqlite3 sorting; we lose millisecond precision, but meh!
-                  state.timestamp.rfc3339())
-        sql = f'REPLACE INTO {self.STATE_DB_NAME} VALUES(?,?,?,?,?)'
-        with self._connect() as db_conn:
-            db_conn.execute(sql, db_row)
+        db_row = self._fleet_state_row(state)
+        self._write(state_rows={db_row[0]: db_row})
+
+    def store_fleet_state_diff(self,
+                               state: ArchivedFleetState,
+                               updated_node_statuses: Iterable[RemoteUrsulaStatus],
+                               removed_checksum_addresses: Iterable[str]):
+        """Applies a whole fleet state change (new state, updated and removed nodes) as a single transaction."""
+        state_row = self._fleet_state_row(state)
+        node_rows = OrderedDict((node_status.staker_address, self._node_status_row(node_status))
+                                for node_status in updated_node_statuses)
+        for checksum_address in removed_checksum_addresses:
+            node_rows[checksum_address] = None
+        self._write(node_rows=node_rows, state_rows={state_row[0]: state_row})
 
     def store_current_teacher(self, teacher_checksum: str):
-        sql = f'REPLACE INTO {self.TEACHER_DB_NAME} VALUES (?,?)'
-        with self._connect() as db_conn:
-            db_conn.execute(sql, (self.TEACHER_ID, teacher_checksum))
+        self._write(teacher_row=(self.TEACHER_ID, teacher_checksum))
+
+    def get_indexer_cursor(self, name: str) -> Optional[int]:
+        """The last block fully indexed by the named indexer, None if it hasn't indexed anything yet"""
+        with self._lock:
+            row = self._db_conn.execute(self.INDEXER_CURSOR_SELECT_SQL, (name,)).fetchone()
+        return row[0] if row else None
+
+    def store_staker_updates(self, indexer_name: str, block_number: int, staker_updates: Dict[str, dict]):
+        """
+        Merges per-staker updates into the staker state and moves the indexer cursor to `block_number`,
+        in a single transaction. Updates may have 'worker', 'last_committed_period', 'first_block' and
+        'updated_block' keys; missing keys leave the stored values unchanged.
+        """
+        with self._lock, self._db_conn as db_conn:
+            rows = list()
+            for staker_address, update in staker_updates.items():
+                existing = db_conn.execute(self.STAKER_STATE_SELECT_SQL, (staker_address,)).fetchone()
+                _, worker, last_committed_period, first_block, updated_block = existing or (None,) * 5
+                if 'worker' in update:
+                    worker = update['worker']
+                if update.get('last_committed_period') is not None:
+                    last_committed_period = max(last_committed_period or 0, update['last_committed_period'])
+                first_block = min((b for b in (first_block, update.get('first_block')) if b is not None), default=None)
+                updated_block = max((b for b in (updated_block, update.get('updated_block')) if b is not None),
+                                    default=None)
+                rows.append((staker_address, worker, last_committed_period, first_block, updated_block))
+            db_conn.executemany(self.STAKER_STATE_REPLACE_SQL, rows)
+            db_conn.execute(self.INDEXER_CURSOR_REPLACE_SQL, (indexer_name, block_number))
+
+        STORAGE_COMMITS.inc()
+        STORAGE_ROWS_WRITTEN.inc(len(rows), table=self.STAKER_STATE_DB_NAME)
+        STORAGE_ROWS_WRITTEN.inc(table=self.INDEXER_CURSOR_DB_NAME)
+
+    def _write(self, node_rows: Dict = None, state_rows: Dict = None, teacher_row: tuple = None):
+        if not self.write_behind:
+            self._commit(node_rows=node_rows or {}, state_rows=state_rows or {}, teacher_row=teacher_row)
+            return
+
+        with self._pending:
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+
+            for pending, rows in ((self._pending_nodes, node_rows or {}), (self._pending_states, state_rows or {})):
+                for key, db_row in rows.items():
+                    if key in pending:
+                        self.coalesced_rows += 1
+                    pending[key] = db_row
+                    self.queued_rows += 1
+
+            if teacher_row:
+                if self._pending_teacher:
+                    self.coalesced_rows += 1
+                self._pending_teacher = teacher_row
+                self.queued_rows += 1
+
+            if self.pending_rows >= self.flush_size:
+                self._pending.notify()
+
+    def _commit(self, node_rows: Dict, state_rows: Dict, teacher_row: Optional[tuple]) -> int:
+        with self._lock, self._db_conn as db_conn:
+            replaced_node_rows, tombstone_rows = list(), list()
+            for checksum_address, db_row in node_rows.items():
+                self._change_seq += 1
+                if db_row is None:
+                    tombstone_rows.append((checksum_address, self._change_seq))
+                else:
+                    replaced_node_rows.append(db_row + (self._change_seq,))
+
+            db_conn.executemany(self.STATE_REPLACE_SQL, state_rows.values())
+            db_conn.executemany(self.NODE_REPLACE_SQL, replaced_node_rows)
+            db_conn.executemany(self.NODE_TOMBSTONE_DELETE_SQL, ((db_row[0],) for db_row in replaced_node_rows))
+            db_conn.executemany(self.NODE_DELETE_SQL, ((tombstone_row[0],) for tombstone_row in tombstone_rows))
+            db_conn.executemany(self.NODE_TOMBSTONE_REPLACE_SQL, tombstone_rows)
+            if teacher_row:
+                db_conn.execute(self.TEACHER_REPLACE_SQL, teacher_row)
+            self._state_writes_since_compaction += len(state_rows)
+
+        STORAGE_COMMITS.inc()
+        for table, rows in ((self.NODE_DB_NAME, len(replaced_node_rows)),
+                            (self.NODE_TOMBSTONE_DB_NAME, len(tombstone_rows)),
+                            (self.STATE_DB_NAME, len(state_rows)),
+                            (self.TEACHER_DB_NAME, 1 if teacher_row else 0)):
+            STORAGE_ROWS_WRITTEN.inc(rows, table=table)
+
+        if self._state_writes_since_compaction >= self.STATE_COMPACTION_INTERVAL:
+            self.compact_fleet_states()
+
+        return len(node_rows) + len(state_rows) + (1 if teacher_row else 0)
+
+    def compact_fleet_states(self, now: int = None):
+        """Enforces the fleet state retention policy (max rows and/or max age)."""
+        with self._lock, self._db_conn as db_conn:
+            if self.state_max_age is not None:
+                now = now if now is not None else int(time.time())
+                db_conn.execute(self.STATE_DELETE_OLDER_THAN_SQL, (now - self.state_max_age,))
+            if self.state_max_rows is not None:
+                db_conn.execute(self.STATE_DELETE_BEYOND_ROWS_SQL, (self.state_max_rows - 1,))
+            self._state_writes_since_compaction = 0
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._pending_nodes) + len(self._pending_states) + (1 if self._pending_teacher else 0)
+
+    @property
+    def write_behind_stats(self) -> Dict[str, int]:
+        return {'queued': self.queued_rows,
+                'coalesced': self.coalesced_rows,
+                'flushed': self.flushed_rows,
+                'pending': self.pending_rows}
+
+    def flush(self):
+        """Writes all pending write-behind rows to the db in a single transaction."""
+        # held across taking and committing a batch, so concurrent flushes (eg. the writer thread's and close()'s)
+        # commit in order and an older batch never overwrites a newer one; writers only wait on `_pending`
+        with self._flush_lock:
+            with self._pending:
+                node_rows, self._pending_nodes = self._pending_nodes, OrderedDict()
+                state_rows, self._pending_states = self._pending_states, OrderedDict()
+                teacher_row, self._pending_teacher = self._pending_teacher, None
+                self._pending_since = None
+
+            if not (node_rows or state_rows or teacher_row):
+                return
+            try:
+                flushed = self._commit(node_rows=node_rows, state_rows=state_rows, teacher_row=teacher_row)
+            except Exception:
+                # put the batch back under anything queued since, so it is retried rather than lost
+                with self._pending:
+                    node_rows.update(self._pending_nodes)
+                    state_rows.update(self._pending_states)
+                    self._pending_nodes, self._pending_states = node_rows, state_rows
+                    self._pending_teacher = self._pending_teacher or teacher_row
+                    if self._pending_since is None:
+                        self._pending_since = time.monotonic()
+                raise
+            with self._pending:
+                self.flushed_rows += flushed
+
+    def _write_behind_loop(self):
+        while True:
+            with self._pending:
+                while not self._closed:
+                    if self.pending_rows >= self.flush_size:
+                        break
+                    if self._pending_since is None:
+                        self._pending.wait()  # nothing pending
+                        continue
+                    remaining = self._pending_since + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending.wait(timeout=remaining)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                if closed:
+                    return  # close() flushes once more, and raises
+                self.log.warn(f"Unable to write {self.pending_rows} pending rows to {self.db_filepath} ({e}); "
+                              f"retrying in {self.flush_interval}s")
+                with self._pending:
+                    if not self._closed:
+                        self._pending.wait(timeout=self.flush_interval)  # back off, unless closing
+                continue
+            if closed:
+                return
+
+    def close(self):
+        """Flushes pending write-behind rows and closes the db connection."""
+        with self._pending:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending.notify()
+        if self._writer:
+            self._writer.join()
+        self.flush()
+        with self._lock:
+            self._db_conn.close()
 
     def __del__(self):
-        if os.path.exists(self.db_filepath):
-            os.remove(self.db_filepath)
+        self.close()
+        if not self.persistent:
+            self._remove_db_files()
 
 
 def hooked_tracker_class(crawler_storage: CrawlerStorage):
@@ -128,13 +489,11 @@ def hooked_tracker_class(crawler_storage: CrawlerStorage):
             state_diff = super().record_fleet_state(*args, **kwargs)
             if not state_diff.empty():
                 new_state = self._archived_states[-1]
-                self.__crawler_storage.store_fleet_state(new_state)
-
-                for checksum_address in state_diff.nodes_updated:
-                    self.__crawler_storage.store_node_status(self.status_info(checksum_address))
-
-                for checksum_address in state_diff.nodes_removed:
-                    self.__crawler_storage.remove_node_status(checksum_address)
+                updated_node_statuses = [self.status_info(checksum_address)
+                                         for checksum_address in state_diff.nodes_updated]
+                self.__crawler_storage.store_fleet_state_diff(state=new_state,
+                                                              updated_node_statuses=updated_node_statuses,
+                                                              removed_checksum_addresses=state_diff.nodes_removed)
 
         def record_remote_fleet_state(self, checksum_address, *args, **kwargs):
             super().record_remote_fleet_state(checksum_address, *args, **kwargs)
@@ -154,12 +513,23 @@ class Crawler(Learner):
 
     LEARNING_TIMEOUT = 10
     DEFAULT_REFRESH_RATE = 60  # seconds
+    BLOCK_POLL_INTERVAL = 15  # seconds, about one block; collectors refreshed every block need rounds this often
     REFRESH_RATE_WINDOW = 0.25
 
     METRICS_ENDPOINT = 'stats'
     DEFAULT_CRAWLER_HTTP_PORT = 9555
+    DEFAULT_STATS_FILEPATH = os.path.join(DEFAULT_CONFIG_ROOT, 'monitor-stats.json')  # read by a separate dashboard
+    DEFAULT_MAPPED_STATS_FILEPATH = os.path.join(DEFAULT_CONFIG_ROOT, 'monitor-stats.bin')  # mapped by dashboards
 
     STAKER_PAGINATION_SIZE = 200
+    COLLECTOR_TIMEOUT = 120  # seconds; a collector taking longer reports its value from the previous round
+
+    # Node status categories, indexes into STATUS_BUCKETS
+    CONFIRMED, PENDING, IDLE, UNCONFIRMED = range(4)
+    STATUS_BUCKETS = (('green', 'Confirmed'),
+                      ('#e0b32d', 'Pending'),
+                      ('#525ae3', 'Idle'),
+                      ('red', 'Unconfirmed'))
 
     def __init__(self,
                  crawler_http_port: int = DEFAULT_CRAWLER_HTTP_PORT,
@@ -167,6 +537,18 @@ class Crawler(Learner):
                  db_filepath: str = CrawlerStorage.DEFAULT_DB_FILEPATH,
                  refresh_rate=DEFAULT_REFRESH_RATE,
                  restart_on_error=True,
+                 storage_write_behind: bool = False,
+                 persistent_storage: bool = False,
+                 rpc_batch_size: int = StakingEscrowBatchReader.DEFAULT_CHUNK_SIZE,
+                 collector_threads: int = RoundExecutor.DEFAULT_MAX_WORKERS,
+                 watch_staking_logs: bool = True,
+                 index_staking_events: bool = False,
+                 index_start_block: int = 0,
+                 index_confirmations: int = StakingEscrowIndexer.DEFAULT_CONFIRMATIONS,
+                 trace_rpc: bool = False,
+                 profile_dir: str = SamplingProfiler.DEFAULT_OUTPUT_DIR,
+                 stats_filepath: Optional[str] = None,
+                 mapped_stats_filepath: Optional[str] = None,
                  *args, **kwargs):
 
         # Settings
@@ -179,7 +561,7 @@ class Crawler(Learner):
         self._restart_on_error = restart_on_error
 
         # Tracking
-        self.__storage = CrawlerStorage(db_filepath)
+        self.__storage = CrawlerStorage(db_filepath, write_behind=storage_write_behind, persistent=persistent_storage)
         self.tracker_class = hooked_tracker_class(self.__storage) # Used by Learner.__init__
 
         node_storage = ForgetfulNodeStorage(federated_only=False)
@@ -191,17 +573,68 @@ class Crawler(Learner):
 
         self.log = Logger(self.__class__.__name__)
         self.log.info(f"Storing status metadata in DB: {self.__storage.db_filepath}")
+        if self.__storage.restored:
+            self.log.info("Restored existing DB; previously known nodes are marked as stale until seen again")
 
         # In-memory Metrics
-        self._stats = {'status': 'initializing'}
+        if stats_filepath is None and persistent_storage:
+            stats_filepath = f'{db_filepath}-stats.json'  # kept with the db, for warm restarts
+        initial = None
+        if self.__storage.restored and stats_filepath:
+            initial = self._restore_stats(stats_filepath)  # served until the first round completes
+        if initial is None:
+            initial = StatsSnapshot(round=0,
+                                    block_number=None,
+                                    started=time.time(),
+                                    duration=0,
+                                    serialized=SerializedSnapshot({'status': 'initializing'}))
+        self._stats_history = SnapshotHistory(initial=initial)  # recent rounds; the latest is what /stats serves
         self._crawler_client = None
+        self._known_nodes_metadata = dict()  # kept up to date with incremental changes from storage
+        self._known_nodes_seq = 0
+        self._known_stakers_info = dict()  # staker -> StakerInfo, as of the last time the staker was read
+        self._stale_stakers = None  # stakers to read again, None for all; gathered from each round's changes
+        self._stale_stakers_lock = threading.Lock()
 
         # Agency
         self.staking_agent = ContractAgency.get_agent(StakingEscrowAgent, registry=self.registry)
+        install_rpc_metrics(self.staking_agent.blockchain.client.w3)
+
+        # Optionally, every RPC call is attributed to the collector making it
+        self._rpc_tracer = None
+        batch_transport = JSONRPCBatchTransport.from_provider(self.staking_agent.blockchain.client.w3.provider)
+        if trace_rpc:
+            self._rpc_tracer = RPCTracer()
+            self._rpc_tracer.install(self.staking_agent.blockchain.client.w3)
+            self._rpc_tracer.register_agents(self.staking_agent)
+            batch_transport = self._rpc_tracer.wrap_transport(batch_transport)
+
+        # Contract reads made during a collection round are pinned to the round's block and made at most once
+        self._read_cache = BlockReadCache()
+        self._agent_reads = BlockPinnedAgent(self.staking_agent, read_cache=self._read_cache)
+        self._locked_tokens_projection = LockedTokensProjection(staking_agent=self._agent_reads,
+                                                                pagination_size=self.STAKER_PAGINATION_SIZE)
+        self._staker_reader = StakingEscrowBatchReader(staking_agent=self._agent_reads,
+                                                       chunk_size=rpc_batch_size,
+                                                       transport=batch_transport,
+                                                       read_cache=self._read_cache)
+
+        # Optionally, staker workers and commitments are read from a local index of StakingEscrow events
+        self._staker_indexer = None
+        if index_staking_events:
+            self._staker_indexer = StakingEscrowIndexer(staking_agent=self.staking_agent,
+                                                        storage=self.__storage,
+                                                        start_block=index_start_block,  # the deployment block
+                                                        confirmations=index_confirmations)
 
         # Crawler Tasks
         self.__collection_round = 0
         self.__collecting_stats = False
+        self._profiler = SamplingProfiler(name='crawler', output_dir=profile_dir)  # idle until armed
+        self._round_executor = RoundExecutor(tasks=self._collector_tasks(), max_workers=collector_threads)
+        self._change_detector = ChangeDetector(staking_agent=self.staking_agent,
+                                               storage_version=lambda: self._crawler_client.data_version(),
+                                               watch_logs=watch_staking_logs)
 
         self._stats_collection_task = DelayedLoopingCall(f=self._collect_stats,
                                                          threaded=True,
@@ -210,6 +643,25 @@ class Crawler(Learner):
         # JSON Endpoint
         self._crawler_http_port = crawler_http_port
         self._flask = None
+        self._events = StatsEventResource()  # changes pushed to subscribers of /events
+        self._stats_filepath = stats_filepath  # optionally, also handed to other processes through a file
+        self._mapped_stats_filepath = mapped_stats_filepath  # and through a file they can memory map
+
+    def _restore_stats(self, stats_filepath: str) -> Optional[StatsSnapshot]:
+        """The stats last published before a restart, from the stats file; None if there are none"""
+        try:
+            snapshot = SnapshotFile(stats_filepath).current()
+        except (OSError, ValueError) as e:
+            self.log.warn(f"Unable to restore stats from {stats_filepath}: {e}")
+            return None
+        if snapshot is None or not isinstance(snapshot.data, dict):
+            return None
+        self.log.info(f"Restored stats of block #{snapshot.data.get('blocknumber')} from {stats_filepath}")
+        return StatsSnapshot(round=0,
+                             block_number=snapshot.data.get('blocknumber'),
+                             started=time.time(),
+                             duration=0,
+                             serialized=SerializedSnapshot(restored_stats(snapshot.data)))
 
     def learn_from_teacher_node(self, *args, **kwargs):
 
@@ -232,32 +684,50 @@ class Crawler(Learner):
 
     @property
     def stats(self) -> dict:
-        return self._stats
+        return self._stats_history.latest.data
 
     @collector(label="Projected Stake and Stakers")
     def _measure_future_locked_tokens(self, periods: int = 365):
-        period_range = range(1, periods + 1)
-        token_counter = dict()
-        for day in period_range:
-            tokens, stakers = self.staking_agent.get_all_active_stakers(periods=day,
-                                                                        pagination_size=self.STAKER_PAGINATION_SIZE)
-            token_counter[day] = (float(NU.from_nunits(tokens).to_tokens()), len(stakers))
-        return dict(token_counter)
+        return self._locked_tokens_projection.project(periods=periods)
 
     @collector(label="Top Stakes")
     def _measure_top_stakers(self) -> dict:
-        _, stakers = self.staking_agent.get_all_active_stakers(periods=1, pagination_size=self.STAKER_PAGINATION_SIZE)
+        _, stakers = self._agent_reads.get_all_active_stakers(periods=1, pagination_size=self.STAKER_PAGINATION_SIZE)
         data = dict(sorted(stakers.items(), key=lambda s: s[1], reverse=True))
         return data
 
+    def _get_indexed_staker_states(self) -> Optional[Dict[str, Dict]]:
+        """Staker states from the event index, or None until it has caught up with the round's block"""
+        if self._staker_indexer is None:
+            return None
+        indexed_block, pinned_block = self._staker_indexer.indexed_block, self._read_cache.pinned_block
+        if indexed_block is None or (pinned_block is not None and indexed_block < pinned_block):
+            return None  # eg. still backfilling; a partial index would leave stakers without workers
+        return self._staker_indexer.staker_states(self._crawler_client.get_staker_states())
+
+    def _partition_stakers_by_activity(self) -> tuple:
+        staker_states = self._get_indexed_staker_states()
+        if staker_states is None:
+            return self._agent_reads.partition_stakers_by_activity()
+
+        # same buckets as the agent's, from indexed commitments instead of a call per staker
+        current_period = self._agent_reads.get_current_period()
+        confirmed, pending, inactive = list(), list(), list()
+        for staker_address, staker_state in staker_states.items():
+            last_committed_period = staker_state['last_committed_period'] or 0
+            if last_committed_period == current_period + 1:
+                confirmed.append(staker_address)
+            elif last_committed_period == current_period:
+                pending.append(staker_address)
+            else:
+                inactive.append(staker_address)
+        return confirmed, pending, inactive
+
     @collector(label="Staker Confirmation Status")
     def _measure_staker_activity(self) -> dict:
-        confirmed, pending, inactive = self.staking_agent.partition_stakers_by_activity()
-        inactive_without_expired = []
-        for staker in inactive:
-            if self._is_staker_expired(staker_address=staker):
-                continue
-            inactive_without_expired.append(staker)
+        confirmed, pending, inactive = self._partition_stakers_by_activity()
+        expired = self._staker_reader.get_expired_stakers(inactive)
+        inactive_without_expired = [staker for staker in inactive if staker not in expired]
 
         stakers = dict()
         stakers['active'] = len(confirmed)
@@ -265,6 +735,10 @@ class Crawler(Learner):
         stakers['inactive'] = len(inactive_without_expired)
         return stakers
 
+    @collector(label="Global Network Locked Tokens")
+    def _measure_global_locked_tokens(self) -> int:
+        return self._agent_reads.get_global_locked_tokens()
+
     @collector(label="Date/Time of Next Period")
     def _measure_start_of_next_period(self) -> str:
         """Returns iso8601 datetime of next period"""
@@ -275,87 +749,211 @@ class Crawler(Learner):
 
         return next_period.iso8601()
 
+    def _apply_known_nodes_changes(self) -> None:
+        """Applies storage changes to the known nodes metadata since they were last applied"""
+        changes = self._crawler_client.get_known_nodes_changes(since_seq=self._known_nodes_seq)
+        for staker_address in changes.removed:
+            self._known_nodes_metadata.pop(staker_address, None)
+        for staker_address, node_info in changes.updated.items():
+            self._known_nodes_metadata[staker_address] = node_info
+        self._known_nodes_seq = changes.last_seq
+
+    def _refresh_known_nodes_metadata(self) -> OrderedDict:
+        """Applies storage changes since the last round, returns a per-round copy ordered by staker address"""
+        self._apply_known_nodes_changes()
+
+        # measurements annotate the node dicts
+        return OrderedDict((staker_address, dict(self._known_nodes_metadata[staker_address]))
+                           for staker_address in sorted(self._known_nodes_metadata))
+
+    def _get_stakers_info(self, staker_addresses: Iterable[str]) -> Dict[str, StakerInfo]:
+        staker_states = self._get_indexed_staker_states()
+        if staker_states is None:
+            return self._staker_reader.get_stakers_info(staker_addresses)  # batched reads for all nodes
+
+        # only locked tokens are read from the chain; workers and commitments come from the event index
+        stakers_info = self._staker_reader.get_stakers_info(staker_addresses, include_worker_info=False)
+        for staker_address, staker_info in stakers_info.items():
+            staker_state = staker_states.get(staker_address, dict())
+            stakers_info[staker_address] = staker_info._replace(
+                last_committed_period=staker_state.get('last_committed_period') or 0,
+                worker=staker_state.get('worker') or NULL_ADDRESS)
+        return stakers_info
+
+    def _mark_stale_stakers(self, changed: FrozenSet[str]) -> None:
+        """Notes which stakers' reads the round's changes outdated: those with StakingEscrow events, or all"""
+        if not changed & {STAKING, PERIOD}:
+            return
+        changed_stakers = self._change_detector.changed_stakers
+        with self._stale_stakers_lock:
+            if PERIOD in changed or changed_stakers is None:
+                self._stale_stakers = None
+            elif self._stale_stakers is not None:
+                self._stale_stakers |= changed_stakers
+
+    @collector(label="Known Node Stakers")
+    def _measure_known_stakers(self) -> Dict[str, int]:
+        """
+        Last committed period of the staker of each known node, ordered by staker address. Only stakers that
+        are new, or outdated by StakingEscrow events or a new period (see `_mark_stale_stakers`), are read.
+        """
+        self._apply_known_nodes_changes()
+        with self._stale_stakers_lock:
+            stale_stakers, self._stale_stakers = self._stale_stakers, frozenset()
+        staker_addresses = sorted(self._known_nodes_metadata)
+        unread = [staker_address for staker_address in staker_addresses
+                  if stale_stakers is None or staker_address in stale_stakers
+                  or staker_address not in self._known_stakers_info]
+        try:
+            stakers_info = self._get_stakers_info(unread) if unread else dict()
+        except Exception:
+            with self._stale_stakers_lock:  # read them next time
+                if stale_stakers is None or self._stale_stakers is None:
+                    self._stale_stakers = None
+                else:
+                    self._stale_stakers |= stale_stakers
+            raise
+        if stale_stakers is None:
+            self._known_stakers_info.clear()  # also forgets stakers no longer known
+        self._known_stakers_info.update(stakers_info)
+
+        known_stakers = OrderedDict()
+        for staker_address in staker_addresses:
+            staker_info = self._known_stakers_info.get(staker_address)
+            if staker_info is None:
+                continue
+
+            #
+            # Confirmation Status Scraping
+            #
+
+            # is staker expired
+            if staker_info.expired:
+                # stake already expired, remove node from DB and ignore
+                self.__storage.remove_node_status(checksum_address=staker_address)
+                continue
+            if staker_info.worker == NULL_ADDRESS:
+                continue  # TODO: Skip this DetachedWorker and do not display it
+            known_stakers[staker_address] = staker_info.last_committed_period
+        return known_stakers
+
     @collector(label="Known Nodes")
-    def measure_known_nodes(self):
+    def measure_known_nodes(self, known_stakers: Dict[str, int] = None):
+        """Statuses and uptimes of known nodes, from the staker reads of `_measure_known_stakers` (made if not given)"""
 
         #
         # Setup
         #
         current_period = datetime_to_period(datetime=maya.now(), seconds_per_period=self.economics.seconds_per_period)
-        buckets = {-1: ('green', 'Confirmed'),           # Confirmed Next Period
-                   0: ('#e0b32d', 'Pending'),            # Pending Confirmation of Next Period
-                   current_period: ('#525ae3', 'Idle'),  # Never confirmed
-                   NULL_ADDRESS: ('#d8d9da', 'Headless')  # Headless Staker (No Worker)
-                   }
-
-        shortest_uptime, newborn = float('inf'), None
-        longest_uptime, uptime_king = 0, None
-
         uptime_template = '{days}d:{hours}h:{minutes}m'
 
         #
         # Scrape
         #
 
-        payload = defaultdict(list)
-        known_nodes = self._crawler_client.get_known_nodes_metadata()
-        for staker_address in known_nodes:
-
-            #
-            # Confirmation Status Scraping
-            #
-
-            # is staker expired
-            if self._is_staker_expired(staker_address=staker_address):
-                # stake already expired, remove node from DB and ignore
-                self.__storage.remove_node_status(checksum_address=staker_address)
-                continue
-            last_confirmed_period = self.staking_agent.get_last_committed_period(staker_address)
-            missing_confirmations = current_period - last_confirmed_period
-            worker = self.staking_agent.get_worker_from_staker(staker_address)
-            if worker == NULL_ADDRESS:
-                # missing_confirmations = NULL_ADDRESS
-                continue  # TODO: Skip this DetachedWorker and do not display it
-            try:
-                color, status_message = buckets[missing_confirmations]
-            except KeyError:
-                color, status_message = 'red', f'Unconfirmed'
-            node_status = {'status': status_message, 'missed_confirmations': missing_confirmations, 'color': color}
+        if known_stakers is None:
+            known_stakers = self._measure_known_stakers()
+        known_nodes = self._refresh_known_nodes_metadata()
+        columns = self._crawler_client.get_known_nodes_columns()  # also ordered by staker address
+        rows = np.array([row for row, staker_address in enumerate(columns.checksum_address)
+                         if staker_address in known_stakers and staker_address in known_nodes], dtype=np.int64)
+        staker_addresses = [columns.checksum_address[row] for row in rows]
+        last_confirmed_periods = [known_stakers[staker_address] for staker_address in staker_addresses]
 
-            #
-            # Uptime Scraping
-            #
+        #
+        # Vectorized Status and Uptime
+        #
 
-            now = maya.now()
-            timestamp = maya.MayaDT.from_iso8601(known_nodes[staker_address]['timestamp'])
-            delta = now - timestamp
+        missing_confirmations = current_period - np.array(last_confirmed_periods, dtype=np.int64)
+        status_codes = np.select(condlist=[missing_confirmations == -1,             # Confirmed Next Period
+                                           missing_confirmations == 0,              # Pending Confirmation of Next Period
+                                           missing_confirmations == current_period],  # Never confirmed
+                                 choicelist=[self.CONFIRMED, self.PENDING, self.IDLE],
+                                 default=self.UNCONFIRMED)
 
-            node_qualifies_as_newborn = (delta.total_seconds() < shortest_uptime) and missing_confirmations == -1
-            node_qualifies_for_uptime_king = (delta.total_seconds() > longest_uptime) and missing_confirmations == -1
-            if node_qualifies_as_newborn:
-                shortest_uptime, newborn = delta.total_seconds(), staker_address
-            elif node_qualifies_for_uptime_king:
-                longest_uptime, uptime_king = delta.total_seconds(), staker_address
+        uptimes = maya.now().epoch - columns.timestamp[rows]
+        days, remainder = np.divmod(uptimes.astype(np.int64), 86400)
+        hours, remainder = np.divmod(remainder, 3600)
+        minutes = remainder // 60
 
-            hours = delta.seconds // 3600
-            minutes = delta.seconds % 3600 // 60
-            natural_uptime = uptime_template.format(days=delta.days, hours=hours, minutes=minutes)
+        # There are not always winners...
+        newborn, uptime_king = None, None
+        confirmed = np.flatnonzero(status_codes == self.CONFIRMED)
+        if len(confirmed):
+            newborn = confirmed[np.argmin(uptimes[confirmed])]
+            uptime_king = confirmed[np.argmax(uptimes[confirmed])]
+            if uptime_king == newborn:
+                uptime_king = None
 
-            #
-            # Aggregate
-            #
+        #
+        # Aggregate
+        #
 
-            known_nodes[staker_address]['status'] = node_status
-            known_nodes[staker_address]['uptime'] = natural_uptime
-            payload[status_message.lower()].append(known_nodes[staker_address])
+        payload = defaultdict(list)
+        for idx, staker_address in enumerate(staker_addresses):
+            color, status_message = self.STATUS_BUCKETS[status_codes[idx]]
+            node_info = known_nodes[staker_address]
+            node_info['status'] = {'status': status_message,
+                                   'missed_confirmations': int(missing_confirmations[idx]),
+                                   'color': color}
+            node_info['uptime'] = uptime_template.format(days=days[idx], hours=hours[idx], minutes=minutes[idx])
+            if idx == newborn:
+                node_info['newborn'] = True
+            elif idx == uptime_king:
+                node_info['uptime_king'] = True
+            payload[status_message.lower()].append(node_info)
 
-        # There are not always winners...
-        if newborn:
-            known_nodes[newborn]['newborn'] = True
-        if uptime_king:
-            known_nodes[uptime_king]['uptime_king'] = True
         return payload
 
+    def _measure_node_details(self, known_stakers: Optional[Dict[str, int]]):
+        if known_stakers is None:
+            # rather than making the reads again here; keeps the last node statuses
+            raise RuntimeError("Known node stakers have not been read yet")
+        return self.measure_known_nodes(known_stakers=known_stakers)
+
+    def _collector_tasks(self) -> tuple:
+        """
+        Collectors run by rounds, named after the stats they produce. Cheap ones are refreshed every block,
+        node statuses every refresh interval, and scans of all stakes once per period. Collectors that declare
+        inputs are also skipped until one of those inputs changes, so the contract reads behind node statuses
+        are only made again after StakingEscrow events, a new period or newly known nodes.
+        """
+        timeout = self.COLLECTOR_TIMEOUT
+        every_refresh = Every(seconds=self._refresh_rate)
+        staking = frozenset((STAKING, PERIOD))
+        storage = frozenset((STORAGE,))
+
+        index_tasks, index = tuple(), tuple()
+        if self._staker_indexer is not None:
+            # catches the index up to the round's block before the collectors that read it
+            index = ('staker_index',)
+            index_tasks = (CollectorTask('staker_index',
+                                         lambda: self._staker_indexer.update(to_block=self._read_cache.pinned_block),
+                                         timeout=timeout, schedule=EveryBlock(), inputs=staking),)
+
+        return index_tasks + (
+            CollectorTask('next_period', self._measure_start_of_next_period,
+                          timeout=timeout, schedule=EveryBlock(), inputs=frozenset((PERIOD,))),
+            CollectorTask('current_teacher', lambda: self._crawler_client.get_current_teacher_checksum(),
+                          timeout=timeout, schedule=EveryBlock(), inputs=storage),
+            CollectorTask('prev_states', lambda: self._crawler_client.get_previous_states_metadata(),
+                          timeout=timeout, schedule=EveryBlock(), inputs=storage),
+            CollectorTask('known_stakers', lambda **_: self._measure_known_stakers(),
+                          depends_on=index, timeout=timeout, schedule=every_refresh, inputs=staking | storage),
+            # uptimes and statuses move with the clock, so no inputs; only formats the staker reads
+            CollectorTask('node_details', self._measure_node_details,
+                          depends_on=('known_stakers',), timeout=timeout, schedule=every_refresh),
+            # reuses any expiry reads made for known nodes in this round
+            CollectorTask('activity', lambda **_: self._measure_staker_activity(),
+                          depends_on=('known_stakers', *index), timeout=timeout, schedule=every_refresh, inputs=staking),
+            CollectorTask('global_locked_tokens', self._measure_global_locked_tokens,
+                          timeout=timeout, schedule=EveryBlock(), inputs=staking),
+            CollectorTask('top_stakers', self._measure_top_stakers,
+                          timeout=timeout, schedule=EveryPeriod(), inputs=staking),
+            CollectorTask('future_locked_tokens', self._measure_future_locked_tokens,
+                          timeout=timeout, schedule=EveryPeriod(), inputs=staking),
+        )
+
     def _collect_stats(self, threaded: bool = True) -> None:
         # TODO: Handle faulty connection to provider (requests.exceptions.ReadTimeout)
         if threaded:
@@ -365,8 +963,16 @@ class Crawler(Learner):
             return reactor.callInThread(self._collect_stats, threaded=False)
         self.__collection_round += 1
         self.__collecting_stats = True
+        try:
+            with self._profiler.profile(label=f'round-{self.__collection_round}'):
+                self.__collect_round()
+        finally:
+            self.__collecting_stats = False
 
+    def __collect_round(self) -> None:
         start = maya.now()
+        round_start = time.perf_counter()
+        previous = self._stats_history.latest
         click.secho(f"Scraping Round #{self.__collection_round} ========================", color='blue')
         self.log.info("Collecting Statistics...")
 
@@ -380,44 +986,74 @@ class Crawler(Learner):
         block_time = block.timestamp # epoch
         current_period = datetime_to_period(datetime=maya.now(), seconds_per_period=self.economics.seconds_per_period)
         click.secho("✓ ... Current Period", color='blue')
-        next_period = self._measure_start_of_next_period()
-
-        # Nodes
-        teacher = self._crawler_client.get_current_teacher_checksum()
-        states = self._crawler_client.get_previous_states_metadata()
-
-        known_nodes = self.measure_known_nodes()
 
-        activity = self._measure_staker_activity()
+        # Collectors that are due and whose inputs changed run concurrently, all reading the chain as of this block
+        changed = self._change_detector.poll(block_number=block_number, period=current_period)
+        if STAKING in changed:
+            self._locked_tokens_projection.invalidate(self._change_detector.changed_stakers)
+        self._mark_stale_stakers(changed)
+        context = RoundContext(timestamp=time.time(), block_number=block_number, period=current_period, changed=changed)
+        with self._read_cache.pinned(block_number):
+            collected = self._round_executor.run(context=context, previous=previous.data)
 
-        # Stake
-        global_locked_tokens = self.staking_agent.get_global_locked_tokens()
-        click.secho("✓ ... Global Network Locked Tokens", color='blue')
+        ROUNDS.inc()
+        if collected.noop:
+            NOOP_ROUNDS.inc()
 
-        top_stakers = self._measure_top_stakers()
+        rpc_trace = None
+        if self._rpc_tracer is not None:
+            rpc_trace = self._rpc_tracer.end_round()
+            self.log.info(f"RPC calls of round #{self.__collection_round}:\n{format_summary(rpc_trace)}")
 
         #
         # Write
         #
 
-        self._stats = {'blocknumber': block_number,
-                       'blocktime': block_time,
-
-                       'current_period': current_period,
-                       'next_period': next_period,
-
-                       'prev_states': states,
-                       'current_teacher': teacher,
-                       'known_nodes': len(self.known_nodes),
-                       'activity': activity,
-                       'node_details': known_nodes,
-
-                       'global_locked_tokens': global_locked_tokens,
-                       'top_stakers': top_stakers,
-                       }
+        # published all at once; readers see either the previous round or this one
+        stats = {'round': self.__collection_round,
+                 'blocknumber': block_number,
+                 'blocktime': block_time,
+
+                 'current_period': current_period,
+                 'next_period': collected.values['next_period'],
+
+                 'prev_states': collected.values['prev_states'],
+                 'current_teacher': collected.values['current_teacher'],
+                 'known_nodes': len(self.known_nodes),
+                 'activity': collected.values['activity'],
+                 'node_details': collected.values['node_details'],
+
+                 'global_locked_tokens': collected.values['global_locked_tokens'],
+                 'top_stakers': collected.values['top_stakers'],
+                 'future_locked_tokens': collected.values['future_locked_tokens'],
+
+                 'collector_ages': collected.ages(now=time.time()),  # seconds since each was refreshed
+                 'rounds': {'rounds': int(ROUNDS.value()), 'noop_rounds': int(NOOP_ROUNDS.value())},
+                 }
+        if rpc_trace is not None:
+            stats['rpc_trace'] = rpc_trace  # top calls of this round
+        serialized = SerializedSnapshot(stats)  # serialized once per round rather than once per request
+        duration = time.perf_counter() - round_start
+        snapshot = StatsSnapshot(round=self.__collection_round,
+                                 block_number=block_number,
+                                 started=start.epoch,
+                                 duration=duration,
+                                 serialized=serialized)
+        self._stats_history.publish(snapshot)  # readers keep whichever snapshot they already have
+        self._events.publish(previous=previous.data, current=stats, etag=serialized.etag)
+        if self._stats_filepath:
+            try:
+                write_snapshot_file(filepath=self._stats_filepath, snapshot=serialized)
+            except OSError as e:
+                self.log.warn(f"Unable to write stats to {self._stats_filepath}: {e}")
+        if self._mapped_stats_filepath:
+            try:
+                write_mapped_snapshot_file(filepath=self._mapped_stats_filepath, snapshot=snapshot)
+            except OSError as e:
+                self.log.warn(f"Unable to write stats to {self._mapped_stats_filepath}: {e}")
+        ROUND_DURATION.observe(duration)
         done = maya.now()
         delta = done - start
-        self.__collecting_stats = False
         click.echo(f"Scraping round completed (duration {delta}).", color='yellow')  # TODO: Make optional, use emitter, or remove
         click.echo("==========================================")
         self.log.debug(f"Collected new metrics took {delta}.")
@@ -426,13 +1062,70 @@ class Crawler(Learner):
         """JSON Endpoint"""
         flask = Flask('nucypher-monitor')
         self._flask = flask
-        self._flask.config["JSONIFY_PRETTYPRINT_REGULAR"] = True
 
         @flask.route('/stats', methods=['GET'])
         def stats():
-            response = jsonify(self._stats)
+            """
+            The latest stats, or those of a recent ?round=N. Optionally only some fields (?fields=activity,top_stakers)
+            and node statuses (?status=unconfirmed).
+            """
+            if 'round' in request.args:
+                try:
+                    stats_snapshot = self._stats_history.get(int(request.args['round']))
+                except ValueError:
+                    return flask.response_class(response="Expected ?round=<round>", status=400, mimetype='text/plain')
+                if stats_snapshot is None:
+                    message = f"Round not kept; available rounds: {', '.join(map(str, self._stats_history.rounds))}"
+                    return flask.response_class(response=message, status=404, mimetype='text/plain')
+            else:
+                stats_snapshot = self._stats_history.latest
+            try:
+                snapshot = stats_snapshot.serialized.project(fields=parse_list(request.args.get('fields')),
+                                                             statuses=parse_list(request.args.get('status'), lower=True))
+            except KeyError as e:
+                return flask.response_class(response=e.args[0], status=400, mimetype='text/plain')
+            if request.args.get('pretty', '').lower() in ('1', 'true'):
+                return flask.response_class(response=serialize(snapshot.data, pretty=True),
+                                            status=200,
+                                            mimetype='application/json')
+            return snapshot.make_response(flask_server=flask, request=request)
+
+        @flask.route('/stats/delta', methods=['GET'])
+        def stats_delta():
+            """
+            What changed since round ?since=N; the full stats if that round is no longer kept, or if the optional
+            ?etag= shows it was another process' round N (round numbers restart with the crawler)
+            """
+            try:
+                since, etag = int(request.args['since']), request.args.get('etag')
+            except (KeyError, ValueError):
+                message = "Expected ?since=<round>[&etag=<ETag of the round>]"
+                return flask.response_class(response=message, status=400, mimetype='text/plain')
+            delta = self._stats_history.delta(since=since, etag=etag)
+            return delta.make_response(flask_server=flask, request=request)
+
+        @flask.route('/stats/nodes', methods=['GET'])
+        def stats_nodes():
+            """Node details as newline delimited JSON, streamed one node at a time; filtered with ?status="""
+            snapshot = self._stats_history.latest.serialized
+            statuses = parse_list(request.args.get('status'), lower=True)
+            etag = f"{snapshot.etag}-nodes-{'.'.join(statuses or ())}"
+            if request.if_none_match.contains_weak(etag):
+                response = flask.response_class(status=304)
+            else:
+                nodes = iter_ndjson(snapshot.data.get('node_details') or dict(), statuses=statuses)
+                response = flask.response_class(response=nodes, status=200, mimetype='application/x-ndjson')
+            response.set_etag(etag)
             return response
 
+        @flask.route('/metrics', methods=['GET'])
+        def metrics():
+            return flask.response_class(response=REGISTRY.render(), status=200, content_type=CONTENT_TYPE)
+
+        if self._rpc_tracer is not None:
+            add_trace_endpoint(flask_server=flask, tracer=self._rpc_tracer)
+        add_profile_endpoint(flask_server=flask, profiler=self._profiler, unit='rounds')
+
     def _handle_errors(self, *args, **kwargs):
         failure = args[0]
         cleaned_traceback = failure.getTraceback().replace('{', '').replace('}', '')
@@ -449,20 +1142,31 @@ class Crawler(Learner):
             self.log.info('Starting Crawler...')
             if self._crawler_client is None:
                 from monitor.db import CrawlerStorageClient
-                self._crawler_client = CrawlerStorageClient()
+                self._crawler_client = CrawlerStorageClient(db_filepath=self.__storage.db_filepath)
 
-            # start tasks
+            # rounds are frequent enough for per-block collectors; each collector keeps its own schedule
+            round_interval = min(self._refresh_rate, self.BLOCK_POLL_INTERVAL)
+
+            # start tasks; a warm restart already has nodes to report, so don't wait for the staggered start
             collection_deferred = self._stats_collection_task.start(
-                interval=random.randint(self._refresh_rate, int(self._refresh_rate * (1 + self.REFRESH_RATE_WINDOW))),
-                now=eager)
+                interval=random.randint(round_interval, int(round_interval * (1 + self.REFRESH_RATE_WINDOW))),
+                now=eager or self.__storage.restored)
 
             # hookup error callbacks
             collection_deferred.addErrback(self._handle_errors)
 
+            # flush pending storage writes on shutdown
+            reactor.addSystemEventTrigger('before', 'shutdown', self.__storage.close)
+
+            # `kill -USR2` profiles the next few rounds
+            self._profiler.install_signal_handler()
+
             # Start up
             self.start_learning_loop(now=False)
             self.make_flask_server()
-            hx_deployer = HendrixDeploy(action="start", options={"wsgi": self._flask, "http_port": self._crawler_http_port})
+            hx_deployer = HendrixDeploy(action="start", options={"wsgi": self._flask,
+                                                                 "http_port": self._crawler_http_port,
+                                                                 "resources": [self._events]})
             hx_deployer.run()  # <--- Blocking Call to Reactor
 
     def stop(self):
@@ -472,15 +1176,13 @@ class Crawler(Learner):
 
             # stop tasks
             self._stats_collection_task.stop()
+            self._round_executor.shutdown()
+
+            # write out anything still queued
+            self.__storage.flush()
 
 
     @property
     def is_running(self):
         """Returns True if currently running, False otherwise"""
         return self._stats_collection_task.running
-
-    def _is_staker_expired(self, staker_address: ChecksumAddress):
-        tokens_for_current_period = self.staking_agent.get_locked_tokens(staker_address=staker_address)
-        tokens_for_next_period = self.staking_agent.get_locked_tokens(staker_address=staker_address, periods=1)
-
-        return tokens_for_current_period == 0 and tokens_for_next_period == 0
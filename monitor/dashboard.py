@@ -1,4 +1,5 @@
 import json
+from typing import Optional
 
 from dash import Dash
 from dash import html
@@ -19,6 +20,11 @@ from web3 import Web3
 
 from monitor import layout, settings
 from monitor.components import make_contract_row
+from monitor.db import MappedStatsReader
+from monitor.metrics import CONTENT_TYPE, REGISTRY
+from monitor.profiling import add_profile_endpoint, profile_flask_requests, SamplingProfiler
+from monitor.snapshots import parse_list, serialize, SnapshotFile
+from monitor.tracing import add_trace_endpoint, attribute_flask_requests, RPCTracer
 from monitor.supply import calculate_supply_information
 
 
@@ -34,7 +40,11 @@ class Dashboard:
                  registry,
                  flask_server: Flask,
                  route_url: str,
-                 network: str):
+                 network: str,
+                 trace_rpc: bool = False,
+                 profile_dir: str = SamplingProfiler.DEFAULT_OUTPUT_DIR,
+                 stats_filepath: Optional[str] = None,
+                 mapped_stats_filepath: Optional[str] = None):
 
         self.log = Logger(self.__class__.__name__)
 
@@ -49,10 +59,37 @@ class Dashboard:
         self.adjudicator_agent = ContractAgency.get_agent(AdjudicatorAgent, registry=self.registry)
         self.worklock_agent = ContractAgency.get_agent(WorkLockAgent, registry=self.registry)
 
+        # Optionally, every RPC call is attributed to the dash callback making it
+        self.rpc_tracer = None
+        if trace_rpc:
+            self.rpc_tracer = RPCTracer()
+            self.rpc_tracer.install(self.staking_agent.blockchain.client.w3)
+            self.rpc_tracer.register_agents(self.token_agent,
+                                            self.staking_agent,
+                                            self.policy_agent,
+                                            self.adjudicator_agent,
+                                            self.worklock_agent)
+            attribute_flask_requests(flask_server=flask_server)
+            add_trace_endpoint(flask_server=flask_server, tracer=self.rpc_tracer)
+
+        # Profiling of the next N requests, idle until armed
+        self.profiler = SamplingProfiler(name='dashboard', output_dir=profile_dir)
+        profile_flask_requests(flask_server=flask_server, profiler=self.profiler)
+        add_profile_endpoint(flask_server=flask_server, profiler=self.profiler, unit='requests')
+
         # Add informational endpoints
         # Supply
         self.add_supply_endpoint(flask_server=flask_server)
 
+        # Metrics
+        self.add_metrics_endpoint(flask_server=flask_server)
+
+        # Crawler stats, as written by a separate crawler process
+        if stats_filepath:
+            self.add_stats_endpoint(flask_server=flask_server, stats_filepath=stats_filepath)
+        if mapped_stats_filepath:
+            self.add_stats_nodes_endpoint(flask_server=flask_server, mapped_stats_filepath=mapped_stats_filepath)
+
         # Dash
         self.dash_app = self.make_dash_app(flask_server=flask_server, route_url=route_url)
 
@@ -106,6 +143,38 @@ class Dashboard:
                     )
             return response
 
+    def add_stats_endpoint(self, flask_server: Flask, stats_filepath: str):
+        stats_file = SnapshotFile(filepath=stats_filepath)
+
+        @flask_server.route('/stats', methods=["GET"])
+        def stats():
+            snapshot = stats_file.current()
+            if snapshot is None:
+                return flask_server.response_class(response="Crawler stats not available yet",
+                                                   status=503,
+                                                   mimetype='text/plain')
+            return snapshot.make_response(flask_server=flask_server, request=request)
+
+    def add_stats_nodes_endpoint(self, flask_server: Flask, mapped_stats_filepath: str):
+        stats_reader = MappedStatsReader(filepath=mapped_stats_filepath)
+
+        @flask_server.route('/stats/nodes', methods=["GET"])
+        def stats_nodes():
+            mapped = stats_reader.current()
+            if mapped is None:
+                return flask_server.response_class(response="Crawler stats not available yet",
+                                                   status=503,
+                                                   mimetype='text/plain')
+            statuses = parse_list(request.args.get('status'), lower=True)
+            nodes = (serialize(node) + b'\n' for node in mapped.iter_nodes(statuses=statuses))
+            return flask_server.response_class(response=nodes, status=200, mimetype='application/x-ndjson')
+
+    def add_metrics_endpoint(self, flask_server: Flask):
+
+        @flask_server.route('/metrics', methods=["GET"])
+        def metrics():
+            return flask_server.response_class(response=REGISTRY.render(), status=200, content_type=CONTENT_TYPE)
+
     def make_dash_app(self, flask_server: Flask, route_url: str, debug: bool = False):
         dash_app = Dash(name=__name__,
                         server=flask_server,
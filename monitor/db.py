@@ -1,14 +1,153 @@
+import json
+import mmap
 import os
 import sqlite3
+import sys
+import threading
+import time
 from collections import OrderedDict
-from typing import Dict, List
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.request import pathname2url
 
+import numpy as np
 from maya import MayaDT
 from monitor.crawler import CrawlerStorage
+from monitor.snapshots import (
+    MAPPED_FORMAT_VERSION,
+    MAPPED_HEADER,
+    MAPPED_MAGIC,
+    MAPPED_NODE_RECORD,
+    MAPPED_STRING_FIELDS,
+    NEWBORN,
+    STALE,
+    UPTIME_KING
+)
 from monitor.utils import collector
 from nucypher.config.constants import DEFAULT_CONFIG_ROOT
 
 
+class NodeChanges(NamedTuple):
+    updated: Dict  # inserted or updated nodes: {staker_address -> {column_name -> column_value}}, in change order
+    removed: List[str]  # staker addresses
+    last_seq: int  # pass as `since_seq` to get the next changes
+
+
+class KnownNodesColumns(NamedTuple):
+    """Struct-of-arrays view of the node table, ordered by staker address; arrays are read-only."""
+    staker_address: np.ndarray  # uint8 (n, 20) raw address bytes
+    checksum_address: Tuple[str, ...]  # interned
+    rest_url: Tuple[str, ...]  # interned
+    nickname: Tuple[str, ...]  # interned
+    timestamp: np.ndarray  # float64 epoch
+    last_seen: np.ndarray  # float64 epoch; nan when never learned from
+    fleet_state_icon: np.ndarray  # int categorical code, indexes `fleet_state_icons`
+    fleet_state_icons: Tuple[str, ...]
+    stale: np.ndarray  # bool
+
+    def __len__(self):
+        return len(self.checksum_address)
+
+    def index(self, checksum_address: str) -> int:
+        return self.checksum_address.index(checksum_address)
+
+
+class ReadOnlyConnectionPool:
+    """
+    Read-only sqlite connections, one per thread (dash and twisted thread pools), reused across calls.
+    The number of pooled connections is capped and idle connections are evicted.
+    """
+
+    DEFAULT_MAX_CONNECTIONS = 16
+    DEFAULT_IDLE_TIMEOUT = 300  # seconds
+
+    class _PooledConnection:
+        def __init__(self, connection: sqlite3.Connection):
+            self.connection = connection
+            self.last_used = time.monotonic()
+            self.in_use = False
+            self.discard = False
+
+    def __init__(self,
+                 db_filepath: str,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.db_filepath = db_filepath
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._connections = dict()  # thread ident -> pooled connection
+
+    def connect(self) -> sqlite3.Connection:
+        uri = f"file:{pathname2url(self.db_filepath)}?mode=ro"
+        # only ever used by one thread at a time, but not necessarily the one that opened it
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._evict(idle_before=time.monotonic() - self.idle_timeout)
+            pooled = self._connections.get(thread_id)
+            if pooled is None:
+                if len(self._connections) >= self.max_connections:
+                    self._evict(count=1)  # least recently used idle connection
+                if len(self._connections) < self.max_connections:
+                    pooled = self._PooledConnection(connection=self.connect())
+                    self._connections[thread_id] = pooled
+            if pooled is not None:
+                pooled.in_use = True
+
+        if pooled is None:
+            # all pooled connections are busy in other threads
+            connection = self.connect()
+            try:
+                yield connection
+            finally:
+                connection.close()
+            return
+
+        try:
+            yield pooled.connection
+        finally:
+            if pooled.connection.in_transaction:
+                pooled.connection.rollback()  # never hold a read snapshot between calls
+            with self._lock:
+                pooled.in_use = False
+                pooled.last_used = time.monotonic()
+                if pooled.discard:
+                    self._close(thread_id)
+
+    def _evict(self, idle_before: float = None, count: int = None):
+        """Closes idle connections, least recently used first; caller holds the lock"""
+        idle = sorted((pooled.last_used, thread_id) for thread_id, pooled in self._connections.items()
+                      if not pooled.in_use)
+        if idle_before is not None:
+            idle = [(last_used, thread_id) for last_used, thread_id in idle if last_used < idle_before]
+        if count is not None:
+            idle = idle[:count]
+        for _, thread_id in idle:
+            self._close(thread_id)
+
+    def _close(self, thread_id: int):
+        pooled = self._connections.pop(thread_id)
+        pooled.connection.close()
+
+    def clear(self):
+        """Closes all connections; ones currently in use are closed once released."""
+        with self._lock:
+            for thread_id, pooled in list(self._connections.items()):
+                if pooled.in_use:
+                    pooled.discard = True
+                else:
+                    self._close(thread_id)
+
+    def __len__(self):
+        return len(self._connections)
+
+
 class CrawlerStorageClient:
 
     DB_FILE_NAME = CrawlerStorage.DB_FILE_NAME
@@ -16,62 +155,272 @@ class CrawlerStorageClient:
 
     def __init__(self, db_filepath: str = DEFAULT_DB_FILEPATH):
         self._db_filepath = db_filepath
+        self._pool = ReadOnlyConnectionPool(db_filepath=db_filepath)
 
-    def get_known_nodes_metadata(self) -> Dict:
-        # dash threading means that connection needs to be established in same thread as use
-        db_conn = sqlite3.connect(self._db_filepath)
+        # Materialised results are reused until another connection commits to the db
+        self._cache_lock = threading.Lock()
+        self._cache = dict()
+        self._version_conn = None
+        self._version_inode = None
+
+    def _data_version(self) -> Tuple[Optional[int], int]:
+        """Returns a token that changes whenever another connection commits to the db; caller holds the cache lock"""
         try:
+            inode = os.stat(self._db_filepath).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        # the crawler recreates the db file on (non-persistent) startup
+        if self._version_conn is None or inode != self._version_inode:
+            if self._version_conn is not None:
+                self._version_conn.close()
+            self._version_conn = self._pool.connect()
+            self._version_inode = inode
+            self._cache.clear()
+            self._pool.clear()
+
+        data_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return inode, data_version
+
+    def data_version(self) -> Hashable:
+        """Returns a token that changes whenever the crawler commits to the db"""
+        with self._cache_lock:
+            return self._data_version()
+
+    def _cached_read(self, key: Hashable, read: Callable):
+        with self._cache_lock:
+            data_version = self._data_version()
+            cached = self._cache.get(key)
+            if cached and cached[0] == data_version:
+                return cached[1]
+
+        # a write landing after the version check only makes the cached entry look older than it is
+        result = read()
+        with self._cache_lock:
+            self._cache[key] = (data_version, result)
+        return result
+
+    def get_known_nodes_metadata(self) -> Dict:
+        known_nodes = self._cached_read('known_nodes', self._read_known_nodes_metadata)
+        # callers annotate the node dicts
+        return OrderedDict((staker_address, dict(node_info)) for staker_address, node_info in known_nodes.items())
+
+    def _read_known_nodes_metadata(self) -> Dict:
+        with self._pool.connection() as db_conn:
             result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME} ORDER BY staker_address")
 
             # TODO use `pandas` package instead to automatically get dict?
             known_nodes = OrderedDict()
             column_names = [description[0] for description in result.description]
             for row in result:
-                node_info = dict()
                 staker_address = row[0]
-                for idx, value in enumerate(row):
-                    node_info[column_names[idx]] = row[idx]
-                known_nodes[staker_address] = node_info
+                known_nodes[staker_address] = dict(zip(column_names, row))
 
             return known_nodes
-        finally:
-            db_conn.close()
+
+    def get_known_nodes_changes(self, since_seq: int = 0) -> NodeChanges:
+        """Returns nodes inserted, updated or removed after the `since_seq` change sequence number."""
+        with self._pool.connection() as db_conn:
+            # single read transaction for a consistent view of both tables
+            db_conn.execute("BEGIN")
+            result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME} "
+                                     f"WHERE change_seq > ? ORDER BY change_seq", (since_seq,))
+            column_names = [description[0] for description in result.description]
+            updated = OrderedDict()
+            last_seq = since_seq
+            for row in result:
+                node_info = dict(zip(column_names, row))
+                updated[node_info['staker_address']] = node_info
+                last_seq = max(last_seq, node_info['change_seq'])
+
+            result = db_conn.execute(f"SELECT staker_address, change_seq FROM {CrawlerStorage.NODE_TOMBSTONE_DB_NAME} "
+                                     f"WHERE change_seq > ? ORDER BY change_seq", (since_seq,))
+            removed = list()
+            for staker_address, change_seq in result:
+                removed.append(staker_address)
+                last_seq = max(last_seq, change_seq)
+            db_conn.execute("COMMIT")
+
+            return NodeChanges(updated=updated, removed=removed, last_seq=last_seq)
+
+    def get_known_nodes_columns(self) -> KnownNodesColumns:
+        """Columnar alternative to `get_known_nodes_metadata`, for node statuses, uptimes and charts"""
+        return self._cached_read('known_nodes_columns', self._read_known_nodes_columns)
+
+    def _read_known_nodes_columns(self) -> KnownNodesColumns:
+        with self._pool.connection() as db_conn:
+            # iso8601 -> epoch conversion is done by sqlite; julianday() is NULL for unparseable values ('?')
+            rows = db_conn.execute(f"SELECT staker_address, rest_url, nickname, "
+                                   f"(julianday(timestamp) - 2440587.5) * 86400.0, "
+                                   f"(julianday(last_seen) - 2440587.5) * 86400.0, "
+                                   f"fleet_state_icon, stale "
+                                   f"FROM {CrawlerStorage.NODE_DB_NAME} ORDER BY staker_address").fetchall()
+
+        checksum_addresses, rest_urls, nicknames, timestamps, last_seen, icons, stale = zip(*rows) if rows else [()] * 7
+        address_bytes = b''.join(bytes.fromhex(checksum_address[2:]) for checksum_address in checksum_addresses)
+        fleet_state_icons, fleet_state_icon_codes = np.unique(np.array(icons, dtype=str), return_inverse=True)
+
+        columns = KnownNodesColumns(
+            staker_address=np.frombuffer(address_bytes, dtype=np.uint8).reshape(-1, 20),
+            checksum_address=tuple(sys.intern(value) for value in checksum_addresses),
+            rest_url=tuple(sys.intern(value) for value in rest_urls),
+            nickname=tuple(sys.intern(value) for value in nicknames),
+            timestamp=np.array(timestamps, dtype=np.float64),
+            last_seen=np.array(last_seen, dtype=np.float64),  # None -> nan
+            fleet_state_icon=fleet_state_icon_codes.reshape(-1),
+            fleet_state_icons=tuple(str(icon) for icon in fleet_state_icons),
+            stale=np.array(stale, dtype=bool))
+
+        # shared between threads through the read cache
+        for column in (columns.timestamp, columns.last_seen, columns.fleet_state_icon, columns.stale):
+            column.flags.writeable = False
+        return columns
 
     @collector(label="Previous Fleet States")
     def get_previous_states_metadata(self, limit: int = 20) -> List[Dict]:
-        # dash threading means that connection needs to be established in same thread as use
-        db_conn = sqlite3.connect(self._db_filepath)
+        states_dict_list = self._cached_read(('previous_states', limit),
+                                             lambda: self._read_previous_states_metadata(limit=limit))
+        return [dict(state_info) for state_info in states_dict_list]
+
+    def _read_previous_states_metadata(self, limit: int) -> List[Dict]:
         states_dict_list = []
-        try:
+        with self._pool.connection() as db_conn:
             result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.STATE_DB_NAME} "
-                                     f"ORDER BY datetime(updated) DESC LIMIT {limit}")
+                                     f"ORDER BY updated DESC LIMIT ?", (limit,))
 
             # TODO use `pandas` package instead to automatically get dict?
             column_names = [description[0] for description in result.description]
             for row in result:
-                state_info = dict()
-                for idx, value in enumerate(row):
-                    column_name = column_names[idx]
-                    if column_name == 'updated':
-                        # convert column from rfc3339 (for sorting) back to rfc2822
-                        # TODO does this matter for displaying? - it doesn't, but rfc2822 is easier on the eyes
-                        state_info[column_name] = MayaDT.from_rfc3339(row[idx]).rfc2822()
-                    else:
-                        state_info[column_name] = row[idx]
+                state_info = dict(zip(column_names, row))
+                # convert column from epoch (for sorting) to rfc2822
+                # TODO does this matter for displaying? - it doesn't, but rfc2822 is easier on the eyes
+                state_info['updated'] = MayaDT(epoch=state_info['updated']).rfc2822()
                 states_dict_list.append(state_info)
 
             return states_dict_list
-        finally:
-            db_conn.close()
 
     @collector(label="Latest Teacher")
     def get_current_teacher_checksum(self):
-        db_conn = sqlite3.connect(self._db_filepath)
-        try:
+        return self._cached_read('current_teacher', self._read_current_teacher_checksum)
+
+    def _read_current_teacher_checksum(self):
+        with self._pool.connection() as db_conn:
             result = db_conn.execute(f"SELECT checksum_address from {CrawlerStorage.TEACHER_DB_NAME} LIMIT 1")
-            for row in result:
+            for row in result.fetchall():
                 return row[0]
 
             return None
-        finally:
-            db_conn.close()
+
+    def get_staker_states(self) -> Dict[str, Dict]:
+        """Staker state materialized by the StakingEscrow event indexer: {staker_address -> {column_name -> value}}"""
+        staker_states = self._cached_read('staker_states', self._read_staker_states)
+        return {staker_address: dict(staker_state) for staker_address, staker_state in staker_states.items()}
+
+    def _read_staker_states(self) -> Dict[str, Dict]:
+        with self._pool.connection() as db_conn:
+            result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.STAKER_STATE_DB_NAME}")
+            column_names = [description[0] for description in result.description]
+            return {row[0]: dict(zip(column_names, row)) for row in result}
+
+    def close(self):
+        with self._cache_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
+            self._cache.clear()
+        self._pool.clear()
+
+
+class MappedStats:
+    """
+    A stats snapshot file written by the crawler (see `monitor.snapshots.encode_mapped_snapshot`), mapped read-only.
+    Node records are a numpy view of the mapping and strings are decoded on access, so processes mapping the same
+    file share one copy of it in the page cache. A replaced file stays mapped, and consistent, until dropped.
+    """
+
+    def __init__(self, mapping: mmap.mmap):
+        self._mapping = mapping
+        if len(mapping) < MAPPED_HEADER.size:
+            raise ValueError("Truncated stats snapshot file")
+        (magic, version, header_size,
+         self.round, block_number, self.started,
+         node_count, status_count,
+         status_table_offset, _, records_offset, _, self._strings_offset, _, self._stats_offset, self._stats_size,
+         *_) = MAPPED_HEADER.unpack_from(mapping)
+        if magic != MAPPED_MAGIC or version != MAPPED_FORMAT_VERSION:
+            raise ValueError(f"Not a version {MAPPED_FORMAT_VERSION} stats snapshot file")
+        self.block_number = block_number if block_number >= 0 else None
+
+        status_refs = np.frombuffer(mapping, dtype='<u4', count=status_count * 2, offset=status_table_offset)
+        self.statuses = tuple(self.string(status_ref) for status_ref in status_refs.reshape(-1, 2))
+        self.nodes = np.frombuffer(mapping, dtype=MAPPED_NODE_RECORD, count=node_count, offset=records_offset)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def string(self, ref) -> str:
+        offset, length = int(ref[0]), int(ref[1])
+        start = self._strings_offset + offset
+        return self._mapping[start:start + length].decode()
+
+    def stats(self) -> dict:
+        """The stats other than node details"""
+        return json.loads(self._mapping[self._stats_offset:self._stats_offset + self._stats_size])
+
+    def node(self, index: int) -> Dict:
+        """The node at `index` as in the crawler's stats"""
+        record = self.nodes[index]
+        flags = int(record['flags'])
+        node = {'staker_address': record['staker_address'].decode()}
+        for field in MAPPED_STRING_FIELDS:
+            node[field] = self.string(record[field])
+        node['stale'] = 1 if flags & STALE else 0
+        node['change_seq'] = int(record['change_seq'])
+        node['status'] = {'status': self.string(record['status_message']),
+                          'missed_confirmations': int(record['missed_confirmations']),
+                          'color': self.string(record['color'])}
+        if flags & NEWBORN:
+            node['newborn'] = True
+        if flags & UPTIME_KING:
+            node['uptime_king'] = True
+        return node
+
+    def iter_nodes(self, statuses: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+        """Nodes of the given statuses (all by default), decoded one at a time"""
+        if statuses:
+            codes = [code for code, status in enumerate(self.statuses) if status.lower() in statuses]
+            indexes = np.flatnonzero(np.isin(self.nodes['status'], codes))
+        else:
+            indexes = range(len(self.nodes))
+        for index in indexes:
+            yield self.node(int(index))
+
+
+class MappedStatsReader:
+    """
+    Maps the crawler's latest stats snapshot file. The crawler replaces the file every round, so a stat call
+    is enough to notice a new round; the file is then mapped again.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._version = None  # (inode, mtime) of the file mapped
+        self._mapped = None
+
+    def current(self) -> Optional[MappedStats]:
+        """The latest snapshot written, None if there isn't one yet"""
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._version:
+            return self._mapped
+        with self._lock:
+            if version != self._version:
+                with open(self.filepath, 'rb') as mapped_file:
+                    mapping = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mapped, self._version = MappedStats(mapping), version
+        return self._mapped
+
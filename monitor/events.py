@@ -0,0 +1,163 @@
+import json
+from typing import Dict, Optional, Tuple
+
+from twisted.internet import reactor as global_reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.task import LoopingCall
+from twisted.logger import Logger
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+from zope.interface import implementer
+
+from monitor.snapshots import parse_list, serialize
+
+STATS_EVENT = b'stats'
+
+
+def changed_fields(previous: dict, current: dict) -> Dict[str, bytes]:
+    """Serialized values of the top level fields of `current` that differ from `previous`"""
+    return {field: serialize(value) for field, value in current.items()
+            if field not in previous or previous[field] != value}
+
+
+class StatsEvent:
+    """
+    A published stats snapshot, as pushed to subscribers: its ETag (also the SSE event id, so reconnecting
+    clients send it back as Last-Event-ID) and the changed fields, each serialized once for all subscribers.
+    """
+
+    def __init__(self, etag: str, fields: Dict[str, bytes]):
+        self.etag = etag
+        self.fields = fields
+
+    def merge(self, newer: 'StatsEvent') -> 'StatsEvent':
+        """A single event with the changes of this event and a `newer` one"""
+        return StatsEvent(etag=newer.etag, fields=dict(self.fields, **newer.fields))
+
+    def select(self, fields: Optional[Tuple[str, ...]]) -> 'StatsEvent':
+        if not fields:
+            return self
+        return StatsEvent(etag=self.etag, fields={field: value for field, value in self.fields.items() if field in fields})
+
+    def encode(self) -> bytes:
+        """{"etag": ..., "changed": {field: value, ...}} in the text/event-stream framing"""
+        changed = b','.join(json.dumps(field).encode() + b':' + value for field, value in self.fields.items())
+        data = b'{"etag":' + json.dumps(self.etag).encode() + b',"changed":{' + changed + b'}}'
+        return b'id: ' + self.etag.encode() + b'\nevent: ' + STATS_EVENT + b'\ndata: ' + data + b'\n\n'
+
+
+@implementer(IPushProducer)
+class Subscriber:
+    """
+    One event stream. Registered with its request as a streaming producer, so Twisted pauses it while the
+    client's socket buffer is full; events published meanwhile are coalesced into one, sent on resume.
+    A slow client therefore holds at most one pending event and never more than the latest values.
+    """
+
+    def __init__(self, request, fields: Optional[Tuple[str, ...]] = None):
+        self.request = request
+        self.fields = fields
+        self.paused = False
+        self.pending = None  # StatsEvent not yet written
+
+    def send(self, event: StatsEvent) -> None:
+        event = event.select(self.fields)
+        if not event.fields:
+            return  # none of the subscribed fields changed
+        self.pending = self.pending.merge(event) if self.pending is not None else event
+        if not self.paused:
+            self._flush()
+
+    def keepalive(self) -> None:
+        if not self.paused:
+            self.request.write(b': keepalive\n\n')
+
+    def _flush(self) -> None:
+        event, self.pending = self.pending, None
+        if event is not None:
+            self.request.write(event.encode())
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self._flush()
+
+    def stopProducing(self):
+        self.paused = True
+        self.pending = None
+
+
+class StatsEventResource(Resource):
+    """
+    Server-Sent Events stream of published stats, served by the crawler's Hendrix server at /events.
+
+    Each event carries the snapshot ETag and the top level fields that changed since the previous one;
+    new and reconnecting clients first get every field unless their Last-Event-ID is still current.
+    Clients may subscribe to some fields only (?fields=activity,node_details). Subscribers are plain
+    objects on the reactor thread, so idle connections cost no thread; publishing from the collection
+    thread is handed to the reactor with callFromThread.
+    """
+
+    isLeaf = True
+    namespace = 'events'  # path under the Hendrix root resource
+
+    KEEPALIVE_INTERVAL = 15  # seconds; keeps idle connections open through proxies
+
+    def __init__(self, reactor=global_reactor):
+        super().__init__()
+        self.log = Logger(self.__class__.__name__)
+        self._reactor = reactor
+        self.subscribers = set()
+        self._fields = dict()  # field -> serialized value, as last published
+        self._current = None  # StatsEvent with every field of the latest snapshot; reactor thread only
+        self._keepalive = LoopingCall(self._send_keepalive)
+        self._keepalive.clock = reactor
+
+    def publish(self, previous: dict, current: dict, etag: str) -> None:
+        """
+        Pushes the changes from `previous` to `current` to all subscribers. Called from the collection thread,
+        one snapshot at a time; only unchanged fields are reused from the previous publication.
+        """
+        changed = changed_fields(previous, current)
+        self._fields = {field: changed[field] if field in changed else self._fields.get(field) or serialize(value)
+                        for field, value in current.items()}
+        event = StatsEvent(etag=etag, fields=changed)
+        complete = StatsEvent(etag=etag, fields=self._fields)
+        self._reactor.callFromThread(self._publish, event, complete)
+
+    def _publish(self, event: StatsEvent, complete: StatsEvent) -> None:
+        self._current = complete
+        if not event.fields:
+            return
+        for subscriber in list(self.subscribers):
+            subscriber.send(event)
+
+    def _send_keepalive(self) -> None:
+        for subscriber in list(self.subscribers):
+            subscriber.keepalive()
+
+    def _unsubscribe(self, result, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._keepalive.running:
+            self._keepalive.stop()
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/event-stream')
+        request.setHeader(b'Cache-Control', b'no-cache')
+        request.setHeader(b'X-Accel-Buffering', b'no')  # don't let nginx buffer the stream
+
+        fields = parse_list(b','.join(request.args.get(b'fields', [])).decode())
+        subscriber = Subscriber(request=request, fields=fields)
+        request.registerProducer(subscriber, True)
+        request.notifyFinish().addBoth(self._unsubscribe, subscriber)
+        self.subscribers.add(subscriber)
+        if not self._keepalive.running:
+            self._keepalive.start(self.KEEPALIVE_INTERVAL, now=False)
+
+        request.write(b'retry: 5000\n\n')
+        last_event_id = request.getHeader(b'Last-Event-ID')
+        if self._current is not None and (last_event_id or b'').decode() != self._current.etag:
+            subscriber.send(self._current)
+        return NOT_DONE_YET
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from eth_utils import encode_hex, event_abi_to_log_topic
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from twisted.logger import Logger
+
+BlockRange = Tuple[int, int]  # inclusive
+
+
+class StakingEscrowIndexer:
+    """
+    Materializes per-staker state from StakingEscrow events into the crawler's db.
+
+    Logs are fetched with `eth_getLogs` over fixed size block ranges, several ranges in parallel; a range the
+    node refuses (eg. too many results) is split in half until it is accepted. Events are applied in chain
+    order and committed together with the indexer's cursor after each batch of ranges, so an interrupted
+    backfill resumes from the last committed batch, and each later update only reads the blocks since.
+
+    Only the latest worker and the highest committed period are kept, and the highest committed period never
+    moves back, so only blocks with `confirmations` blocks on top of them are stored. Events of the blocks
+    after those are read again on every update and overlaid in memory (see `staker_states`), so one that is
+    reorged out disappears with the next update. Backfilling should start at the StakingEscrow deployment
+    block (`start_block`) rather than at genesis.
+    """
+
+    DEFAULT_NAME = 'staking_escrow'
+    DEFAULT_CHUNK_SIZE = 5000  # blocks per eth_getLogs request
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_CONFIRMATIONS = 12  # blocks on top of an event before it is stored
+
+    COMMITMENT_EVENT = 'CommitmentMade'
+    WORKER_EVENTS = ('WorkerBonded', 'WorkerSet')  # renamed between contract versions
+    STAKE_EVENTS = ('Deposited', 'Withdrawn')
+
+    def __init__(self,
+                 staking_agent: StakingEscrowAgent,
+                 storage,
+                 name: str = DEFAULT_NAME,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 start_block: int = 0,
+                 confirmations: int = DEFAULT_CONFIRMATIONS):
+        if chunk_size < 1:
+            raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+        if confirmations < 0:
+            raise ValueError(f"Confirmations can't be negative, got {confirmations}")
+        self.log = Logger(self.__class__.__name__)
+        self.staking_agent = staking_agent
+        self.storage = storage
+        self.name = name
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self._update_lock = threading.Lock()
+        self._recent = None  # (block number, staker updates of the unconfirmed blocks up to it)
+
+        # only events the deployed contract actually has
+        contract = staking_agent.contract
+        event_names = (self.COMMITMENT_EVENT, *self.WORKER_EVENTS, *self.STAKE_EVENTS)
+        self._events = dict()  # topic -> event name
+        for item in contract.abi:
+            if item.get('type') == 'event' and item['name'] in event_names:
+                self._events[encode_hex(event_abi_to_log_topic(item))] = item['name']
+
+    @property
+    def cursor(self) -> Optional[int]:
+        """The last block indexed, None before the first update"""
+        return self.storage.get_indexer_cursor(self.name)
+
+    @property
+    def indexed_block(self) -> Optional[int]:
+        """The last block reflected by `staker_states`, including unconfirmed ones; None before the first update"""
+        recent = self._recent
+        return recent[0] if recent is not None else None
+
+    def staker_states(self, stored_states: Dict[str, dict]) -> Dict[str, dict]:
+        """Stored staker states (see `CrawlerStorageClient.get_staker_states`) with the unconfirmed events applied"""
+        recent = self._recent
+        if recent is None:
+            return stored_states
+        staker_states = dict(stored_states)
+        for staker_address, update in recent[1].items():
+            staker_state = dict(staker_states.get(staker_address) or {'staker_address': staker_address,
+                                                                      'worker': None,
+                                                                      'last_committed_period': None,
+                                                                      'first_block': update['first_block']})
+            if 'worker' in update:
+                staker_state['worker'] = update['worker']
+            if 'last_committed_period' in update:
+                staker_state['last_committed_period'] = max(staker_state['last_committed_period'] or 0,
+                                                             update['last_committed_period'])
+            staker_state['updated_block'] = update['updated_block']
+            staker_states[staker_address] = staker_state
+        return staker_states
+
+    def _chunks(self, from_block: int, to_block: int) -> List[BlockRange]:
+        return [(start, min(start + self.chunk_size - 1, to_block))
+                for start in range(from_block, to_block + 1, self.chunk_size)]
+
+    def _get_logs(self, block_range: BlockRange) -> list:
+        from_block, to_block = block_range
+        try:
+            return self.staking_agent.blockchain.client.w3.eth.getLogs({'address': self.staking_agent.contract_address,
+                                                                        'fromBlock': from_block,
+                                                                        'toBlock': to_block,
+                                                                        'topics': [list(self._events)]})
+        except ValueError as e:
+            if from_block == to_block:
+                raise
+            middle = (from_block + to_block) // 2
+            self.log.debug(f"Splitting logs of blocks {from_block}-{to_block} ({e})")
+            return self._get_logs((from_block, middle)) + self._get_logs((middle + 1, to_block))
+
+    def _staker_updates(self, logs: Iterable) -> Dict[str, dict]:
+        updates = dict()
+        contract_events = self.staking_agent.contract.events
+        for log in sorted(logs, key=lambda log: (log['blockNumber'], log['logIndex'])):
+            topic = encode_hex(HexBytes(log['topics'][0]))
+            event_name = self._events.get(topic)
+            if event_name is None:
+                continue
+            event = getattr(contract_events, event_name)().processLog(log)
+            update = updates.setdefault(event.args['staker'], {'first_block': event.blockNumber})
+            update['updated_block'] = event.blockNumber
+            if event_name == self.COMMITMENT_EVENT:
+                update['last_committed_period'] = max(update.get('last_committed_period', 0), event.args['period'])
+            elif event_name in self.WORKER_EVENTS:
+                update['worker'] = event.args['worker']
+        return updates
+
+    def update(self, to_block: int) -> Optional[int]:
+        """
+        Indexes events up to and including `to_block`, storing those of confirmed blocks; returns the cursor
+        (last stored block) afterwards. An update already running in another thread is not waited for.
+        """
+        if not self._update_lock.acquire(blocking=False):
+            return self.cursor
+        try:
+            if self.indexed_block == to_block:
+                return self.cursor  # up to date; when the head moved back, the unconfirmed events are read again
+
+            cursor = self._store(to_block=to_block - self.confirmations)
+            from_block = self.start_block if cursor is None else cursor + 1
+            logs = [log for chunk in self._chunks(from_block, to_block) for log in self._get_logs(chunk)]
+            self._recent = (to_block, self._staker_updates(logs))
+            return cursor
+        finally:
+            self._update_lock.release()
+
+    def _store(self, to_block: int) -> Optional[int]:
+        """Stores the events up to and including `to_block`, returns the cursor afterwards"""
+        cursor = self.cursor
+        from_block = self.start_block if cursor is None else cursor + 1
+        if from_block > to_block:
+            return cursor
+
+        chunks = self._chunks(from_block, to_block)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='indexer') as executor:
+            for start in range(0, len(chunks), self.max_workers):
+                batch = chunks[start:start + self.max_workers]
+                logs = [log for chunk_logs in executor.map(self._get_logs, batch) for log in chunk_logs]
+                updates = self._staker_updates(logs)
+                self.storage.store_staker_updates(self.name, block_number=batch[-1][1], staker_updates=updates)
+                cursor = batch[-1][1]
+        self.log.debug(f"Indexed StakingEscrow events of blocks {from_block}-{to_block}")
+        return cursor
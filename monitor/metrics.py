@@ -0,0 +1,213 @@
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus text exposition format
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = [f'{name}="{_escape(str(value))}"' for name, value in labels]
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = dict()  # label values -> value
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        """(sample name, labels, value) of every sample"""
+        with self._lock:
+            return [(self.name, tuple(zip(self.labelnames, label_values)), value)
+                    for label_values, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.TYPE}']
+        lines.extend(f'{name}{_format_labels(labels)} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError(f"Counter '{self.name}' can only be incremented, got {amount}")
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set_to_current_time(self, **labels) -> None:
+        self.set(time.time(), **labels)
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, math.inf)  # seconds
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = None):
+        super().__init__(name=name, documentation=documentation, labelnames=labelnames)
+        buckets = sorted(buckets or self.DEFAULT_BUCKETS)
+        if buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.get(label_values, ([0] * len(self.buckets), 0))
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[i] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def value(self, **labels) -> Tuple[int, float]:
+        """Number and sum of observations"""
+        with self._lock:
+            counts, total = self._values.get(self._label_values(labels), ([0], 0))
+            return counts[-1], total
+
+    def samples(self) -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+        samples = list()
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                labels = tuple(zip(self.labelnames, label_values))
+                for upper_bound, count in zip(self.buckets, counts):  # counts are already cumulative
+                    samples.append((f'{self.name}_bucket', labels + (('le', _format_value(upper_bound)),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """In-process metrics, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = dict()  # name -> metric
+
+    def _get_or_create(self, metric_class, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name=name, documentation=documentation, labelnames=labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.TYPE} "
+                                 f"with labels {metric.labelnames}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self,
+                  name: str,
+                  documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = None) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        with self._lock:
+            return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+
+# Shared by everything in the process, like the Prometheus client's default registry
+REGISTRY = MetricsRegistry()
+
+COLLECTOR_DURATION = REGISTRY.histogram('monitor_collector_duration_seconds',
+                                        'Time taken by each collector', labelnames=('collector',))
+COLLECTOR_RUNS = REGISTRY.counter('monitor_collector_runs_total',
+                                  'Collector runs by outcome', labelnames=('collector', 'result'))
+COLLECTOR_LAST_RUN = REGISTRY.gauge('monitor_collector_last_run_timestamp_seconds',
+                                    'When each collector last finished, successfully or not', labelnames=('collector',))
+
+ROUND_DURATION = REGISTRY.histogram('monitor_round_duration_seconds', 'Time taken by each collection round')
+ROUNDS = REGISTRY.counter('monitor_rounds_total', 'Collection rounds run')
+NOOP_ROUNDS = REGISTRY.counter('monitor_noop_rounds_total', 'Collection rounds in which no collector was due')
+
+RPC_REQUESTS = REGISTRY.counter('monitor_rpc_requests_total',
+                                'Ethereum JSON-RPC requests made, batched calls counted one by one',
+                                labelnames=('method',))
+RPC_ERRORS = REGISTRY.counter('monitor_rpc_errors_total', 'Ethereum JSON-RPC requests that failed',
+                              labelnames=('method',))
+
+STORAGE_COMMITS = REGISTRY.counter('monitor_storage_commits_total', 'Transactions committed to the crawler db')
+STORAGE_ROWS_WRITTEN = REGISTRY.counter('monitor_storage_rows_written_total', 'Rows written to the crawler db',
+                                        labelnames=('table',))
+
+
+def rpc_metrics_middleware(make_request, w3):
+    """web3 middleware counting the requests made through a provider"""
+    def middleware(method, params):
+        RPC_REQUESTS.inc(method=method)
+        try:
+            response = make_request(method, params)
+        except Exception:
+            RPC_ERRORS.inc(method=method)
+            raise
+        if 'error' in response:
+            RPC_ERRORS.inc(method=method)
+        return response
+    return middleware
+
+
+def install_rpc_metrics(w3) -> None:
+    """Counts `w3`'s requests; installing it more than once has no effect"""
+    if 'rpc_metrics' not in w3.middleware_onion:
+        w3.middleware_onion.add(rpc_metrics_middleware, name='rpc_metrics')
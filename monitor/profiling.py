@@ -0,0 +1,183 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from ipaddress import ip_address
+from typing import Optional
+
+from flask import Flask, g, request
+from nucypher.config.constants import DEFAULT_CONFIG_ROOT
+from twisted.logger import Logger
+
+
+class ProfilingSession:
+    """Samples the stacks of every thread on a dedicated thread until stopped"""
+
+    def __init__(self, label: str, interval: float):
+        self.label = label
+        self.interval = interval
+        self.samples = Counter()  # collapsed stack -> number of samples
+        self.sample_count = 0
+        self.started = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{label}', daemon=True)
+
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        """Blocked waiting on a lock or condition, eg. an idle pool worker"""
+        code = frame.f_code
+        return os.path.basename(code.co_filename) == 'threading.py' and code.co_name in ('wait', '_wait_for_tstate_lock')
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = list()
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or self._is_idle(frame):
+                    continue
+                thread_name = thread_names.get(ident, str(ident))
+                self.samples[f"{thread_name};{self._collapse(frame)}"] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Samples in the collapsed stack format read by flamegraph.pl, speedscope and others"""
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for the next N rounds or requests, armed on demand.
+
+    While a profiled section runs, a dedicated thread samples the stacks of all threads (including reactor
+    and collector pool threads, so work handed off to them is included) every `interval` seconds. Each
+    section is written to `output_dir` as a collapsed stack file. When not armed, entering a section only
+    checks a counter.
+    """
+
+    DEFAULT_INTERVAL = 0.005  # seconds
+    DEFAULT_OUTPUT_DIR = os.path.join(DEFAULT_CONFIG_ROOT, 'monitor-profiles')
+    DEFAULT_SIGNAL_COUNT = 3
+
+    def __init__(self, name: str, output_dir: str = DEFAULT_OUTPUT_DIR, interval: float = DEFAULT_INTERVAL):
+        self.log = Logger(self.__class__.__name__)
+        self.name = name
+        self.output_dir = output_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._session = None
+        self.written = list()  # filepaths of profiles written
+
+    @property
+    def remaining(self) -> int:
+        """Sections still to be profiled"""
+        return self._remaining
+
+    def arm(self, count: int) -> None:
+        """Profiles the next `count` sections; lock free, so safe to call from a signal handler"""
+        if count < 0:
+            raise ValueError(f"Count must not be negative, got {count}")
+        self._remaining = count
+
+    def _start(self, label: str) -> Optional[ProfilingSession]:
+        if not self._remaining:
+            return None
+        with self._lock:
+            if not self._remaining or self._session is not None:
+                return None  # sections aren't profiled concurrently; all threads are sampled anyway
+            self._remaining -= 1
+            self._session = ProfilingSession(label=label, interval=self.interval)
+        self._session.start()
+        return self._session
+
+    def _finish(self, session: ProfilingSession) -> str:
+        session.stop()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            filename = f"{self.name}-{session.label}-{int(session.started)}.collapsed"
+            filepath = os.path.join(self.output_dir, filename)
+            with open(filepath, 'w') as profile_file:
+                profile_file.write(session.collapsed())
+            self.written.append(filepath)
+            self.log.info(f"Wrote profile of {session.label} ({session.sample_count} samples) to {filepath}")
+            return filepath
+        finally:
+            with self._lock:
+                self._session = None
+
+    @contextmanager
+    def profile(self, label: str):
+        """Profiles the enclosed section if armed"""
+        session = self._start(label)
+        try:
+            yield session
+        finally:
+            if session is not None:
+                self._finish(session)
+
+    def install_signal_handler(self, signum: int = None, count: int = DEFAULT_SIGNAL_COUNT) -> bool:
+        """Arms the profiler for `count` sections on `signum` (SIGUSR2 by default); only possible on the main thread"""
+        signum = signum if signum is not None else getattr(signal, 'SIGUSR2', None)
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *args: self.arm(count))
+        return True
+
+
+def add_profile_endpoint(flask_server: Flask, profiler: SamplingProfiler, unit: str) -> None:
+    """
+    POST /admin/profile?count=N arms `profiler` for the next N `unit`s (rounds or requests).
+    Only requests from the local host are allowed.
+    """
+
+    @flask_server.route('/admin/profile', methods=['POST'])
+    def arm_profiler():
+        try:
+            local = ip_address(request.remote_addr or '').is_loopback
+        except ValueError:
+            local = False
+        if not local:
+            return flask_server.response_class(response="Forbidden", status=403, mimetype='text/plain')
+        try:
+            count = int(request.args.get('count', 1))
+            profiler.arm(count)
+        except ValueError as e:
+            return flask_server.response_class(response=str(e), status=400, mimetype='text/plain')
+        message = f"Profiling the next {count} {unit}, written to {profiler.output_dir}"
+        return flask_server.response_class(response=message, status=200, mimetype='text/plain')
+
+
+def profile_flask_requests(flask_server: Flask, profiler: SamplingProfiler) -> None:
+    """Profiles requests while `profiler` is armed; arming requests themselves aren't profiled"""
+
+    @flask_server.before_request
+    def start_profiling():
+        if profiler.remaining and request.path != '/admin/profile':
+            label = request.path.strip('/').replace('/', '_') or 'index'
+            g.profile = profiler.profile(label=label)
+            g.profile.__enter__()
+
+    @flask_server.teardown_request
+    def stop_profiling(exception):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.__exit__(None, None, None)
@@ -0,0 +1,80 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from eth_typing import ChecksumAddress
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from nucypher.blockchain.eth.token import NU
+
+
+class LockedTokensProjection:
+    """
+    Projects locked tokens and active stakers for each of the next N periods from the stakers' sub-stake
+    lock schedules, instead of asking StakingEscrow once per future period.
+
+    Schedules are cached per staker and only re-read when the period changes, when the staker's locked
+    tokens for the next period no longer match the cached schedule, or once invalidated: prolonging,
+    dividing or merging sub-stakes moves unlock periods without changing next period's locked tokens.
+    """
+
+    def __init__(self, staking_agent: StakingEscrowAgent, pagination_size: int = None):
+        self.staking_agent = staking_agent
+        self.pagination_size = pagination_size
+        self._schedules = dict()  # staker -> (current period, locked tokens next period, [(first, last, value), ...])
+
+    def _schedule(self, staker_address: ChecksumAddress, current_period: int, next_period_tokens: int) -> List[Tuple]:
+        cached = self._schedules.get(staker_address)
+        if cached and cached[0] == current_period and cached[1] == next_period_tokens:
+            return cached[2]
+
+        schedule = [(sub_stake.first_period, sub_stake.last_period, sub_stake.locked_value)
+                    for sub_stake in self.staking_agent.get_all_stakes(staker_address=staker_address)]
+        self._schedules[staker_address] = (current_period, next_period_tokens, schedule)
+        return schedule
+
+    def invalidate(self, staker_addresses: Optional[Iterable[ChecksumAddress]] = None) -> None:
+        """Drops the cached schedules of the stakers, eg. those with StakingEscrow events; all of them if None"""
+        if staker_addresses is None:
+            self._schedules.clear()
+            return
+        for staker_address in staker_addresses:
+            self._schedules.pop(staker_address, None)
+
+    def project(self, periods: int = 365) -> Dict[int, Tuple[float, int]]:
+        """Returns {period offset -> (locked tokens, number of stakers)} for offsets 1 through `periods`"""
+        current_period = self.staking_agent.get_current_period()
+
+        # the set of stakers that can have locked tokens in any future period
+        _, stakers = self.staking_agent.get_all_active_stakers(periods=1, pagination_size=self.pagination_size)
+
+        staker_indices, starts, ends, values = list(), list(), list(), list()
+        for staker_index, (staker_address, next_period_tokens) in enumerate(stakers.items()):
+            for first_period, last_period, locked_value in self._schedule(staker_address=staker_address,
+                                                                          current_period=current_period,
+                                                                          next_period_tokens=next_period_tokens):
+                # sub-stake is locked for offsets [first - current, last - current]
+                staker_indices.append(staker_index)
+                starts.append(first_period - current_period)
+                ends.append(last_period - current_period)
+                values.append(locked_value)
+
+        starts = np.clip(np.array(starts, dtype=np.int64), 1, periods + 1)
+        ends = np.clip(np.array(ends, dtype=np.int64), 0, periods) + 1  # exclusive
+        locked = starts < ends
+        staker_indices = np.array(staker_indices, dtype=np.int64)[locked]
+        starts, ends = starts[locked], ends[locked]
+        values = np.array(values, dtype=object)[locked]  # NuNits overflow int64
+
+        # tokens: difference array over period offsets, integrated with a cumulative sum
+        token_deltas = np.zeros(periods + 2, dtype=object)
+        np.add.at(token_deltas, starts, values)
+        np.add.at(token_deltas, ends, -values)
+        tokens = np.cumsum(token_deltas)
+
+        # stakers: per-staker difference array of covering sub-stakes; a staker counts while any sub-stake covers
+        stake_deltas = np.zeros((len(stakers), periods + 2), dtype=np.int64)
+        np.add.at(stake_deltas, (staker_indices, starts), 1)
+        np.add.at(stake_deltas, (staker_indices, ends), -1)
+        active_stakers = np.count_nonzero(np.cumsum(stake_deltas, axis=1) > 0, axis=0)
+
+        return {period: (float(NU.from_nunits(tokens[period]).to_tokens()), int(active_stakers[period]))
+                for period in range(1, periods + 1)}
@@ -0,0 +1,233 @@
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+from twisted.logger import Logger
+
+from monitor.tracing import caller
+
+
+class RoundContext(NamedTuple):
+    """Where the chain and the clock are at the start of a round"""
+    timestamp: float  # epoch
+    block_number: Optional[int] = None
+    period: Optional[int] = None
+    changed: Optional[FrozenSet[str]] = None  # inputs that changed since the last round, None if unknown
+
+
+class Schedule(ABC):
+    """When a collector's cached value is due for a refresh"""
+
+    @abstractmethod
+    def due(self, last_refresh: RoundContext, now: RoundContext) -> bool:
+        """Whether a value refreshed at `last_refresh` is due for a refresh in the round starting `now`"""
+
+
+class Every(Schedule):
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def due(self, last_refresh: RoundContext, now: RoundContext) -> bool:
+        return now.timestamp - last_refresh.timestamp >= self.seconds
+
+    def __repr__(self):
+        return f"Every({self.seconds}s)"
+
+
+class EveryBlock(Schedule):
+    def due(self, last_refresh: RoundContext, now: RoundContext) -> bool:
+        return now.block_number != last_refresh.block_number
+
+    def __repr__(self):
+        return "EveryBlock()"
+
+
+class EveryPeriod(Schedule):
+    def due(self, last_refresh: RoundContext, now: RoundContext) -> bool:
+        return now.period != last_refresh.period
+
+    def __repr__(self):
+        return "EveryPeriod()"
+
+
+class CollectorTask(NamedTuple):
+    """
+    A measurement made by collection rounds.
+    `func` is called with the results of the tasks it depends on as keyword arguments.
+    """
+    name: str
+    func: Callable[..., Any]
+    depends_on: Tuple[str, ...] = ()
+    timeout: Optional[float] = None  # seconds, None waits forever
+    schedule: Optional[Schedule] = None  # None refreshes every round
+    inputs: Optional[FrozenSet[str]] = None  # only refreshed once one of these changed; None for any round
+
+
+class RoundResult(NamedTuple):
+    values: Dict[str, Any]
+    durations: Dict[str, float]  # seconds, only for tasks that ran and completed this round
+    failed: Tuple[str, ...]      # raised or timed out; their values are carried over from an earlier round
+    refreshed: Dict[str, float]  # epoch of each task's latest successful refresh
+
+    @property
+    def noop(self) -> bool:
+        """Nothing was due, every value is from an earlier round"""
+        return not self.durations and not self.failed
+
+    def ages(self, now: float) -> Dict[str, Optional[float]]:
+        """Seconds since each value was refreshed, None if it never was"""
+        return {name: (round(now - self.refreshed[name], 1) if name in self.refreshed else None)
+                for name in self.values}
+
+
+class RoundExecutor:
+    """
+    Runs a round of collector tasks on a bounded thread pool, each as soon as the tasks it depends on are done.
+
+    Tasks only run when their schedule says they are due and, if they declare inputs, one of those inputs
+    changed since their last refresh; otherwise the value from their last refresh is reused. A task that
+    raises or runs past its timeout does not fail the round; its last value is used instead (and handed to
+    its dependents), and it is retried next round. Threads can't be interrupted, so a timed out task keeps
+    its worker busy until it returns; until then it is not submitted again, and its last value is used.
+    """
+
+    DEFAULT_MAX_WORKERS = 4
+
+    class CyclicDependency(ValueError):
+        pass
+
+    class UnknownDependency(ValueError):
+        pass
+
+    def __init__(self, tasks: Iterable[CollectorTask], max_workers: int = DEFAULT_MAX_WORKERS):
+        self.log = Logger(self.__class__.__name__)
+        self.tasks = {task.name: task for task in tasks}
+        self._order = self._topological_order(self.tasks)
+        self.max_workers = max_workers
+        self._executor = None
+        self._values = dict()
+        self._last_refresh = dict()  # task name -> RoundContext of its latest successful run
+        self._changed_since_refresh = dict()  # task name -> inputs changed since its latest successful run
+        self._outstanding = dict()  # task name -> future of a timed out run that may still be running
+
+    @classmethod
+    def _topological_order(cls, tasks: Dict[str, CollectorTask]) -> Tuple[str, ...]:
+        order, visiting, visited = list(), set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise cls.CyclicDependency(f"Collector '{name}' depends on itself")
+            visiting.add(name)
+            for dependency in tasks[name].depends_on:
+                if dependency not in tasks:
+                    raise cls.UnknownDependency(f"Collector '{name}' depends on unknown collector '{dependency}'")
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for task_name in tasks:
+            visit(task_name)
+        return tuple(order)
+
+    def due(self, name: str, context: RoundContext) -> bool:
+        task, last_refresh = self.tasks[name], self._last_refresh.get(name)
+        if last_refresh is None:
+            return True
+        if task.schedule is not None and not task.schedule.due(last_refresh=last_refresh, now=context):
+            return False
+        if task.inputs is not None and context.changed is not None:
+            return bool(task.inputs & self._changed_since_refresh.get(name, frozenset()))
+        return True
+
+    def run(self, context: RoundContext = None, previous: Dict[str, Any] = None) -> RoundResult:
+        """Runs the tasks that are due; `previous` values are the fallback for tasks that never completed"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='collector')
+        context = context or RoundContext(timestamp=time.time())
+        previous = previous or dict()
+        values, durations, failed = dict(), dict(), list()
+
+        # changes are remembered until each task refreshes; it may not have been due when they happened
+        if context.changed is not None:
+            for name in self.tasks:
+                self._changed_since_refresh[name] = self._changed_since_refresh.get(name, frozenset()) | context.changed
+
+        # cached values of tasks that aren't due are available to their dependents right away
+        self._outstanding = {name: future for name, future in self._outstanding.items() if not future.done()}
+        pending, still_running = list(), list()
+        for name in self._order:
+            if name in self._outstanding:
+                still_running.append(name)  # running it twice at once would only compete for workers and state
+            elif self.due(name, context):
+                pending.append(name)
+            else:
+                values[name] = self._values[name]
+        running = dict()  # future -> task name
+        started = dict()  # task name -> start time; timeouts don't include time spent queued for a worker
+
+        def call(task: CollectorTask, kwargs: dict):
+            started[task.name] = time.monotonic()
+            with caller(task.name):
+                return task.func(**kwargs)
+
+        def deadline(name: str, now: float) -> Optional[float]:
+            timeout = self.tasks[name].timeout
+            if timeout is None:
+                return None
+            return started.get(name, now) + timeout
+
+        def finish(name: str, value: Any = None, error: str = None):
+            if error is not None:
+                self.log.warn(f"Collector '{name}' {error}; using its last value")
+                failed.append(name)
+                value = self._values.get(name, previous.get(name))
+            else:
+                self._values[name] = value
+                self._last_refresh[name] = context
+                self._changed_since_refresh[name] = frozenset()
+            values[name] = value
+
+        for name in still_running:
+            finish(name, error="is still running since it timed out")
+
+        while pending or running:
+            # start everything whose dependencies are done
+            for name in [name for name in pending if all(d in values for d in self.tasks[name].depends_on)]:
+                pending.remove(name)
+                task = self.tasks[name]
+                kwargs = {dependency: values[dependency] for dependency in task.depends_on}
+                running[self._executor.submit(call, task, kwargs)] = name
+
+            now = time.monotonic()
+            deadlines = [d for d in (deadline(name, now) for name in running.values()) if d is not None]
+            wait_for = max(0, min(deadlines) - now) if deadlines else None
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            now = time.monotonic()
+            for future, name in list(running.items()):
+                if future in done:
+                    del running[future]
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        finish(name, error=f"failed ({e.__class__.__name__}: {e})")
+                    else:
+                        durations[name] = now - started[name]
+                        finish(name, value=value)
+                elif name in started and self.tasks[name].timeout is not None and deadline(name, now) <= now:
+                    del running[future]  # left to finish in the background, its result is ignored
+                    self._outstanding[name] = future
+                    finish(name, error=f"timed out after {self.tasks[name].timeout}s")
+
+        refreshed = {name: last_refresh.timestamp for name, last_refresh in self._last_refresh.items()}
+        return RoundResult(values=values, durations=durations, failed=tuple(failed), refreshed=refreshed)
+
+    def shutdown(self) -> None:
+        """Releases the worker threads, without waiting for timed out tasks that are still running"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
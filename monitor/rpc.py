@@ -0,0 +1,403 @@
+import inspect
+import json
+import threading
+import types
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
+
+import requests
+from eth_typing import ChecksumAddress
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from twisted.logger import Logger
+from web3 import HTTPProvider
+from web3.contract import Contract
+
+from monitor.metrics import RPC_ERRORS, RPC_REQUESTS
+
+BlockIdentifier = Union[int, str]
+ContractCall = Tuple[str, tuple]  # (function name, args)
+Transport = Callable[[List[dict]], List[dict]]
+
+
+class BlockReadCache:
+    """
+    Memoizes contract reads by (method, args, block) for the block pinned by the current collection round.
+
+    Pinning only applies to reads that pass the pinned block explicitly, eg. through `BlockPinnedAgent` or
+    `StakingEscrowBatchReader`; web3's default block is left alone, so other users of the shared web3 instance
+    (such as the Learner) keep reading the latest state. Nothing is cached while no block is pinned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pinned_block = None
+        self._values = dict()  # (block, key) -> value
+        self._values_block = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def pinned_block(self) -> Optional[int]:
+        return self._pinned_block
+
+    @contextmanager
+    def pinned(self, block_number: int):
+        with self._lock:
+            if block_number != self._values_block:
+                self._values.clear()  # reads of older blocks won't be asked for again
+                self._values_block = block_number
+            self._pinned_block = block_number
+        try:
+            yield block_number
+        finally:
+            with self._lock:
+                self._pinned_block = None
+
+    def get_many(self, keys: Iterable[tuple]) -> dict:
+        """Cached values of the given keys at the pinned block, omitting misses"""
+        with self._lock:
+            if self._pinned_block is None:
+                return dict()
+            block = self._pinned_block
+            hits = {key: self._values[(block, key)] for key in keys if (block, key) in self._values}
+            self.hits += len(hits)
+            return hits
+
+    def put_many(self, values: dict, block_number: Optional[int]) -> None:
+        with self._lock:
+            if block_number is None or block_number != self._pinned_block:
+                return  # the round has moved on
+            self.misses += len(values)
+            self._values.update(((block_number, key), value) for key, value in values.items())
+
+    def read(self, key: tuple, read: Callable[[Optional[int]], Any]):
+        """The cached value of `key`, otherwise `read(block_number)` at the pinned block (None if not pinned)"""
+        block_number = self._pinned_block
+        hits = self.get_many([key])
+        if key in hits:
+            return hits[key]
+        value = read(block_number)
+        self.put_many({key: value}, block_number=block_number)
+        return value
+
+
+class _PinnedContractFunction:
+    """A prepared contract function call, made at a given block unless the caller asks for another one"""
+
+    def __init__(self, function, block_identifier: BlockIdentifier):
+        self._function = function
+        self._block_identifier = block_identifier
+
+    def call(self, transaction: dict = None, block_identifier: BlockIdentifier = None):
+        if block_identifier is None:
+            block_identifier = self._block_identifier
+        return self._function.call(transaction, block_identifier=block_identifier)
+
+    def __getattr__(self, name: str):
+        return getattr(self._function, name)
+
+
+class _PinnedContractFunctions:
+    def __init__(self, functions, block_identifier: BlockIdentifier):
+        self._functions = functions
+        self._block_identifier = block_identifier
+
+    def __getattr__(self, name: str):
+        function = getattr(self._functions, name)
+
+        def prepare(*args, **kwargs) -> _PinnedContractFunction:
+            return _PinnedContractFunction(function(*args, **kwargs), block_identifier=self._block_identifier)
+        return prepare
+
+
+class _PinnedContract:
+    def __init__(self, contract: Contract, block_identifier: BlockIdentifier):
+        self._contract = contract
+        self.functions = _PinnedContractFunctions(contract.functions, block_identifier=block_identifier)
+
+    def __getattr__(self, name: str):
+        return getattr(self._contract, name)
+
+
+class PinnedAgentView:
+    """
+    A contract agent whose methods read at `block_identifier`: they are run against a view of the agent's
+    contract that passes the block to every `.call()`. Neither the agent nor web3's default block is changed,
+    so nothing else sharing them is affected.
+    """
+
+    def __init__(self, agent, block_identifier: BlockIdentifier):
+        self._agent = agent
+        self._block_identifier = block_identifier
+
+    @property
+    def contract(self) -> _PinnedContract:
+        return _PinnedContract(self._agent.contract, block_identifier=self._block_identifier)
+
+    def __getattr__(self, name: str):
+        try:
+            attribute = inspect.getattr_static(type(self._agent), name)
+        except AttributeError:
+            attribute = None
+        if isinstance(attribute, types.FunctionType):
+            return types.MethodType(attribute, self)  # the method's own reads go through this view
+        return getattr(self._agent, name)
+
+
+def pinned_agent(agent, block_number: Optional[int]):
+    """`agent` reading at `block_number`, or as is when there is no block to pin"""
+    return agent if block_number is None else PinnedAgentView(agent, block_identifier=block_number)
+
+
+class BlockPinnedAgent:
+    """
+    Proxies a contract agent so that, while a block is pinned, its methods read at that block,
+    and its read methods are answered from a `BlockReadCache`.
+    Cached values are shared between callers, so they must not be mutated.
+    """
+
+    CACHED_METHODS = frozenset(('get_all_active_stakers',
+                                'get_all_stakes',
+                                'get_current_period',
+                                'get_global_locked_tokens',
+                                'get_last_committed_period',
+                                'get_locked_tokens',
+                                'get_worker_from_staker',
+                                'partition_stakers_by_activity'))
+
+    def __init__(self, agent, read_cache: BlockReadCache):
+        self._agent = agent
+        self._read_cache = read_cache
+
+    def __getattr__(self, name: str):
+        if name not in self.CACHED_METHODS:
+            return getattr(pinned_agent(self._agent, self._read_cache.pinned_block), name)
+
+        def cached_read(*args, **kwargs):
+            def read(block_number: Optional[int]):
+                value = getattr(pinned_agent(self._agent, block_number), name)(*args, **kwargs)
+                if isinstance(value, types.GeneratorType):
+                    value = list(value)  # eg. `get_all_stakes`; a cached generator is exhausted after one read
+                return value
+
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return self._read_cache.read(key, read)
+        return cached_read
+
+
+class BatchingNotSupported(RuntimeError):
+    """The node rejected a batch request, or answered it with something other than a list of responses"""
+
+
+class JSONRPCBatchTransport:
+    """
+    Posts a list of JSON-RPC requests as a single HTTP request.
+    Raises `BatchingNotSupported` when the endpoint answers with an HTTP error or anything but a list of responses.
+    """
+
+    def __init__(self, endpoint_uri: str, request_kwargs: dict = None):
+        self.endpoint_uri = endpoint_uri
+        self.request_kwargs = request_kwargs or {'headers': {'Content-Type': 'application/json'}}
+
+    @classmethod
+    def from_provider(cls, provider) -> Optional['JSONRPCBatchTransport']:
+        """Returns a transport sharing the provider's endpoint, or None if the provider can't batch (eg. IPC)"""
+        if not isinstance(provider, HTTPProvider):
+            return None
+        return cls(endpoint_uri=provider.endpoint_uri, request_kwargs=provider.get_request_kwargs())
+
+    def __call__(self, batch: List[dict]) -> List[dict]:
+        for request in batch:
+            RPC_REQUESTS.inc(method=request['method'])
+        response = requests.post(self.endpoint_uri, data=json.dumps(batch), **self.request_kwargs)
+        try:
+            response.raise_for_status()
+            responses = response.json()
+        except (requests.HTTPError, ValueError) as e:
+            raise BatchingNotSupported(e) from e  # eg. providers that only accept single requests
+        if not isinstance(responses, list):
+            raise BatchingNotSupported(responses)
+
+        methods = {request['id']: request['method'] for request in batch}
+        for rpc_response in responses:
+            if 'error' in rpc_response:
+                RPC_ERRORS.inc(method=methods.get(rpc_response.get('id'), 'unknown'))
+        return responses
+
+
+class ContractBatchReader:
+    """
+    Sends read-only contract calls as JSON-RPC batches of `eth_call`s, `chunk_size` calls per HTTP request.
+    Results are decoded the same way web3 decodes `contract.functions.<name>(...).call()`.
+    """
+
+    DEFAULT_CHUNK_SIZE = 100
+
+    def __init__(self, contract: Contract, transport: Transport, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if chunk_size < 1:
+            raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+        self.contract = contract
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self._request_ids = count()
+        self._output_types = dict()
+
+    def _function_output_types(self, fn_name: str, args: tuple) -> List[str]:
+        key = (fn_name, len(args))
+        if key not in self._output_types:
+            fn_abi = next((item for item in self.contract.abi
+                           if item.get('type') == 'function'
+                           and item['name'] == fn_name
+                           and len(item['inputs']) == len(args)), None)
+            if fn_abi is None:
+                raise ValueError(f"{self.contract.address} has no function {fn_name} taking {len(args)} argument(s)")
+            self._output_types[key] = [output['type'] for output in fn_abi['outputs']]
+        return self._output_types[key]
+
+    def _decode(self, fn_name: str, args: tuple, result: str):
+        output_types = self._function_output_types(fn_name, args)
+        values = self.contract.web3.codec.decode_abi(output_types, HexBytes(result))
+        values = [to_checksum_address(value) if output_type == 'address' else value
+                  for output_type, value in zip(output_types, values)]
+        return values[0] if len(values) == 1 else tuple(values)
+
+    def call(self, calls: Sequence[ContractCall], block_identifier: BlockIdentifier = 'latest') -> list:
+        """Returns the decoded result of each call, in order; raises ValueError for any call the node rejects"""
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+
+        results = list()
+        for start in range(0, len(calls), self.chunk_size):
+            chunk = calls[start:start + self.chunk_size]
+            batch = list()
+            for fn_name, args in chunk:
+                self._function_output_types(fn_name, args)  # fail on unknown functions before sending anything
+                data = self.contract.encodeABI(fn_name=fn_name, args=list(args))
+                batch.append({'jsonrpc': '2.0',
+                              'id': next(self._request_ids),
+                              'method': 'eth_call',
+                              'params': [{'to': self.contract.address, 'data': data}, block_identifier]})
+
+            responses = self.transport(batch)
+            if not isinstance(responses, list):
+                raise BatchingNotSupported(responses)
+
+            # responses may come back in any order
+            responses = {response.get('id'): response for response in responses}
+            for request, (fn_name, args) in zip(batch, chunk):
+                response = responses.get(request['id'])
+                if response is None:
+                    raise ValueError(f"No response to {fn_name}{args}")
+                if 'error' in response:
+                    raise ValueError(response['error'])
+                results.append(self._decode(fn_name, args, response['result']))
+
+        return results
+
+
+class StakerInfo(NamedTuple):
+    locked_tokens_current_period: int
+    locked_tokens_next_period: int
+    last_committed_period: Optional[int] = None
+    worker: Optional[ChecksumAddress] = None
+
+    @property
+    def expired(self) -> bool:
+        return self.locked_tokens_current_period == 0 and self.locked_tokens_next_period == 0
+
+
+class StakingEscrowBatchReader:
+    """
+    Per-staker StakingEscrow reads for many stakers at once.
+
+    Uses JSON-RPC batching when the agent's provider is HTTP based, otherwise (or if the node rejects batches)
+    falls back to the agent's one-call-at-a-time methods. Either way results have the same shape.
+    """
+
+    DEFAULT_CHUNK_SIZE = ContractBatchReader.DEFAULT_CHUNK_SIZE
+
+    def __init__(self,
+                 staking_agent: StakingEscrowAgent,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 transport: Transport = None,
+                 read_cache: BlockReadCache = None):
+        self.log = Logger(self.__class__.__name__)
+        self.staking_agent = staking_agent
+        self.read_cache = read_cache
+        if transport is None:
+            transport = JSONRPCBatchTransport.from_provider(staking_agent.blockchain.client.w3.provider)
+        self._batch_reader = None
+        if transport is not None:
+            self._batch_reader = ContractBatchReader(contract=staking_agent.contract,
+                                                     transport=transport,
+                                                     chunk_size=chunk_size)
+
+    @property
+    def batching(self) -> bool:
+        return self._batch_reader is not None
+
+    def _call(self, calls: List[ContractCall]) -> Optional[list]:
+        """Batched results, or None if batching is unavailable"""
+        if not self.batching:
+            return None
+
+        # only ask the node for reads not already made at the pinned block
+        cached, block_identifier = dict(), 'latest'
+        pinned_block = self.read_cache.pinned_block if self.read_cache is not None else None
+        if pinned_block is not None:
+            block_identifier = pinned_block
+            cached = self.read_cache.get_many(calls)
+        misses = list(OrderedDict.fromkeys(call for call in calls if call not in cached))
+
+        try:
+            results = self._batch_reader.call(misses, block_identifier=block_identifier)
+        except BatchingNotSupported as e:
+            self.log.warn(f"Provider does not support JSON-RPC batches ({e}); reading stakers one call at a time")
+            self._batch_reader = None
+            return None
+
+        values = dict(zip(misses, results))
+        if self.read_cache is not None:
+            self.read_cache.put_many(values, block_number=None if block_identifier == 'latest' else block_identifier)
+        values.update(cached)
+        return [values[call] for call in calls]
+
+    def get_stakers_info(self,
+                         staker_addresses: Iterable[ChecksumAddress],
+                         include_worker_info: bool = True) -> Dict[ChecksumAddress, StakerInfo]:
+        staker_addresses = list(staker_addresses)
+        if include_worker_info:
+            fn_names = ('getLockedTokens', 'getLockedTokens', 'getLastCommittedPeriod', 'getWorkerFromStaker')
+            fn_args = ((0,), (1,), (), ())
+        else:
+            fn_names = ('getLockedTokens', 'getLockedTokens')
+            fn_args = ((0,), (1,))
+        calls_per_staker = len(fn_names)
+
+        calls = [(fn_name, (staker_address, *args))
+                 for staker_address in staker_addresses
+                 for fn_name, args in zip(fn_names, fn_args)]
+        results = self._call(calls)
+        if results is not None:
+            return {staker_address: StakerInfo(*results[i * calls_per_staker:(i + 1) * calls_per_staker])
+                    for i, staker_address in enumerate(staker_addresses)}
+
+        pinned_block = self.read_cache.pinned_block if self.read_cache is not None else None
+        staking_agent = pinned_agent(self.staking_agent, pinned_block)
+        stakers_info = dict()
+        for staker_address in staker_addresses:
+            values = [staking_agent.get_locked_tokens(staker_address=staker_address),
+                      staking_agent.get_locked_tokens(staker_address=staker_address, periods=1)]
+            if include_worker_info:
+                values.append(staking_agent.get_last_committed_period(staker_address))
+                values.append(staking_agent.get_worker_from_staker(staker_address))
+            stakers_info[staker_address] = StakerInfo(*values)
+        return stakers_info
+
+    def get_expired_stakers(self, staker_addresses: Iterable[ChecksumAddress]) -> Set[ChecksumAddress]:
+        stakers_info = self.get_stakers_info(staker_addresses, include_worker_info=False)
+        return {staker_address for staker_address, info in stakers_info.items() if info.expired}
@@ -0,0 +1,421 @@
+import gzip
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+from flask import Flask, Request, Response
+from flask.json import JSONEncoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # only gzip is offered
+
+IDENTITY, GZIP, BROTLI = 'identity', 'gzip', 'br'
+
+NODE_DETAILS = 'node_details'  # {status -> [node, ...]}
+ROUND = 'round'  # collection round that produced the stats
+
+
+def serialize(data, pretty: bool = False) -> bytes:
+    """JSON encoded the same way as `flask.jsonify`, compact unless `pretty`"""
+    if pretty:
+        return json.dumps(data, cls=JSONEncoder, indent=2).encode() + b'\n'
+    return json.dumps(data, cls=JSONEncoder, separators=(',', ':')).encode()
+
+
+def project_stats(data: dict, fields: Optional[Tuple[str, ...]] = None, statuses: Optional[Tuple[str, ...]] = None) -> dict:
+    """
+    The selected top level `fields` of a stats document, with only the nodes of the given `statuses`.
+    Raises KeyError for fields the document doesn't have.
+    """
+    if fields:
+        unknown = [field for field in fields if field not in data]
+        if unknown:
+            raise KeyError(f"Unknown fields: {', '.join(unknown)}")
+        data = {field: data[field] for field in fields}
+    if statuses and isinstance(data.get(NODE_DETAILS), dict):
+        node_details = {status: nodes for status, nodes in data[NODE_DETAILS].items() if status.lower() in statuses}
+        data = dict(data, **{NODE_DETAILS: node_details})
+    return data
+
+
+def parse_list(value: Optional[str], lower: bool = False) -> Optional[Tuple[str, ...]]:
+    """Comma separated query parameter values, sorted so equivalent queries share projections"""
+    if not value:
+        return None
+    values = {item.strip().lower() if lower else item.strip() for item in value.split(',')}
+    return tuple(sorted(values - {''})) or None
+
+
+def iter_ndjson(nodes_by_status: dict, statuses: Optional[Tuple[str, ...]] = None) -> Iterator[bytes]:
+    """Nodes one JSON document per line, serialized as they are sent"""
+    for status, nodes in nodes_by_status.items():
+        if statuses and status.lower() not in statuses:
+            continue
+        for node in nodes:
+            yield serialize(node) + b'\n'
+
+
+def node_key(node) -> str:
+    """Identifies a node across snapshots: its staker address"""
+    if isinstance(node, dict) and 'staker_address' in node:
+        return node['staker_address']
+    return serialize(node).decode()
+
+
+def _nodes_by_key(nodes_by_status: Optional[dict]) -> Dict[str, Tuple[str, object]]:
+    return {node_key(node): (status, node) for status, nodes in (nodes_by_status or dict()).items() for node in nodes}
+
+
+def diff_stats(old: dict, new: dict) -> dict:
+    """
+    What changed from `old` to `new` stats: top level fields whose value changed or were removed, and
+    nodes added, changed (including moved to another status) or removed, so the size follows fleet churn.
+    """
+    changed = {field: value for field, value in new.items()
+               if field != NODE_DETAILS and (field not in old or old[field] != value)}
+    removed = sorted(field for field in old if field not in new)
+
+    old_nodes, new_nodes = _nodes_by_key(old.get(NODE_DETAILS)), _nodes_by_key(new.get(NODE_DETAILS))
+    added_nodes, changed_nodes = dict(), dict()
+    for key, (status, node) in new_nodes.items():
+        if key not in old_nodes:
+            added_nodes.setdefault(status, list()).append(node)
+        elif old_nodes[key] != (status, node):
+            changed_nodes.setdefault(status, list()).append(node)
+    removed_nodes = sorted(key for key in old_nodes if key not in new_nodes)
+
+    return {'changed': changed,
+            'removed': removed,
+            NODE_DETAILS: {'added': added_nodes, 'changed': changed_nodes, 'removed': removed_nodes}}
+
+
+def restored_stats(data: dict) -> dict:
+    """
+    Stats published by a previous crawler process, as served again until this one completes a round:
+    renumbered as round 0, flagged as restored, and with every node marked stale until it is seen again.
+    """
+    node_details = data.get(NODE_DETAILS)
+    if isinstance(node_details, dict):
+        node_details = {status: [dict(node, stale=1) if isinstance(node, dict) else node for node in nodes]
+                        for status, nodes in node_details.items()}
+    return dict(data, **{ROUND: 0, 'restored': True, NODE_DETAILS: node_details})
+
+
+class SerializedSnapshot:
+    """
+    A JSON document serialized and compressed once, then served as is to every request for it.
+    Responses carry a content hash ETag, so clients revalidating an unchanged document get a bodyless 304.
+    """
+
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5  # brotli's higher qualities cost far more time for little gain on JSON
+    MAX_PROJECTIONS = 32  # per snapshot; pollers tend to ask for the same few
+
+    def __init__(self, data):
+        self.data = data
+        self.body = serialize(data)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.encoded = {IDENTITY: self.body,
+                        GZIP: gzip.compress(self.body, compresslevel=self.GZIP_LEVEL)}
+        if brotli is not None:
+            self.encoded[BROTLI] = brotli.compress(self.body, quality=self.BROTLI_QUALITY)
+        self._projections_lock = threading.Lock()
+        self._projections = OrderedDict()  # (fields, statuses) -> SerializedSnapshot, least recently used first
+
+    def project(self,
+                fields: Optional[Tuple[str, ...]] = None,
+                statuses: Optional[Tuple[str, ...]] = None) -> 'SerializedSnapshot':
+        """A snapshot of part of this one (see `project_stats`), serialized once and shared by concurrent requests"""
+        if not fields and not statuses:
+            return self
+        key = (fields, statuses)
+        with self._projections_lock:
+            if key in self._projections:
+                self._projections.move_to_end(key)
+                return self._projections[key]
+
+        projection = SerializedSnapshot(project_stats(self.data, fields=fields, statuses=statuses))
+        with self._projections_lock:
+            self._projections[key] = projection
+            while len(self._projections) > self.MAX_PROJECTIONS:
+                self._projections.popitem(last=False)
+        return projection
+
+    def negotiate(self, request: Request) -> Tuple[str, bytes]:
+        """The smallest encoding the client accepts"""
+        accepted = [(encoding, body) for encoding, body in self.encoded.items()
+                    if encoding == IDENTITY or request.accept_encodings.quality(encoding) > 0]
+        return min(accepted, key=lambda encoded: len(encoded[1]))
+
+    def make_response(self, flask_server: Flask, request: Request) -> Response:
+        if request.if_none_match.contains_weak(self.etag):
+            response = flask_server.response_class(status=304)
+        else:
+            encoding, body = self.negotiate(request)
+            response = flask_server.response_class(response=body, status=200, mimetype='application/json')
+            if encoding != IDENTITY:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etag)
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+class StatsSnapshot(NamedTuple):
+    """The stats published by one collection round; neither it nor its data is modified once published"""
+    round: int
+    block_number: Optional[int]  # block the round's chain reads were pinned to
+    started: float  # epoch
+    duration: float  # seconds, including serialization
+    serialized: SerializedSnapshot
+
+    @property
+    def data(self) -> dict:
+        return self.serialized.data
+
+    @property
+    def size(self) -> int:
+        """Bytes held by the serialized and compressed copies, as an approximation of its footprint"""
+        return sum(len(body) for body in self.serialized.encoded.values())
+
+
+class SnapshotHistory:
+    """
+    The snapshots of the last few collection rounds, limited in count and size.
+
+    There is a single publisher, the collection round, and any number of readers. Publishing swaps in a new
+    tuple of snapshots, so readers never take a lock, never see a partly published round and keep using
+    the snapshot they got for as long as they need it. Deltas to the latest round are serialized once.
+    """
+
+    DEFAULT_SIZE = 10
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # the latest snapshot is always kept
+
+    def __init__(self, initial: StatsSnapshot, size: int = DEFAULT_SIZE, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._snapshots = (initial, )  # oldest first
+        self._deltas = dict()  # (since round, latest round) -> SerializedSnapshot
+
+    def publish(self, snapshot: StatsSnapshot) -> None:
+        snapshots = (self._snapshots + (snapshot, ))[-self.size:]
+        total_bytes = sum(kept.size for kept in snapshots)
+        while len(snapshots) > 1 and total_bytes > self.max_bytes:
+            total_bytes -= snapshots[0].size
+            snapshots = snapshots[1:]
+        self._snapshots, self._deltas = snapshots, dict()
+
+    @property
+    def latest(self) -> StatsSnapshot:
+        return self._snapshots[-1]
+
+    @property
+    def rounds(self) -> Tuple[int, ...]:
+        return tuple(snapshot.round for snapshot in self._snapshots)
+
+    def get(self, round_number: int) -> Optional[StatsSnapshot]:
+        for snapshot in self._snapshots:
+            if snapshot.round == round_number:
+                return snapshot
+        return None
+
+    def delta(self, since: int, etag: Optional[str] = None) -> SerializedSnapshot:
+        """
+        {"round", "etag", "since", "full": false, "changed", "removed", "node_details"} from round `since`
+        to the latest one; {"round", "etag", "full": true, "stats"} when that round is no longer (or never was)
+        kept. Round numbers restart with the process, so when `etag` is given a round `since` with another ETag
+        is not the client's and also gets the full stats. "etag" is the latest snapshot's.
+        """
+        deltas, snapshots = self._deltas, self._snapshots
+        latest = snapshots[-1]
+        old = next((snapshot for snapshot in snapshots
+                    if snapshot.round == since and etag in (None, snapshot.serialized.etag)), None)
+        key = (old.round if old is not None else None, latest.round)
+        delta = deltas.get(key)
+        if delta is not None:
+            return delta
+
+        if old is None:
+            delta = SerializedSnapshot({ROUND: latest.round, 'etag': latest.serialized.etag,
+                                        'full': True, 'stats': latest.data})
+        else:
+            changes = diff_stats(old.data, latest.data)
+            changes.update({ROUND: latest.round, 'etag': latest.serialized.etag, 'since': since, 'full': False})
+            delta = SerializedSnapshot(changes)
+        deltas[key] = delta  # dropped with the rest when the next round is published
+        return delta
+
+
+def _replace_file(filepath: str, chunks: Iterable[bytes]) -> None:
+    """
+    Writes `filepath` atomically: readers in other processes see either the previous file or the new one,
+    never a partly written one. Readers that still have the previous file open or mapped keep reading it.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_filepath = tempfile.mkstemp(dir=directory, prefix='.stats-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            for chunk in chunks:
+                temp_file.write(chunk)
+        os.chmod(temp_filepath, 0o644)  # mkstemp files are private to the writer
+        os.replace(temp_filepath, filepath)
+    except BaseException:
+        os.unlink(temp_filepath)
+        raise
+
+
+def write_snapshot_file(filepath: str, snapshot: SerializedSnapshot) -> None:
+    """Writes the serialized stats to `filepath`, replacing it atomically"""
+    _replace_file(filepath, chunks=(snapshot.body, ))
+
+
+class SnapshotFile:
+    """
+    The stats written by a crawler process to a snapshot file, as read by another process.
+    The file is only read again once replaced, so serving it costs a stat per request.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._version = None  # (inode, mtime, size) of the file read
+        self._snapshot = None
+
+    def current(self) -> Optional[SerializedSnapshot]:
+        """The latest snapshot written, None if there isn't one yet"""
+        try:
+            stat = os.stat(self.filepath)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version == self._version:
+            return self._snapshot
+        with self._lock:
+            if version != self._version:
+                with open(self.filepath, 'rb') as snapshot_file:
+                    body = snapshot_file.read()
+                self._snapshot, self._version = SerializedSnapshot(json.loads(body)), version
+        return self._snapshot
+
+
+#
+# Memory mapped snapshot file
+#
+# Little endian, laid out so readers can map the file and use it in place:
+#
+#   header          MAPPED_HEADER
+#   status table    status_count x (offset, length) of status names in the string table
+#   node records    node_count x MAPPED_NODE_RECORD, 8 byte aligned, grouped by status
+#   string table    utf-8, each distinct string stored once
+#   stats           compact JSON of the stats other than node details
+#
+
+MAPPED_MAGIC = b'NUMONSNP'
+MAPPED_FORMAT_VERSION = 1
+
+# magic, version, header size, round, block number (-1 if none), started (epoch), node count, status count,
+# then (offset, size) of the status table, node records, string table and stats
+MAPPED_HEADER = struct.Struct('<8sHHxxxxQqdII12Q')
+
+STRING_REF = ('<u4', (2, ))  # (offset, length) in the string table
+MAPPED_NODE_RECORD = np.dtype([('staker_address', 'S42'),
+                               ('status', '<u1'),  # index in the status table
+                               ('flags', '<u1'),
+                               ('missed_confirmations', '<i4'),
+                               ('change_seq', '<i8'),
+                               ('rest_url', STRING_REF),
+                               ('nickname', STRING_REF),
+                               ('timestamp', STRING_REF),
+                               ('last_seen', STRING_REF),
+                               ('fleet_state_icon', STRING_REF),
+                               ('uptime', STRING_REF),
+                               ('status_message', STRING_REF),
+                               ('color', STRING_REF)], align=True)
+MAPPED_STRING_FIELDS = ('rest_url', 'nickname', 'timestamp', 'last_seen', 'fleet_state_icon', 'uptime')
+
+# node record flags
+STALE, NEWBORN, UPTIME_KING = 1, 2, 4
+
+
+def _aligned(offset: int, alignment: int = 8) -> int:
+    return -(-offset // alignment) * alignment
+
+
+class _StringTable:
+    def __init__(self):
+        self.refs = dict()  # string -> (offset, length)
+        self.chunks = list()
+        self.size = 0
+
+    def add(self, value) -> Tuple[int, int]:
+        value = '' if value is None else str(value)
+        ref = self.refs.get(value)
+        if ref is None:
+            encoded = value.encode()
+            ref = self.refs[value] = (self.size, len(encoded))
+            self.chunks.append(encoded)
+            self.size += len(encoded)
+        return ref
+
+
+def encode_mapped_snapshot(snapshot: StatsSnapshot) -> Iterator[bytes]:
+    """The stats of a round in the memory mapped format (see MAPPED_HEADER), as chunks to write in order"""
+    nodes_by_status = snapshot.data.get(NODE_DETAILS) or dict()
+    strings = _StringTable()
+    statuses = list(nodes_by_status)
+    status_refs = np.array([strings.add(status) for status in statuses], dtype='<u4').reshape(-1, 2)
+
+    records = np.zeros(sum(len(nodes) for nodes in nodes_by_status.values()), dtype=MAPPED_NODE_RECORD)
+    index = 0
+    for status_index, nodes in enumerate(nodes_by_status.values()):
+        for node in nodes:
+            record = records[index]
+            node_status = node.get('status') or dict()
+            record['staker_address'] = node['staker_address'].encode()
+            record['status'] = status_index
+            record['flags'] = ((STALE if node.get('stale') else 0) |
+                               (NEWBORN if node.get('newborn') else 0) |
+                               (UPTIME_KING if node.get('uptime_king') else 0))
+            record['missed_confirmations'] = node_status.get('missed_confirmations', 0)
+            record['change_seq'] = node.get('change_seq') or 0
+            for field in MAPPED_STRING_FIELDS:
+                record[field] = strings.add(node.get(field))
+            record['status_message'] = strings.add(node_status.get('status'))
+            record['color'] = strings.add(node_status.get('color'))
+            index += 1
+
+    stats = serialize({field: value for field, value in snapshot.data.items() if field != NODE_DETAILS})
+
+    status_table_offset = MAPPED_HEADER.size
+    records_offset = _aligned(status_table_offset + status_refs.nbytes)
+    strings_offset = records_offset + records.nbytes
+    stats_offset = strings_offset + strings.size
+    yield MAPPED_HEADER.pack(MAPPED_MAGIC, MAPPED_FORMAT_VERSION, MAPPED_HEADER.size,
+                             snapshot.round,
+                             snapshot.block_number if snapshot.block_number is not None else -1,
+                             snapshot.started,
+                             len(records), len(statuses),
+                             status_table_offset, status_refs.nbytes,
+                             records_offset, records.nbytes,
+                             strings_offset, strings.size,
+                             stats_offset, len(stats),
+                             0, 0, 0, 0)  # reserved
+    yield status_refs.tobytes()
+    yield bytes(records_offset - status_table_offset - status_refs.nbytes)
+    yield records.tobytes()
+    yield from strings.chunks
+    yield stats
+
+
+def write_mapped_snapshot_file(filepath: str, snapshot: StatsSnapshot) -> None:
+    """Writes the stats of a round in the memory mapped format to `filepath`, replacing it atomically"""
+    _replace_file(filepath, chunks=encode_mapped_snapshot(snapshot))
+
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from eth_utils import encode_hex, function_abi_to_4byte_selector
+from flask import Flask, g, request
+
+UNKNOWN_CALLER = 'unknown'
+
+_callers = threading.local()
+
+
+@contextmanager
+def caller(name: str):
+    """Attributes RPC calls made by this thread to `name` (a collector or dashboard callback); innermost wins"""
+    previous = getattr(_callers, 'name', None)
+    _callers.name = name
+    try:
+        yield
+    finally:
+        _callers.name = previous
+
+
+def current_caller() -> str:
+    return getattr(_callers, 'name', None) or UNKNOWN_CALLER
+
+
+class TracedCall(NamedTuple):
+    caller: str
+    call: str  # eg. 'StakingEscrow.getLockedTokens', or the RPC method for non contract calls
+    fingerprint: str  # of the call's arguments, including the block; repeats are redundant reads
+    latency: float  # seconds
+    request_bytes: int
+    response_bytes: int
+    error: bool
+
+
+class CallStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.fingerprints = set()
+
+    def add(self, traced: TracedCall):
+        self.count += 1
+        self.errors += int(traced.error)
+        self.total_time += traced.latency
+        self.max_time = max(self.max_time, traced.latency)
+        self.request_bytes += traced.request_bytes
+        self.response_bytes += traced.response_bytes
+        self.fingerprints.add(traced.fingerprint)
+
+    def to_dict(self) -> dict:
+        return {'count': self.count,
+                'redundant': self.count - len(self.fingerprints),  # same call with the same arguments again
+                'errors': self.errors,
+                'total_time': round(self.total_time, 6),
+                'mean_time': round(self.total_time / self.count, 6) if self.count else 0,
+                'max_time': round(self.max_time, 6),
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes}
+
+
+class RPCTracer:
+    """
+    Records each JSON-RPC request made through web3 (and through JSON-RPC batch transports it wraps),
+    aggregated by calling collector or callback and by contract function.
+
+    Totals are kept since the tracer was created, and separately since the last `end_round()`.
+    """
+
+    SORT_KEYS = ('total_time', 'count', 'redundant', 'mean_time', 'max_time', 'response_bytes', 'errors')
+    DEFAULT_TOP = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._functions = dict()  # (contract address, selector) -> 'ContractName.function'
+        self._totals = dict()  # (caller, call) -> CallStats
+        self._round = dict()
+
+    def register_contract(self, name: str, contract) -> None:
+        """Names eth_calls to `contract` by the function called"""
+        address = contract.address.lower()
+        for item in contract.abi:
+            if item.get('type') == 'function':
+                selector = encode_hex(function_abi_to_4byte_selector(item))
+                self._functions[(address, selector)] = f"{name}.{item['name']}"
+
+    def register_agents(self, *agents) -> None:
+        for agent in agents:
+            name = getattr(agent, 'contract_name', None) or agent.__class__.__name__.replace('Agent', '')
+            self.register_contract(name=name, contract=agent.contract)
+
+    def _describe(self, method: str, params) -> Tuple[str, str]:
+        """Call name and arguments fingerprint of a request"""
+        call = method
+        if method == 'eth_call' and params and isinstance(params[0], dict):
+            to, data = str(params[0].get('to', '')).lower(), str(params[0].get('data', ''))
+            call = self._functions.get((to, data[:10]), f"eth_call {data[:10]}@{to[:10]}")
+        encoded = json.dumps(params, sort_keys=True, default=str)
+        return call, hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+    def record(self, method: str, params, latency: float, response=None, error: bool = False) -> TracedCall:
+        call, fingerprint = self._describe(method, params)
+        error = error or (isinstance(response, dict) and 'error' in response)
+        response_bytes = len(json.dumps(response, default=str)) if response is not None else 0
+        traced = TracedCall(caller=current_caller(),
+                            call=call,
+                            fingerprint=fingerprint,
+                            latency=latency,
+                            request_bytes=len(json.dumps(params, default=str)),
+                            response_bytes=response_bytes,
+                            error=error)
+        key = (traced.caller, traced.call)
+        with self._lock:
+            for stats in (self._totals, self._round):
+                stats.setdefault(key, CallStats()).add(traced)
+        return traced
+
+    def middleware(self, make_request, w3) -> Callable:
+        """web3 middleware; install it closest to the provider so requests are traced as sent"""
+        def middleware(method, params):
+            start = time.perf_counter()
+            try:
+                response = make_request(method, params)
+            except Exception:
+                self.record(method, params, latency=time.perf_counter() - start, error=True)
+                raise
+            self.record(method, params, latency=time.perf_counter() - start, response=response)
+            return response
+        return middleware
+
+    def install(self, w3) -> None:
+        """Traces `w3`'s requests; installing it more than once has no effect"""
+        if 'rpc_trace' not in w3.middleware_onion:
+            w3.middleware_onion.inject(self.middleware, name='rpc_trace', layer=0)
+
+    def wrap_transport(self, transport: Optional[Callable[[List[dict]], List[dict]]]):
+        """Traces the requests of a JSON-RPC batch transport; the batch's latency is split evenly between them"""
+        if transport is None:
+            return None
+
+        def traced_transport(batch: List[dict]) -> List[dict]:
+            start = time.perf_counter()
+            try:
+                responses = transport(batch)
+            except Exception:
+                for rpc_request in batch:
+                    self.record(rpc_request['method'], rpc_request['params'], latency=0, error=True)
+                raise
+            latency = (time.perf_counter() - start) / max(len(batch), 1)
+            by_id = {response.get('id'): response for response in responses} if isinstance(responses, list) else {}
+            for rpc_request in batch:
+                self.record(rpc_request['method'], rpc_request['params'],
+                            latency=latency, response=by_id.get(rpc_request['id']))
+            return responses
+        return traced_transport
+
+    @classmethod
+    def _top(cls, stats: Dict[Tuple[str, str], CallStats], top: int, sort: str) -> List[dict]:
+        if sort not in cls.SORT_KEYS:
+            raise ValueError(f"Unsupported sort key '{sort}', expected one of {cls.SORT_KEYS}")
+        rows = [dict(caller=caller_name, call=call, **call_stats.to_dict())
+                for (caller_name, call), call_stats in stats.items()]
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:top]
+
+    def summary(self, top: int = DEFAULT_TOP, sort: str = 'total_time') -> List[dict]:
+        """Top calls since the tracer was created"""
+        with self._lock:
+            return self._top(self._totals, top=top, sort=sort)
+
+    def end_round(self, top: int = DEFAULT_TOP, sort: str = 'total_time') -> List[dict]:
+        """Top calls since the previous round ended"""
+        with self._lock:
+            round_stats, self._round = self._round, dict()
+        return self._top(round_stats, top=top, sort=sort)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self._round.clear()
+
+
+def format_summary(rows: List[dict]) -> str:
+    """Plain text table of summary rows, for logs"""
+    lines = [f"{'caller':<32} {'call':<48} {'count':>6} {'redundant':>9} {'total s':>9} {'max s':>8} {'bytes':>9}"]
+    for row in rows:
+        lines.append(f"{row['caller'][:32]:<32} {row['call'][:48]:<48} {row['count']:>6} {row['redundant']:>9} "
+                     f"{row['total_time']:>9.3f} {row['max_time']:>8.3f} {row['response_bytes']:>9}")
+    return '\n'.join(lines)
+
+
+def attribute_flask_requests(flask_server: Flask) -> None:
+    """Attributes RPC calls made while handling a request to its dash callback output, or else its path"""
+    @flask_server.before_request
+    def set_rpc_trace_caller():
+        name = request.path
+        if request.path.endswith('_dash-update-component'):
+            body = request.get_json(silent=True) or dict()
+            name = f"callback {body.get('output', request.path)}"
+        g.rpc_trace_caller = caller(name)
+        g.rpc_trace_caller.__enter__()
+
+    @flask_server.teardown_request
+    def reset_rpc_trace_caller(exception):
+        rpc_trace_caller = g.pop('rpc_trace_caller', None)
+        if rpc_trace_caller is not None:
+            rpc_trace_caller.__exit__(None, None, None)
+
+
+def add_trace_endpoint(flask_server: Flask, tracer: RPCTracer) -> None:
+    """Serves the tracer's top calls at /rpc_trace, eg. /rpc_trace?top=20&sort=redundant"""
+    @flask_server.route('/rpc_trace', methods=['GET'])
+    def rpc_trace():
+        try:
+            rows = tracer.summary(top=int(request.args.get('top', RPCTracer.DEFAULT_TOP)),
+                                  sort=request.args.get('sort', 'total_time'))
+        except ValueError as e:
+            return flask_server.response_class(response=str(e), status=400, mimetype='text/plain')
+        return flask_server.response_class(response=json.dumps(rows), status=200, mimetype='application/json')
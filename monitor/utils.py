@@ -1,20 +1,35 @@
+import functools
+import time
+
 import click
-import maya
 from enum import Enum
 from nucypher.blockchain.eth.networks import NetworksInventory
 from twisted.internet import defer
 from twisted.internet.task import LoopingCall
 
+from monitor.metrics import COLLECTOR_DURATION, COLLECTOR_LAST_RUN, COLLECTOR_RUNS
+from monitor.tracing import caller
+
 
 def collector(label: str):
+    """Times each measurement into the metrics registry, and attributes its RPC calls, labelled with `label`"""
     def decorator(func):
+        @functools.wraps(func)
         def wrapped(*args, **kwargs):
-            start = maya.now()
-            result = func(*args, **kwargs)
-            end = maya.now()
-            delta = end - start
-            duration = f"{delta.total_seconds() or delta.microseconds}s"
-            click.secho(f"✓ ... {label} [{duration}]", color='blue')
+            start = time.perf_counter()
+            try:
+                with caller(label):
+                    result = func(*args, **kwargs)
+            except Exception:
+                COLLECTOR_RUNS.inc(collector=label, result='error')
+                raise
+            else:
+                COLLECTOR_RUNS.inc(collector=label, result='success')
+            finally:
+                duration = time.perf_counter() - start
+                COLLECTOR_DURATION.observe(duration, collector=label)
+                COLLECTOR_LAST_RUN.set_to_current_time(collector=label)
+            click.secho(f"✓ ... {label} [{duration:.3f}s]", color='blue')
             return result
         return wrapped
     return decorator
@@ -0,0 +1,50 @@
+"""
+Compares CrawlerStorage write throughput for a fleet state diff against the previous
+connection-per-row behaviour.
+
+    $ python -m tests.benchmarks.bench_crawler_storage --nodes 5000
+"""
+import sqlite3
+import tempfile
+import time
+
+import click
+from monitor.crawler import CrawlerStorage
+from tests.utilities import create_random_mock_node_status, create_specific_mock_state
+
+
+def store_rows_connection_per_row(db_filepath: str, node_rows: list):
+    # previous behaviour: a new connection and a commit (fsync) for every node
+    for change_seq, db_row in enumerate(node_rows, start=1):
+        with sqlite3.connect(db_filepath) as db_conn:
+            db_conn.execute(CrawlerStorage.NODE_REPLACE_SQL, db_row + (change_seq,))
+
+
+@click.command()
+@click.option('--nodes', help="Number of node statuses in the fleet state diff", type=click.INT, default=2000)
+def benchmark(nodes):
+    node_statuses = [create_random_mock_node_status() for _ in range(nodes)]
+    node_rows = [CrawlerStorage._node_status_row(node_status) for node_status in node_statuses]
+    state = create_specific_mock_state()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        node_storage = CrawlerStorage(db_filepath=f'{temp_dir}/before.sqlite')
+        node_storage.close()
+        start = time.perf_counter()
+        store_rows_connection_per_row(node_storage.db_filepath, node_rows)
+        before = time.perf_counter() - start
+
+        node_storage = CrawlerStorage(db_filepath=f'{temp_dir}/after.sqlite')
+        start = time.perf_counter()
+        node_storage.store_fleet_state_diff(state=state,
+                                            updated_node_statuses=node_statuses,
+                                            removed_checksum_addresses=[])
+        after = time.perf_counter() - start
+        node_storage.close()
+
+    click.echo(f"connection per row:  {nodes / before:>12,.0f} rows/s ({before:.3f}s)")
+    click.echo(f"batched transaction: {nodes / after:>12,.0f} rows/s ({after:.3f}s)")
+
+
+if __name__ == '__main__':
+    benchmark()
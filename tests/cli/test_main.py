@@ -4,7 +4,8 @@ import monitor
 import nucypher
 import pytest
 from click.testing import CliRunner
-from monitor.cli.main import monitor as monitor_cli, MONITOR_BANNER, DASHBOARD
+from monitor.cli.main import monitor as monitor_cli, MONITOR_BANNER, CRAWLER, DASHBOARD
+from monitor.crawler import Crawler
 from nucypher.blockchain.eth.agents import StakingEscrowAgent
 from tests.utilities import MockContractAgency
 
@@ -31,22 +32,40 @@ def test_monitor_help_message(click_runner):
         assert sub_command.name in result.output, f"Sub command {sub_command.name} in help message"
 
 
-def test_monitor_sub_command_help_messages(click_runner):
-    command_name = 'dashboard' # only dashboard command
+@pytest.mark.parametrize('command_name', ('crawl', 'dashboard'))
+def test_monitor_sub_command_help_messages(click_runner, command_name):
     result = click_runner.invoke(monitor_cli, (command_name, '--help'), catch_exceptions=False)
     assert result.exit_code == 0
     assert f'{monitor_cli.name} {command_name} [OPTIONS]' in result.output, \
         f"Sub command {command_name} has valid help text."
 
 
-# TODO fix test
-@pytest.mark.skip('not working and longer used')
-def test_monitor_crawl_run(click_runner):
-    crawl_args = ('crawl', '--dry-run', '--provider', 'tester://pyevm')
+@patch.object(monitor.cli.main, 'Crawler', autospec=True)
+@patch.object(monitor.cli.main, '_get_registry', autospec=True)
+@patch.object(monitor.cli.main.BlockchainInterfaceFactory, 'initialize_interface', autospec=True)
+def test_monitor_crawl_run(init_interface, get_registry, crawler_class, click_runner, tempfile_path):
+    crawler_class.return_value._refresh_rate = Crawler.DEFAULT_REFRESH_RATE
+    crawl_args = ('crawl',
+                  '--dry-run',
+                  '--provider', 'tester://pyevm',
+                  '--network', 'ibex',
+                  '--stats-filepath', tempfile_path,
+                  '--storage-write-behind',
+                  '--rpc-batch-size', '50',
+                  '--collector-threads', '8')
     result = click_runner.invoke(monitor_cli, crawl_args, catch_exceptions=False)
     assert MONITOR_BANNER.format(CRAWLER) in result.output
     assert result.exit_code == 0
 
+    init_interface.assert_called_once_with(provider_uri='tester://pyevm')
+    _, kwargs = crawler_class.call_args
+    assert kwargs['registry'] is get_registry.return_value
+    assert kwargs['stats_filepath'] == tempfile_path  # handed to the dashboard
+    assert kwargs['storage_write_behind'] is True
+    assert kwargs['rpc_batch_size'] == 50
+    assert kwargs['collector_threads'] == 8
+    crawler_class.return_value.start.assert_not_called()
+
 
 # TODO fix test
 @pytest.mark.skip('not working')
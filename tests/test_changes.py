@@ -0,0 +1,56 @@
+from unittest.mock import MagicMock
+
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+
+from monitor.changes import ChangeDetector, ALL_INPUTS, BLOCK, PERIOD, STAKING, STORAGE
+
+
+def create_detector(watch_logs: bool = True):
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.contract_address = '0xStakingEscrow'
+    get_logs = staking_agent.blockchain.client.w3.eth.getLogs
+    get_logs.return_value = []
+    storage_version = MagicMock(return_value=1)
+    detector = ChangeDetector(staking_agent=staking_agent, storage_version=storage_version, watch_logs=watch_logs)
+    return detector, get_logs, storage_version
+
+
+def test_change_detector():
+    detector, get_logs, storage_version = create_detector()
+
+    assert detector.poll(block_number=100, period=10) == ALL_INPUTS
+    assert detector.poll(block_number=100, period=10) == frozenset()
+    get_logs.assert_not_called()
+
+    # new blocks without StakingEscrow events
+    assert detector.poll(block_number=103, period=10) == {BLOCK}
+    get_logs.assert_called_once_with({'address': '0xStakingEscrow', 'fromBlock': 101, 'toBlock': 103})
+
+    assert detector.changed_stakers == frozenset()
+
+    staker = to_checksum_address('0x' + 'aa' * 20)
+    staker_topic = HexBytes(bytes(12) + bytes.fromhex('aa' * 20))
+    get_logs.return_value = [{'event': 'Prolonged', 'topics': [HexBytes(b'\x01' * 32), staker_topic]},
+                             {'event': 'Initialized', 'topics': [HexBytes(b'\x02' * 32)]}]
+    assert detector.poll(block_number=104, period=11) == {BLOCK, STAKING, PERIOD}
+    assert detector.changed_stakers == {staker}
+
+    storage_version.return_value = 2
+    assert detector.poll(block_number=104, period=11) == {STORAGE}
+    assert detector.last_block_number == 104
+
+
+def test_change_detector_without_logs():
+    detector, get_logs, _ = create_detector(watch_logs=False)
+    detector.poll(block_number=100, period=10)
+    assert detector.poll(block_number=101, period=10) == {BLOCK, STAKING}
+    assert detector.changed_stakers is None  # any staker may have changed
+    get_logs.assert_not_called()
+
+    # failing to get logs is treated as a change
+    detector, get_logs, _ = create_detector()
+    detector.poll(block_number=100, period=10)
+    get_logs.side_effect = ValueError('query returned more than 10000 results')
+    assert detector.poll(block_number=200, period=10) == {BLOCK, STAKING}
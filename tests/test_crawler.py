@@ -1,14 +1,25 @@
+import json
 import os
 import sqlite3
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import maya
 import monitor
+import numpy as np
 import pytest
+from monitor.changes import BLOCK, ChangeDetector, PERIOD, STAKING, STORAGE
 from monitor.crawler import CrawlerStorage, Crawler
-from monitor.db import CrawlerStorageClient
+from monitor.db import CrawlerStorageClient, KnownNodesColumns, NodeChanges
+from monitor.events import StatsEventResource
+from monitor.indexer import StakingEscrowIndexer
+from monitor.metrics import NOOP_ROUNDS, ROUNDS, STORAGE_COMMITS
+from monitor.rpc import StakerInfo
+from monitor.snapshots import SerializedSnapshot, write_snapshot_file
 from nucypher.blockchain.economics import StandardTokenEconomics
 from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from nucypher.blockchain.eth.constants import NULL_ADDRESS
 from nucypher.blockchain.eth.registry import InMemoryContractRegistry
 from nucypher.blockchain.eth.token import NU
 from nucypher.blockchain.eth.utils import datetime_to_period
@@ -16,11 +27,14 @@ from nucypher.network.middleware import RestMiddleware
 from tests.utilities import (
     create_random_mock_node,
     create_random_mock_node_status,
+    create_random_mock_state,
     create_specific_mock_state,
     MockContractAgency)
 
 IN_MEMORY_FILEPATH = ':memory:'
-DB_TABLES = [CrawlerStorage.NODE_DB_NAME, CrawlerStorage.STATE_DB_NAME, CrawlerStorage.TEACHER_DB_NAME]
+DB_TABLES = [CrawlerStorage.NODE_DB_NAME, CrawlerStorage.NODE_TOMBSTONE_DB_NAME,
+             CrawlerStorage.STATE_DB_NAME, CrawlerStorage.TEACHER_DB_NAME,
+             CrawlerStorage.INDEXER_CURSOR_DB_NAME, CrawlerStorage.STAKER_STATE_DB_NAME]
 
 
 #
@@ -100,6 +114,212 @@ def test_storage_store_fleet_state(sqlite_connection):
         verify_mock_state_matches_row(updated_state, row)
 
 
+def test_storage_store_fleet_state_diff(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH)
+
+    removed_node = create_random_mock_node_status()
+    node_storage.store_node_status(removed_node)
+
+    state = create_specific_mock_state()
+    updated_nodes = [create_random_mock_node_status() for _ in range(5)]
+
+    # Store whole diff
+    node_storage.store_fleet_state_diff(state=state,
+                                        updated_node_statuses=updated_nodes,
+                                        removed_checksum_addresses=[removed_node.staker_address])
+
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.STATE_DB_NAME}").fetchall()
+    assert len(result) == 1
+    verify_mock_state_matches_row(state, result[0])
+
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME} "
+                                       f"ORDER BY staker_address").fetchall()
+    assert len(result) == len(updated_nodes)  # removed node is gone
+    updated_nodes.sort(key=lambda x: x.staker_address)
+    for node_status, row in zip(updated_nodes, result):
+        verify_mock_node_matches(node_status, row)
+
+
+def test_storage_single_connection(tempfile_path):
+    with patch.object(sqlite3, 'connect', wraps=sqlite3.connect) as connect:
+        node_storage = CrawlerStorage(db_filepath=tempfile_path)
+        node_storage.store_node_status(create_random_mock_node_status())
+        node_storage.store_fleet_state(create_specific_mock_state())
+        node_storage.store_current_teacher(teacher_checksum='0x123456789')
+        assert connect.call_count == 1  # connection is reused for all writes
+
+    journal_mode = node_storage._db_conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode.upper() == CrawlerStorage.JOURNAL_MODE
+
+
+def test_storage_write_behind_coalescing(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, write_behind=True, flush_interval=60)
+    try:
+        node_status = create_random_mock_node_status()
+        other_node_status = create_random_mock_node_status()
+
+        # same staker updated repeatedly
+        node_storage.store_node_status(node_status)
+        node_storage.store_node_status(node_status._replace(timestamp=node_status.timestamp.add(hours=1)))
+        updated_node = node_status._replace(timestamp=node_status.timestamp.add(hours=2))
+        node_storage.store_node_status(updated_node)
+        node_storage.store_node_status(other_node_status)
+        node_storage.remove_node_status(other_node_status.staker_address)
+
+        assert node_storage.write_behind_stats == {'queued': 5, 'coalesced': 3, 'flushed': 0, 'pending': 2}
+
+        # nothing written yet
+        db_conn = sqlite3.connect(tempfile_path)
+        result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+        assert len(result) == 0
+
+        node_storage.flush()
+        assert node_storage.write_behind_stats == {'queued': 5, 'coalesced': 3, 'flushed': 2, 'pending': 0}
+
+        result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+        assert len(result) == 1  # latest update of first node; other node removed
+        verify_mock_node_matches(updated_node, result[0])
+        db_conn.close()
+    finally:
+        node_storage.close()
+
+
+def test_storage_write_behind_concurrent_flushes_commit_in_order(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, write_behind=True, flush_interval=60)
+    commit = node_storage._commit
+    committing = threading.Event()
+
+    def slow_commit(**rows):
+        if not committing.is_set():
+            committing.set()
+            time.sleep(0.2)  # the older batch is still being committed when the newer one is flushed
+        return commit(**rows)
+
+    try:
+        node_status = create_random_mock_node_status()
+        newer_node_status = node_status._replace(timestamp=node_status.timestamp.add(hours=1))
+        node_storage.store_node_status(node_status)
+        with patch.object(node_storage, '_commit', side_effect=slow_commit):
+            older_flush = threading.Thread(target=node_storage.flush)
+            older_flush.start()
+            assert committing.wait(timeout=5)
+            node_storage.store_node_status(newer_node_status)
+            node_storage.flush()
+            older_flush.join()
+
+        db_conn = sqlite3.connect(tempfile_path)
+        result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+        assert len(result) == 1
+        verify_mock_node_matches(newer_node_status, result[0])
+        db_conn.close()
+    finally:
+        node_storage.close()
+
+
+def test_storage_write_behind_retries_failed_flushes(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, write_behind=True, flush_size=1, flush_interval=0.1)
+    commit = node_storage._commit
+    failed = threading.Event()
+
+    def failing_commit(**rows):
+        if not failed.is_set():
+            failed.set()
+            raise sqlite3.OperationalError('database is locked')
+        return commit(**rows)
+
+    try:
+        node_status = create_random_mock_node_status()
+        with patch.object(node_storage, '_commit', side_effect=failing_commit):
+            node_storage.store_node_status(node_status)
+            assert failed.wait(timeout=5)
+
+            # the writer thread survives, and writes the batch once the db is writable again
+            for _ in range(100):
+                if node_storage.flushed_rows == 1:
+                    break
+                time.sleep(0.05)
+        assert node_storage._writer.is_alive()
+        assert node_storage.write_behind_stats == {'queued': 1, 'coalesced': 0, 'flushed': 1, 'pending': 0}
+
+        db_conn = sqlite3.connect(tempfile_path)
+        result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+        assert len(result) == 1
+        verify_mock_node_matches(node_status, result[0])
+        db_conn.close()
+    finally:
+        node_storage.close()
+
+
+def test_storage_write_behind_flush_on_size_and_close(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, write_behind=True, flush_size=3, flush_interval=60)
+    node_statuses = [create_random_mock_node_status() for _ in range(4)]
+    for node_status in node_statuses[:3]:
+        node_storage.store_node_status(node_status)
+
+    # size threshold reached - writer thread flushes
+    for _ in range(100):
+        if node_storage.flushed_rows == 3:
+            break
+        time.sleep(0.05)
+    assert node_storage.flushed_rows == 3
+
+    # remaining row is flushed on shutdown
+    node_storage.store_node_status(node_statuses[3])
+    node_storage.store_current_teacher(teacher_checksum='0x123456789')
+    node_storage.close()
+    assert node_storage.write_behind_stats == {'queued': 5, 'coalesced': 0, 'flushed': 5, 'pending': 0}
+
+    db_conn = sqlite3.connect(tempfile_path)
+    result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+    assert len(result) == len(node_statuses)
+    verify_current_teacher(db_conn, '0x123456789')
+    db_conn.close()
+
+
+def test_storage_fleet_state_retention(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH, state_max_rows=3, state_max_age=60 * 60)
+
+    now = maya.now()
+    states = [create_random_mock_state(seed=i)._replace(timestamp=now.subtract(minutes=10 * i)) for i in range(8)]
+    for state in states:
+        node_storage.store_fleet_state(state)
+
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.STATE_DB_NAME}").fetchall()
+    assert len(result) == len(states)  # compaction not yet triggered
+
+    # max age: states older than an hour are removed
+    node_storage.state_max_rows = None
+    node_storage.compact_fleet_states(now=now.epoch)
+    result = sqlite_connection.execute(f"SELECT updated FROM {CrawlerStorage.STATE_DB_NAME}").fetchall()
+    assert len(result) == 7
+    assert all(row[0] >= now.subtract(hours=1).epoch for row in result)
+
+    # max rows: only the most recent states are kept
+    node_storage.state_max_rows = 3
+    node_storage.compact_fleet_states(now=now.epoch)
+    result = sqlite_connection.execute(f"SELECT updated FROM {CrawlerStorage.STATE_DB_NAME} "
+                                       f"ORDER BY updated DESC").fetchall()
+    assert [row[0] for row in result] == [state.timestamp.epoch for state in states[:3]]
+
+
+def test_storage_fleet_state_compaction_interval(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH, state_max_rows=5)
+    now = maya.now()
+    for i in range(CrawlerStorage.STATE_COMPACTION_INTERVAL):
+        state = create_random_mock_state(seed=i)._replace(timestamp=now.subtract(seconds=i))
+        node_storage.store_fleet_state(state)
+
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.STATE_DB_NAME}").fetchall()
+    assert len(result) == 5  # compacted periodically
+
+
+def test_storage_fleet_state_query_uses_index(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH)
+    plan = sqlite_connection.execute(f"EXPLAIN QUERY PLAN SELECT * FROM {CrawlerStorage.STATE_DB_NAME} "
+                                     f"ORDER BY updated DESC LIMIT 20").fetchall()
+    assert 'USING INDEX' in ' '.join(str(row[-1]) for row in plan)
+
+
 def test_storage_store_current_retrieval(sqlite_connection):
     node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH)
 
@@ -124,11 +344,111 @@ def test_storage_deletion(tempfile_path):
     assert not os.path.exists(tempfile_path)  # db file deleted
 
 
+def test_storage_warm_restart(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    assert not node_storage.restored  # no previous schema
+
+    node_status = create_random_mock_node_status()
+    state = create_specific_mock_state()
+    node_storage.store_node_status(node_status)
+    node_storage.store_fleet_state(state)
+    node_storage.store_current_teacher(teacher_checksum='0x123456789')
+    del node_storage
+
+    assert os.path.exists(tempfile_path)  # db file kept
+
+    # restart
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    assert node_storage.restored
+
+    db_conn = sqlite3.connect(tempfile_path)
+    result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+    assert len(result) == 1
+    assert result[0][0] == node_status.staker_address
+    assert result[0][6] == 1, 'restored node is stale'
+    assert result[0][7] == 2, 'marking as stale is a change'
+
+    result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.STATE_DB_NAME}").fetchall()
+    assert len(result) == 1
+    verify_mock_state_matches_row(state, result[0])
+    verify_current_teacher(db_conn, '0x123456789')
+
+    # node seen again
+    node_storage.store_node_status(node_status)
+    result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+    verify_mock_node_matches(node_status, result[0])
+    assert result[0][7] == 3, 'change sequence continues after restart'
+    db_conn.close()
+
+
+def test_storage_change_seq_and_tombstones(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH)
+
+    node_1 = create_random_mock_node_status()
+    node_2 = create_random_mock_node_status()
+    node_storage.store_node_status(node_1)
+    node_storage.store_node_status(node_2)
+    node_storage.store_node_status(node_1)  # update
+    node_storage.remove_node_status(node_2.staker_address)
+
+    result = sqlite_connection.execute(f"SELECT staker_address, change_seq FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+    assert result == [(node_1.staker_address, 3)]
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.NODE_TOMBSTONE_DB_NAME}").fetchall()
+    assert result == [(node_2.staker_address, 4)]
+
+    # re-added node no longer has a tombstone
+    node_storage.store_node_status(node_2)
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.NODE_TOMBSTONE_DB_NAME}").fetchall()
+    assert len(result) == 0
+    result = sqlite_connection.execute(f"SELECT change_seq FROM {CrawlerStorage.NODE_DB_NAME} "
+                                       f"WHERE staker_address = ?", (node_2.staker_address,)).fetchone()
+    assert result[0] == 5
+
+
+def test_storage_warm_restart_schema_mismatch(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    node_storage.store_node_status(create_random_mock_node_status())
+    node_storage._db_conn.execute(f"PRAGMA user_version = {CrawlerStorage.SCHEMA_VERSION + 1}")
+    del node_storage
+
+    node_storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    assert not node_storage.restored
+
+    db_conn = sqlite3.connect(tempfile_path)
+    result = db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+    assert len(result) == 0  # recreated
+    db_conn.close()
+
+
+def test_storage_store_staker_updates(sqlite_connection):
+    node_storage = CrawlerStorage(db_filepath=IN_MEMORY_FILEPATH)
+    assert node_storage.get_indexer_cursor('staking_escrow') is None
+
+    node_storage.store_staker_updates('staking_escrow', block_number=100, staker_updates={
+        '0xStaker1': {'worker': '0xWorker1', 'last_committed_period': 10, 'first_block': 5, 'updated_block': 50},
+        '0xStaker2': {'first_block': 60, 'updated_block': 60}})
+    assert node_storage.get_indexer_cursor('staking_escrow') == 100
+    assert node_storage.get_indexer_cursor('other') is None
+
+    # updates are merged into the existing state
+    node_storage.store_staker_updates('staking_escrow', block_number=200, staker_updates={
+        '0xStaker1': {'last_committed_period': 9, 'first_block': 150, 'updated_block': 150},
+        '0xStaker2': {'worker': '0xWorker2', 'last_committed_period': 11, 'first_block': 160, 'updated_block': 160},
+        '0xStaker3': {'worker': '0xWorker3'}})  # missing keys, also for a new staker
+    assert node_storage.get_indexer_cursor('staking_escrow') == 200
+
+    result = sqlite_connection.execute(f"SELECT * FROM {CrawlerStorage.STAKER_STATE_DB_NAME} "
+                                       f"ORDER BY staker_address").fetchall()
+    assert result == [('0xStaker1', '0xWorker1', 10, 5, 150),
+                      ('0xStaker2', '0xWorker2', 11, 60, 160),
+                      ('0xStaker3', '0xWorker3', None, None, None)]
+
+
 #
 # Crawler tests.
 #
 
-def create_crawler(db_filepath: str = IN_MEMORY_FILEPATH):
+def create_crawler(db_filepath: str = IN_MEMORY_FILEPATH, **kwargs):
     registry = InMemoryContractRegistry()
     middleware = RestMiddleware()
     crawler = Crawler(domain='ibex',  # TODO: Needs Cleanup
@@ -136,11 +456,27 @@ def create_crawler(db_filepath: str = IN_MEMORY_FILEPATH):
                       registry=registry,
                       start_learning_now=True,
                       learn_on_same_thread=False,
-                      db_filepath=db_filepath
+                      db_filepath=db_filepath,
+                      **kwargs
                       )
     return crawler
 
 
+def known_nodes_columns(timestamps: dict) -> KnownNodesColumns:
+    """Node table columns, as read by `CrawlerStorageClient`, of nodes with the given epoch timestamps"""
+    checksum_addresses = tuple(sorted(timestamps))
+    n = len(checksum_addresses)
+    return KnownNodesColumns(staker_address=np.zeros((n, 20), dtype=np.uint8),
+                             checksum_address=checksum_addresses,
+                             rest_url=('https://127.0.0.1:9151',) * n,
+                             nickname=('',) * n,
+                             timestamp=np.array([timestamps[address] for address in checksum_addresses]),
+                             last_seen=np.full(n, np.nan),
+                             fleet_state_icon=np.zeros(n, dtype=np.int64),
+                             fleet_state_icons=('?',),
+                             stale=np.zeros(n, dtype=bool))
+
+
 @patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
 @patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
 def test_crawler_init(get_agent, get_economics):
@@ -173,6 +509,398 @@ def test_crawler_stop_before_start(get_agent, get_economics):
     assert not crawler.is_running
 
 
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_warm_restart_serves_last_stats(get_agent, get_economics, tmpdir):
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+    get_economics.return_value = StandardTokenEconomics()
+    db_filepath = str(tmpdir.join('crawler.sqlite'))
+
+    # first run, no stats yet
+    crawler = create_crawler(db_filepath=db_filepath, persistent_storage=True)
+    assert crawler.stats == {'status': 'initializing'}
+    last_stats = {'round': 42, 'blocknumber': 1234, 'activity': {'active': 1},
+                  'node_details': {'confirmed': [{'staker_address': '0xA', 'stale': 0}]}}
+    write_snapshot_file(f'{db_filepath}-stats.json', SerializedSnapshot(last_stats))  # as each round does
+    del crawler
+
+    # restart: the last stats are served before any round, with their nodes marked stale
+    crawler = create_crawler(db_filepath=db_filepath, persistent_storage=True)
+    assert crawler.stats == {'round': 0, 'restored': True, 'blocknumber': 1234, 'activity': {'active': 1},
+                             'node_details': {'confirmed': [{'staker_address': '0xA', 'stale': 1}]}}
+    assert type(crawler.stats['node_details']['confirmed'][0]['stale']) is int  # same type as the live stats
+    assert crawler._stats_history.latest.block_number == 1234
+    crawler.make_flask_server()
+    assert crawler._flask.test_client().get('/stats').get_json()['activity'] == {'active': 1}
+
+
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_metrics_endpoint(get_agent, get_economics):
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+    get_economics.return_value = StandardTokenEconomics()
+
+    crawler = create_crawler()
+    crawler.make_flask_server()
+    commits = STORAGE_COMMITS.value()
+    crawler._Crawler__storage.store_current_teacher(teacher_checksum='0x123456789')
+    assert STORAGE_COMMITS.value() == commits + 1
+
+    response = crawler._flask.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert f'monitor_storage_commits_total {commits + 1}' in body
+    assert '# TYPE monitor_round_duration_seconds histogram' in body
+
+
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_refresh_known_nodes_incrementally(get_agent, get_economics):
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+    get_economics.return_value = StandardTokenEconomics()
+
+    crawler = create_crawler()
+    crawler._crawler_client = MagicMock(spec=CrawlerStorageClient)
+
+    timestamp = maya.now().iso8601()
+    crawler._crawler_client.get_known_nodes_changes.return_value = NodeChanges(
+        updated={'0xB': {'staker_address': '0xB', 'timestamp': timestamp},
+                 '0xA': {'staker_address': '0xA', 'timestamp': timestamp}},
+        removed=[],
+        last_seq=2)
+    known_nodes = crawler._refresh_known_nodes_metadata()
+    assert list(known_nodes) == ['0xA', '0xB']  # ordered by staker address
+    crawler._crawler_client.get_known_nodes_changes.assert_called_with(since_seq=0)
+
+    known_nodes['0xA']['status'] = 'annotated'  # per-round copy
+
+    crawler._crawler_client.get_known_nodes_changes.return_value = NodeChanges(
+        updated={'0xC': {'staker_address': '0xC', 'timestamp': timestamp}}, removed=['0xB'], last_seq=4)
+    known_nodes = crawler._refresh_known_nodes_metadata()
+    assert list(known_nodes) == ['0xA', '0xC']
+    assert 'status' not in known_nodes['0xA']
+    crawler._crawler_client.get_known_nodes_changes.assert_called_with(since_seq=2)
+
+
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_measure_known_nodes(get_agent, get_economics):
+    token_economics = StandardTokenEconomics()
+    get_economics.return_value = token_economics
+    current_period = datetime_to_period(datetime=maya.now(), seconds_per_period=token_economics.seconds_per_period)
+
+    now = maya.now()
+    nodes = {  # staker -> (last committed period, hours up, expired, headless)
+        '0xA': (current_period + 1, 5, False, False),   # confirmed
+        '0xB': (current_period + 1, 50, False, False),  # confirmed, longest uptime
+        '0xC': (current_period + 1, 1, False, False),   # confirmed, shortest uptime
+        '0xD': (current_period, 3, False, False),       # pending
+        '0xE': (0, 3, False, False),                    # idle
+        '0xF': (current_period - 3, 3, False, False),   # unconfirmed
+        '0xG': (current_period + 1, 3, True, False),    # expired
+        '0xH': (current_period + 1, 3, False, True),    # headless
+    }
+
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.get_locked_tokens.side_effect = lambda staker_address, periods=0: 0 if nodes[staker_address][2] else 1
+    staking_agent.get_last_committed_period.side_effect = lambda staker_address: nodes[staker_address][0]
+    staking_agent.get_worker_from_staker.side_effect = lambda staker_address: NULL_ADDRESS if nodes[staker_address][3] else '0xW'
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+
+    crawler = create_crawler()
+    crawler._crawler_client = MagicMock(spec=CrawlerStorageClient)
+    crawler._crawler_client.get_known_nodes_changes.return_value = NodeChanges(
+        updated={staker_address: {'staker_address': staker_address,
+                                  'timestamp': now.subtract(hours=hours_up, minutes=30).iso8601()}
+                 for staker_address, (_, hours_up, _, _) in nodes.items()},
+        removed=[],
+        last_seq=len(nodes))
+    crawler._crawler_client.get_known_nodes_columns.return_value = known_nodes_columns(
+        {staker_address: now.subtract(hours=hours_up, minutes=30).epoch
+         for staker_address, (_, hours_up, _, _) in nodes.items()})
+
+    payload = crawler.measure_known_nodes()
+
+    assert {status: [node['staker_address'] for node in bucket] for status, bucket in payload.items()} == {
+        'confirmed': ['0xA', '0xB', '0xC'],
+        'pending': ['0xD'],
+        'idle': ['0xE'],
+        'unconfirmed': ['0xF']}
+
+    confirmed = {node['staker_address']: node for node in payload['confirmed']}
+    assert confirmed['0xA']['status'] == {'status': 'Confirmed', 'missed_confirmations': -1, 'color': 'green'}
+    assert confirmed['0xA']['uptime'] == '0d:5h:30m'
+    assert confirmed['0xB']['uptime'] == '2d:2h:30m'
+    assert confirmed['0xB']['uptime_king']
+    assert confirmed['0xC']['newborn']
+    assert 'newborn' not in confirmed['0xA'] and 'uptime_king' not in confirmed['0xA']
+    assert payload['unconfirmed'][0]['status'] == {'status': 'Unconfirmed', 'missed_confirmations': 3, 'color': 'red'}
+
+
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_measure_known_stakers_incrementally(get_agent, get_economics):
+    get_economics.return_value = StandardTokenEconomics()
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+
+    periods = {'0xA': 10, '0xB': 11, '0xC': 12, '0xD': 13}
+    expired = set()
+    crawler = create_crawler()
+    crawler._change_detector = MagicMock(spec=ChangeDetector, changed_stakers=frozenset())
+    crawler._staker_reader = MagicMock()
+    crawler._staker_reader.get_stakers_info.side_effect = lambda staker_addresses: {
+        staker_address: StakerInfo(0 if staker_address in expired else 1, 0, periods[staker_address], '0xW')
+        for staker_address in staker_addresses}
+    crawler._crawler_client = MagicMock(spec=CrawlerStorageClient)
+
+    def learn(*staker_addresses, removed=()):
+        crawler._crawler_client.get_known_nodes_changes.return_value = NodeChanges(
+            updated={staker_address: {'staker_address': staker_address, 'timestamp': maya.now().iso8601()}
+                     for staker_address in staker_addresses},
+            removed=list(removed),
+            last_seq=0)
+
+    def measure(changed=frozenset()) -> list:
+        crawler._mark_stale_stakers(frozenset(changed))
+        crawler._staker_reader.get_stakers_info.reset_mock()
+        known_stakers = crawler._measure_known_stakers()
+        assert known_stakers == {staker_address: periods[staker_address] for staker_address in known_stakers}
+        if not crawler._staker_reader.get_stakers_info.called:
+            return []
+        return crawler._staker_reader.get_stakers_info.call_args[0][0]
+
+    learn('0xB', '0xA')
+    assert measure() == ['0xA', '0xB']  # all stakers are read at first
+
+    # new nodes, and rewritten rows of known ones; only the new stakers are read
+    learn('0xA', '0xC')
+    assert measure(changed={STORAGE}) == ['0xC']
+    learn()
+    assert measure(changed={STORAGE}) == []
+
+    # StakingEscrow events of some stakers; those (and only those) are read again
+    periods['0xA'] = 20
+    crawler._change_detector.changed_stakers = frozenset({'0xA', '0xZ'})
+    assert measure(changed={BLOCK, STAKING}) == ['0xA']
+    assert crawler._measure_known_stakers()['0xA'] == 20
+
+    # a failed read is made again next time
+    crawler._change_detector.changed_stakers = frozenset({'0xB'})
+    get_stakers_info = crawler._staker_reader.get_stakers_info.side_effect
+    crawler._staker_reader.get_stakers_info.side_effect = RuntimeError
+    with pytest.raises(RuntimeError):
+        measure(changed={BLOCK, STAKING})
+    crawler._staker_reader.get_stakers_info.side_effect = get_stakers_info
+    crawler._change_detector.changed_stakers = frozenset()
+    assert measure(changed={BLOCK}) == ['0xB']
+
+    # unknown changes or a new period; all are read again
+    crawler._change_detector.changed_stakers = None
+    assert measure(changed={BLOCK, STAKING}) == ['0xA', '0xB', '0xC']
+    crawler._change_detector.changed_stakers = frozenset()
+    assert measure(changed={PERIOD}) == ['0xA', '0xB', '0xC']
+
+    # expired stakers are removed from storage, which is not a reason to read them again
+    expired.add('0xD')
+    learn('0xD')
+    assert measure(changed={STORAGE}) == ['0xD']
+    learn(removed=['0xD'])
+    assert measure(changed={STORAGE}) == []
+    assert list(crawler._measure_known_stakers()) == ['0xA', '0xB', '0xC']
+
+
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_measure_from_staker_index(get_agent, get_economics):
+    token_economics = StandardTokenEconomics()
+    get_economics.return_value = token_economics
+    current_period = datetime_to_period(datetime=maya.now(), seconds_per_period=token_economics.seconds_per_period)
+
+    staker_states = {  # staker -> (last committed period, worker)
+        '0xA': (current_period + 1, '0xWA'),  # confirmed
+        '0xB': (current_period, '0xWB'),      # pending
+        '0xC': (current_period - 2, '0xWC'),  # inactive
+        '0xD': (None, None),                  # inactive, never committed nor bonded
+        '0xE': (current_period - 5, '0xWE'),  # inactive, expired
+    }
+
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.get_current_period.return_value = current_period
+    staking_agent.get_locked_tokens.side_effect = lambda staker_address, periods=0: 0 if staker_address == '0xE' else 1
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+
+    crawler = create_crawler(index_staking_events=True)
+    assert 'staker_index' in crawler._round_executor.tasks['activity'].depends_on
+    crawler._crawler_client = MagicMock(spec=CrawlerStorageClient)
+    crawler._crawler_client.get_staker_states.return_value = {
+        staker_address: {'staker_address': staker_address, 'worker': worker, 'last_committed_period': period}
+        for staker_address, (period, worker) in staker_states.items()}
+    crawler._crawler_client.get_known_nodes_changes.return_value = NodeChanges(
+        updated={staker_address: {'staker_address': staker_address, 'timestamp': maya.now().iso8601()}
+                 for staker_address in ('0xA', '0xB', '0xD')},
+        removed=[],
+        last_seq=3)
+    crawler._crawler_client.get_known_nodes_columns.return_value = known_nodes_columns(
+        {staker_address: maya.now().epoch for staker_address in ('0xA', '0xB', '0xD')})
+
+    # until the index has caught up, the chain is read instead
+    crawler._staker_indexer = MagicMock(spec=StakingEscrowIndexer, indexed_block=None)
+    crawler._staker_indexer.staker_states.side_effect = lambda stored_states: stored_states
+    staking_agent.partition_stakers_by_activity.return_value = ([], [], [])
+    assert crawler._measure_staker_activity() == {'active': 0, 'pending': 0, 'inactive': 0}
+    staking_agent.partition_stakers_by_activity.assert_called_once()
+    staking_agent.partition_stakers_by_activity.reset_mock()
+
+    crawler._staker_indexer.indexed_block = 1234
+    assert crawler._measure_staker_activity() == {'active': 1, 'pending': 1, 'inactive': 2}
+
+    payload = crawler.measure_known_nodes()
+    assert {status: [node['staker_address'] for node in bucket] for status, bucket in payload.items()} == {
+        'confirmed': ['0xA'],
+        'pending': ['0xB']}  # 0xD has no worker
+
+    # workers and commitments come from the index
+    staking_agent.get_last_committed_period.assert_not_called()
+    staking_agent.get_worker_from_staker.assert_not_called()
+    staking_agent.partition_stakers_by_activity.assert_not_called()
+
+
+@patch.object(monitor.crawler.Crawler, 'measure_known_nodes', autospec=True)
+@patch.object(monitor.crawler.EconomicsFactory, 'get_economics', autospec=True)
+@patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
+def test_crawler_collect_stats_round(get_agent, get_economics, measure_known_nodes, tmpdir):
+    get_economics.return_value = StandardTokenEconomics()
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.blockchain.client.w3.eth.getBlock.return_value = MagicMock(number=1234, timestamp=5678)
+    staking_agent.partition_stakers_by_activity.return_value = (['0xA', '0xB'], ['0xC'], [])
+    staking_agent.get_global_locked_tokens.return_value = 42
+    staking_agent.get_all_active_stakers.return_value = (3, {'0xA': 1, '0xB': 2})
+    staking_agent.get_current_period.return_value = 100
+    staking_agent.get_all_stakes = MagicMock(return_value=[])
+    contract_agency = MockContractAgency(staking_agent=staking_agent)
+    get_agent.side_effect = contract_agency.get_agent
+    measure_known_nodes.return_value = {'confirmed': ['node']}
+
+    stats_filepath = str(tmpdir.join('stats.json'))
+    crawler = create_crawler(refresh_rate=0, stats_filepath=stats_filepath)  # node statuses are refreshed every round
+    crawler._crawler_client = MagicMock(spec=CrawlerStorageClient)
+    crawler._crawler_client.get_current_teacher_checksum.return_value = '0xTeacher'
+    crawler._crawler_client.get_previous_states_metadata.return_value = ['state']
+    crawler._events = MagicMock(spec=StatsEventResource)
+    rounds, noop_rounds = ROUNDS.value(), NOOP_ROUNDS.value()  # process wide
+
+    crawler._collect_stats(threaded=False)
+    stats = crawler.stats
+    crawler._events.publish.assert_called_once_with(previous={'status': 'initializing'},
+                                                    current=stats,
+                                                    etag=crawler._stats_history.latest.serialized.etag)
+    with open(stats_filepath) as stats_file:
+        assert json.load(stats_file) == json.loads(json.dumps(stats))  # for a dashboard in another process
+    assert stats['blocknumber'] == 1234 and stats['blocktime'] == 5678
+    assert stats['node_details'] == {'confirmed': ['node']}
+    assert stats['activity'] == {'active': 2, 'pending': 1, 'inactive': 0}
+    assert stats['global_locked_tokens'] == 42
+    assert stats['top_stakers'] == {'0xB': 2, '0xA': 1}
+    assert stats['current_teacher'] == '0xTeacher'
+    assert stats['prev_states'] == ['state']
+    assert len(stats['future_locked_tokens']) == 365
+    assert set(stats['collector_ages']) == {'next_period', 'current_teacher', 'prev_states', 'known_stakers',
+                                            'node_details', 'activity', 'global_locked_tokens', 'top_stakers',
+                                            'future_locked_tokens'}
+
+    # a failing collector reports its previous value, the rest of the round is still published
+    measure_known_nodes.side_effect = RuntimeError
+    staking_agent.get_global_locked_tokens.return_value = 43
+    staking_agent.blockchain.client.w3.eth.getBlock.return_value = MagicMock(number=1235, timestamp=5690)
+    staking_agent.blockchain.client.w3.eth.getLogs.return_value = [{'event': 'CommitmentMade'}]
+    crawler._collect_stats(threaded=False)
+    assert crawler.stats is not stats
+    assert crawler.stats['node_details'] == {'confirmed': ['node']}
+    assert crawler.stats['global_locked_tokens'] == 43  # refreshed every block
+
+    # same period, so the scan of all stakers is not repeated
+    assert staking_agent.get_all_active_stakers.call_count == 1  # shared by top stakers and projection, first round only
+
+    # a new block without StakingEscrow events or storage writes only refreshes node statuses
+    measure_known_nodes.side_effect = None
+    staking_agent.get_global_locked_tokens.return_value = 44
+    staking_agent.blockchain.client.w3.eth.getBlock.return_value = MagicMock(number=1236, timestamp=5700)
+    staking_agent.blockchain.client.w3.eth.getLogs.return_value = []
+    crawler._staker_reader = MagicMock(wraps=crawler._staker_reader)
+    measure_known_nodes.reset_mock()
+    crawler._collect_stats(threaded=False)
+    measure_known_nodes.assert_called_once_with(crawler, known_stakers={})
+    crawler._staker_reader.get_stakers_info.assert_not_called()  # the contract reads behind them are not repeated
+    assert crawler.stats['blocknumber'] == 1236
+    assert crawler.stats['global_locked_tokens'] == 43
+    assert crawler._crawler_client.get_current_teacher_checksum.call_count == 1
+    assert crawler.stats['rounds'] == {'rounds': rounds + 3, 'noop_rounds': noop_rounds}
+
+    # the endpoint serves the stats serialized at the end of the round
+    crawler.make_flask_server()
+    client = crawler._flask.test_client()
+    response = client.get('/stats')
+    assert response.get_json() == json.loads(json.dumps(crawler.stats))
+    assert client.get('/stats', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/stats?pretty=true').data.startswith(b'{\n')
+    assert client.get('/stats?fields=activity,blocknumber').get_json() == {'activity': crawler.stats['activity'],
+                                                                           'blocknumber': 1236}
+    assert client.get('/stats?fields=unknown').status_code == 400
+    assert client.get('/stats?status=unconfirmed').get_json()['node_details'] == {}
+    response = client.get('/stats/nodes?status=confirmed')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.data == b'"node"\n'
+    assert client.get('/stats/nodes?status=confirmed',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    # pollers holding an earlier round only get what changed
+    etags = {round_number: crawler._stats_history.get(round_number).serialized.etag for round_number in (0, 2)}
+    assert client.get('/stats/delta').status_code == 400
+    assert client.get('/stats/delta?since=two').status_code == 400
+    assert client.get('/stats/delta?since=99').get_json()['full'] is True
+    assert client.get('/stats/delta?since=2').get_json()['full'] is False  # the ETag is optional
+    assert client.get(f'/stats/delta?since=99&etag={etags[2]}').get_json()['full'] is True
+    assert client.get('/stats/delta?since=2&etag=before-restart').get_json()['full'] is True
+    delta = client.get(f'/stats/delta?since=0&etag={etags[0]}').get_json()
+    assert delta['node_details']['added'] == {'confirmed': ['node']}
+    assert delta['etag'] == client.get('/stats').headers['ETag'].strip('"')
+    delta = client.get(f'/stats/delta?since=2&etag={etags[2]}').get_json()
+    assert delta['round'] == 3 and delta['full'] is False
+    assert delta['changed']['blocknumber'] == 1236
+    assert 'node_details' not in delta['changed'] and 'future_locked_tokens' not in delta['changed']
+
+    # recent rounds stay available as they were published
+    assert client.get('/stats?round=2').get_json()['blocknumber'] == 1235
+    assert client.get('/stats?round=2&fields=global_locked_tokens').get_json() == {'global_locked_tokens': 43}
+    assert client.get('/stats?round=0').get_json() == {'status': 'initializing'}
+    assert client.get('/stats?round=99').status_code == 404
+    assert client.get('/stats?round=latest').status_code == 400
+
+    crawler._collect_stats(threaded=False)
+    assert client.get('/stats', headers={'If-None-Match': response.headers['ETag']}).status_code == 200
+
+    # the round guard is released even if the round itself fails
+    staking_agent.blockchain.client.w3.eth.getBlock.side_effect = ConnectionError
+    with pytest.raises(ConnectionError):
+        crawler._collect_stats(threaded=False)
+    with patch.object(monitor.crawler.reactor, 'callInThread') as call_in_thread:
+        crawler._collect_stats()
+        call_in_thread.assert_called_once()
+
+    crawler.stop()
+
+
 @pytest.mark.skip("stopping a started crawler is not stopping the thread; ctrl-c needed")
 @patch.object(monitor.crawler.ContractAgency, 'get_agent', autospec=True)
 def test_crawler_start_then_stop(get_agent):
@@ -303,7 +1031,7 @@ def verify_current_teacher(db_conn, expected_teacher_checksum):
 
 
 def verify_mock_node_matches(node_status, row):
-    assert len(row) == 6
+    assert len(row) == 8
 
     assert node_status.staker_address == row[0], 'staker address matches'
     assert node_status.rest_url == row[1], 'rest url matches'
@@ -311,6 +1039,8 @@ def verify_mock_node_matches(node_status, row):
     assert node_status.timestamp.iso8601() == row[3], 'new now timestamp matches'
     assert node_status.last_learned_from.iso8601() == row[4], 'last seen matches'
     assert "?" == row[5], 'fleet state icon matches'
+    assert 0 == row[6], 'not stale'
+    assert isinstance(row[7], int), 'change sequence number'
 
 
 def verify_mock_state_matches_row(state, row):
@@ -320,4 +1050,4 @@ def verify_mock_state_matches_row(state, row):
     assert state.nickname.characters[0].symbol == row[1], 'symbol matches'
     assert state.nickname.characters[0].color_hex == row[2], 'color hex matches'
     assert state.nickname.characters[0].color_name == row[3], 'color matches'
-    assert state.timestamp.rfc3339() == row[4], 'updated timestamp matches'  # ensure timestamp in rfc3339
+    assert state.timestamp.epoch == row[4], 'updated timestamp matches'  # ensure timestamp in epoch
@@ -1,5 +1,13 @@
+import os
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import numpy as np
+import pytest
 from monitor.crawler import CrawlerStorage
-from monitor.db import CrawlerStorageClient
+from monitor.db import CrawlerStorageClient, MappedStatsReader, NodeChanges, ReadOnlyConnectionPool
+from monitor.snapshots import SerializedSnapshot, StatsSnapshot, write_mapped_snapshot_file
 from tests.utilities import (
     create_random_mock_node_status,
     create_random_mock_state,
@@ -27,8 +35,10 @@ def test_node_client_get_node_metadata(tempfile_path):
     node_5 = create_random_mock_node_status()
 
     node_list = [node_1, node_2, node_3, node_4, node_5]
-    for node in node_list:
+    change_seqs = dict()
+    for change_seq, node in enumerate(node_list, start=1):
         node_storage.store_node_status(node)
+        change_seqs[node.staker_address] = change_seq
 
     node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
     result = node_db_client.get_known_nodes_metadata()
@@ -40,11 +50,83 @@ def test_node_client_get_node_metadata(tempfile_path):
     for idx, key in enumerate(result):
         node_info = result[key]
 
-        expected_row = convert_node_status_to_db_row(node_list[idx])
+        expected_row = convert_node_status_to_db_row(node_list[idx], change_seqs[node_list[idx].staker_address])
         for info_idx, column in enumerate(CrawlerStorage.NODE_DB_SCHEMA):
             assert node_info[column[0]] == expected_row[info_idx], f"{column[0]} matches"
 
 
+def test_node_client_get_known_nodes_changes(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
+
+    changes = node_db_client.get_known_nodes_changes()
+    assert changes == NodeChanges(updated=dict(), removed=[], last_seq=0)
+
+    node_1 = create_random_mock_node_status()
+    node_2 = create_random_mock_node_status()
+    node_3 = create_random_mock_node_status()
+    for node in (node_1, node_2, node_3):
+        node_storage.store_node_status(node)
+
+    changes = node_db_client.get_known_nodes_changes(since_seq=0)
+    assert list(changes.updated) == [node_1.staker_address, node_2.staker_address, node_3.staker_address]
+    assert changes.removed == []
+    assert changes.last_seq == 3
+
+    # no changes since
+    assert node_db_client.get_known_nodes_changes(since_seq=changes.last_seq) == NodeChanges(updated=dict(),
+                                                                                             removed=[],
+                                                                                             last_seq=3)
+
+    # only churn is returned
+    updated_node_2 = node_2._replace(timestamp=node_2.timestamp.add(hours=1))
+    node_storage.store_node_status(updated_node_2)
+    node_storage.remove_node_status(node_3.staker_address)
+
+    changes = node_db_client.get_known_nodes_changes(since_seq=changes.last_seq)
+    assert list(changes.updated) == [node_2.staker_address]
+    assert changes.updated[node_2.staker_address]['timestamp'] == updated_node_2.timestamp.iso8601()
+    assert changes.removed == [node_3.staker_address]
+    assert changes.last_seq == 5
+
+
+def test_node_client_get_known_nodes_columns(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
+
+    columns = node_db_client.get_known_nodes_columns()
+    assert len(columns) == 0
+    assert columns.staker_address.shape == (0, 20)
+
+    node_list = [create_random_mock_node_status() for _ in range(5)]
+    node_list[0] = node_list[0]._replace(last_learned_from=None)
+    for node in node_list:
+        node_storage.store_node_status(node)
+
+    columns = node_db_client.get_known_nodes_columns()
+    node_list.sort(key=lambda x: x.staker_address)  # result is sorted by staker address
+    assert len(columns) == len(node_list)
+    assert columns.fleet_state_icons == ('?',)
+    for idx, node in enumerate(node_list):
+        assert columns.checksum_address[idx] == node.staker_address
+        assert columns.index(node.staker_address) == idx
+        assert bytes(columns.staker_address[idx]) == bytes.fromhex(node.staker_address[2:])
+        assert columns.rest_url[idx] == node.rest_url
+        assert columns.nickname[idx] == str(node.nickname)
+        assert abs(columns.timestamp[idx] - node.timestamp.datetime().timestamp()) < 0.01
+        if node.last_learned_from:
+            assert abs(columns.last_seen[idx] - node.last_learned_from.datetime().timestamp()) < 0.01
+        else:
+            assert np.isnan(columns.last_seen[idx])
+        assert columns.fleet_state_icon[idx] == 0
+        assert not columns.stale[idx]
+
+    # read-only, shared through the cache
+    assert node_db_client.get_known_nodes_columns() is columns
+    with pytest.raises(ValueError):
+        columns.timestamp[0] = 0
+
+
 def test_node_client_get_state_metadata(tempfile_path):
     # Add some node data
     node_storage = CrawlerStorage(db_filepath=tempfile_path)
@@ -86,11 +168,214 @@ def test_node_client_get_current_teacher_checksum(tempfile_path):
     assert result == new_teacher_checksum
 
 
-def convert_node_status_to_db_row(node_status):
+def test_node_client_get_staker_states(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
+    assert node_db_client.get_staker_states() == {}
+
+    node_storage.store_staker_updates('staking_escrow', block_number=100, staker_updates={
+        '0xStaker1': {'worker': '0xWorker1', 'last_committed_period': 10, 'first_block': 5, 'updated_block': 50}})
+    staker_states = node_db_client.get_staker_states()
+    assert staker_states == {'0xStaker1': {'staker_address': '0xStaker1',
+                                           'worker': '0xWorker1',
+                                           'last_committed_period': 10,
+                                           'first_block': 5,
+                                           'updated_block': 50}}
+
+    # callers can modify results without affecting the cache
+    staker_states['0xStaker1']['worker'] = 'modified'
+    assert node_db_client.get_staker_states()['0xStaker1']['worker'] == '0xWorker1'
+    node_db_client.close()
+
+
+def test_node_client_cached_reads(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    node_storage.store_node_status(create_random_mock_node_status())
+    node_storage.store_fleet_state(create_random_mock_state(seed=1))
+    node_storage.store_current_teacher(teacher_checksum='0x123456789')
+
+    node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
+    with patch.object(node_db_client, '_read_known_nodes_metadata',
+                      wraps=node_db_client._read_known_nodes_metadata) as read_known_nodes, \
+            patch.object(node_db_client, '_read_previous_states_metadata',
+                         wraps=node_db_client._read_previous_states_metadata) as read_states, \
+            patch.object(node_db_client, '_read_current_teacher_checksum',
+                         wraps=node_db_client._read_current_teacher_checksum) as read_teacher:
+
+        # repeated reads without writes only query once
+        for _ in range(3):
+            known_nodes = node_db_client.get_known_nodes_metadata()
+            states = node_db_client.get_previous_states_metadata()
+            teacher = node_db_client.get_current_teacher_checksum()
+        assert read_known_nodes.call_count == 1
+        assert read_states.call_count == 1
+        assert read_teacher.call_count == 1
+        assert len(known_nodes) == 1
+        assert len(states) == 1
+        assert teacher == '0x123456789'
+
+        # callers can modify results without affecting the cache
+        for node_info in known_nodes.values():
+            node_info['status'] = 'modified'
+        states.clear()
+        assert 'status' not in list(node_db_client.get_known_nodes_metadata().values())[0]
+        assert len(node_db_client.get_previous_states_metadata()) == 1
+
+        # a write invalidates the cache
+        node_storage.store_node_status(create_random_mock_node_status())
+        node_storage.store_current_teacher(teacher_checksum='0x987654321')
+        assert len(node_db_client.get_known_nodes_metadata()) == 2
+        assert node_db_client.get_current_teacher_checksum() == '0x987654321'
+        assert read_known_nodes.call_count == 2
+        assert read_teacher.call_count == 2
+
+    node_db_client.close()
+
+
+def test_connection_pool_reuses_thread_connection(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    node_db_client = CrawlerStorageClient(db_filepath=tempfile_path)
+
+    with patch.object(node_db_client._pool, 'connect', wraps=node_db_client._pool.connect) as connect:
+        for _ in range(3):
+            node_storage.store_node_status(create_random_mock_node_status())  # invalidate cache
+            node_db_client.get_known_nodes_metadata()
+            node_db_client.get_known_nodes_changes()
+        assert connect.call_count == 2  # data version connection and this thread's pooled connection
+        assert len(node_db_client._pool) == 1
+
+        # other threads get their own connection; kept alive together so their thread ids can't be reused
+        barrier = threading.Barrier(2)
+
+        def read():
+            node_db_client.get_known_nodes_changes()
+            barrier.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert connect.call_count == 4
+        assert len(node_db_client._pool) == 3
+
+    node_db_client.close()
+    assert len(node_db_client._pool) == 0
+
+
+def test_connection_pool_read_only(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    pool = ReadOnlyConnectionPool(db_filepath=tempfile_path)
+    with pool.connection() as db_conn:
+        with pytest.raises(sqlite3.OperationalError):
+            db_conn.execute(f"DELETE FROM {CrawlerStorage.NODE_DB_NAME}")
+    pool.clear()
+
+
+def test_connection_pool_cap_and_idle_eviction(tempfile_path):
+    node_storage = CrawlerStorage(db_filepath=tempfile_path)
+    pool = ReadOnlyConnectionPool(db_filepath=tempfile_path, max_connections=2, idle_timeout=60)
+
+    def use_connection():
+        with pool.connection() as db_conn:
+            db_conn.execute(f"SELECT * FROM {CrawlerStorage.NODE_DB_NAME}").fetchall()
+
+    for _ in range(4):
+        thread = threading.Thread(target=use_connection)
+        thread.start()
+        thread.join()
+    assert len(pool) == 2  # least recently used idle connections evicted
+
+    # connections busy in other threads - a one-off connection is used
+    with pool.connection():
+        with patch.object(pool, '_evict'):  # keep the busy connection
+            thread = threading.Thread(target=use_connection)
+            thread.start()
+            thread.join()
+    assert len(pool) <= 2
+
+    # idle connections are evicted
+    pool.idle_timeout = 0
+    use_connection()
+    assert len(pool) == 1  # only this thread's new connection
+    pool.clear()
+
+
+def convert_node_status_to_db_row(node_status, change_seq):
     return (node_status.staker_address, node_status.rest_url, str(node_status.nickname),
-            node_status.timestamp.iso8601(), node_status.last_learned_from.iso8601(), "?")
+            node_status.timestamp.iso8601(), node_status.last_learned_from.iso8601(), "?", 0, change_seq)
 
 
 def convert_state_to_display_values(state):
     return (str(state.nickname), state.nickname.characters[0].symbol, state.nickname.characters[0].color_hex,
             state.nickname.characters[0].color_name, state.timestamp.rfc2822())
+
+
+#
+# Memory mapped stats snapshot tests
+#
+
+
+def create_node_stats(staker_address: str, status: str, **flags) -> dict:
+    node = {'staker_address': staker_address,
+            'rest_url': 'https://127.0.0.1:9151',
+            'nickname': 'Aqua Sun',
+            'timestamp': '2020-10-01T00:00:00Z',
+            'last_seen': '?',
+            'fleet_state_icon': '?',
+            'stale': 0,
+            'change_seq': 7,
+            'status': {'status': status, 'missed_confirmations': -1, 'color': 'green'},
+            'uptime': '12d:3h:4m'}
+    node.update(flags)
+    return node
+
+
+def create_stats_snapshot(round_number: int, nodes_by_status: dict) -> StatsSnapshot:
+    data = {'round': round_number, 'blocknumber': 1000 + round_number, 'node_details': nodes_by_status}
+    return StatsSnapshot(round=round_number, block_number=1000 + round_number, started=1600000000.5, duration=1.5,
+                         serialized=SerializedSnapshot(data))
+
+
+def test_mapped_stats(tmpdir):
+    filepath = str(tmpdir.join('stats.bin'))
+    reader = MappedStatsReader(filepath=filepath)
+    assert reader.current() is None  # not written yet
+
+    confirmed = [create_node_stats(f'0x{i:040X}', 'Confirmed') for i in range(3)]
+    confirmed[0]['newborn'] = True
+    confirmed[1]['uptime_king'] = True
+    unconfirmed = [create_node_stats(f'0x{i:040X}', 'Unconfirmed', stale=1) for i in range(3, 5)]
+    unconfirmed[0]['status'] = {'status': 'Unconfirmed', 'missed_confirmations': 4, 'color': 'red'}
+    write_mapped_snapshot_file(filepath, create_stats_snapshot(3, {'confirmed': confirmed, 'unconfirmed': unconfirmed}))
+
+    mapped = reader.current()
+    assert (mapped.round, mapped.block_number, mapped.started) == (3, 1003, 1600000000.5)
+    assert mapped.statuses == ('confirmed', 'unconfirmed')
+    assert mapped.stats() == {'round': 3, 'blocknumber': 1003}
+    assert len(mapped) == 5
+    assert list(mapped.iter_nodes()) == confirmed + unconfirmed
+    assert list(mapped.iter_nodes(statuses=('unconfirmed', ))) == unconfirmed
+
+    # records are read in place
+    assert not mapped.nodes.flags.writeable
+    assert mapped.nodes['missed_confirmations'].tolist() == [-1, -1, -1, 4, -1]
+    assert reader.current() is mapped  # not mapped again until replaced
+
+    # readers of a replaced file keep a consistent view
+    write_mapped_snapshot_file(filepath, create_stats_snapshot(4, {'confirmed': confirmed[:1]}))
+    os.utime(filepath, ns=(0, 0))  # even within the same mtime granularity, a new inode is noticed
+    latest = reader.current()
+    assert latest.round == 4 and list(latest.iter_nodes()) == confirmed[:1]
+    assert list(mapped.iter_nodes()) == confirmed + unconfirmed
+
+
+def test_mapped_stats_invalid_file(tmpdir):
+    filepath = tmpdir.join('stats.bin')
+    filepath.write_binary(b'{"round": 1}')
+    with pytest.raises(ValueError):
+        MappedStatsReader(filepath=str(filepath)).current()
+    filepath.write_binary(b'X' * 512)
+    with pytest.raises(ValueError):
+        MappedStatsReader(filepath=str(filepath)).current()
+
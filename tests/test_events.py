@@ -0,0 +1,112 @@
+import json
+
+from twisted.internet.task import Clock
+from twisted.web.test.requesthelper import DummyRequest
+
+from monitor.events import changed_fields, StatsEvent, StatsEventResource, Subscriber
+
+
+class ThreadlessClock(Clock):
+    """A reactor clock for callFromThread callers, as if already on the reactor thread"""
+
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+
+class StreamRequest(DummyRequest):
+    """DummyRequest only drives pull producers"""
+
+    producer = None
+
+    def registerProducer(self, producer, streaming):
+        assert streaming
+        self.producer = producer
+
+
+def read_events(request: StreamRequest) -> list:
+    events = list()
+    for chunk in b''.join(request.written).split(b'\n\n'):
+        lines = dict(line.split(b': ', 1) for line in chunk.split(b'\n') if line and not line.startswith(b':'))
+        if b'data' in lines:
+            events.append((lines[b'id'].decode(), json.loads(lines[b'data'])))
+    return events
+
+
+def subscribe(resource: StatsEventResource, fields: str = None, last_event_id: str = None) -> StreamRequest:
+    request = StreamRequest([b''])
+    if fields:
+        request.addArg(b'fields', fields.encode())
+    if last_event_id:
+        request.requestHeaders.addRawHeader(b'Last-Event-ID', last_event_id.encode())
+    resource.render_GET(request)
+    return request
+
+
+def test_changed_fields():
+    previous = {'blocknumber': 1, 'activity': {'active': 2}, 'removed': True}
+    current = {'blocknumber': 2, 'activity': {'active': 2}, 'top_stakers': {'0xA': 1}}
+    assert changed_fields(previous, current) == {'blocknumber': b'2', 'top_stakers': b'{"0xA":1}'}
+    assert changed_fields(current, current) == {}
+
+    event = StatsEvent(etag='abc', fields={'blocknumber': b'2'})
+    assert event.encode() == b'id: abc\nevent: stats\ndata: {"etag":"abc","changed":{"blocknumber":2}}\n\n'
+    merged = event.merge(StatsEvent(etag='def', fields={'blocknumber': b'3', 'activity': b'{}'}))
+    assert merged.etag == 'def' and merged.fields == {'blocknumber': b'3', 'activity': b'{}'}
+
+
+def test_events_pushed_to_subscribers():
+    clock = ThreadlessClock()
+    resource = StatsEventResource(reactor=clock)
+    resource.publish(previous={}, current={'blocknumber': 1, 'activity': {'active': 2}}, etag='1')
+
+    # a new subscriber gets everything, then only changes
+    request = subscribe(resource)
+    assert request.responseHeaders.getRawHeaders(b'Content-Type') == [b'text/event-stream']
+    assert read_events(request) == [('1', {'etag': '1', 'changed': {'blocknumber': 1, 'activity': {'active': 2}}})]
+
+    filtered = subscribe(resource, fields='activity')
+    current = subscribe(resource, last_event_id='1')  # reconnected, already up to date
+    assert read_events(current) == []
+
+    resource.publish(previous={'blocknumber': 1, 'activity': {'active': 2}},
+                     current={'blocknumber': 2, 'activity': {'active': 2}},
+                     etag='2')
+    assert read_events(request)[-1] == ('2', {'etag': '2', 'changed': {'blocknumber': 2}})
+    assert read_events(current) == [('2', {'etag': '2', 'changed': {'blocknumber': 2}})]
+    assert len(read_events(filtered)) == 1  # activity didn't change
+
+    # unchanged fields are carried over for new subscribers
+    assert read_events(subscribe(resource))[0] == ('2', {'etag': '2', 'changed': {'blocknumber': 2,
+                                                                                   'activity': {'active': 2}}})
+
+    # idle streams are kept open
+    written = len(request.written)
+    clock.advance(StatsEventResource.KEEPALIVE_INTERVAL)
+    assert request.written[written:] == [b': keepalive\n\n']
+
+    # disconnected subscribers are dropped
+    assert len(resource.subscribers) == 4
+    for subscription in (request, filtered, current):
+        subscription.finish()
+    assert len(resource.subscribers) == 1
+
+
+def test_slow_subscriber_events_coalesced():
+    clock = ThreadlessClock()
+    resource = StatsEventResource(reactor=clock)
+    request = subscribe(resource)
+    subscriber = request.producer
+    assert isinstance(subscriber, Subscriber)
+
+    # the client's socket buffer is full; nothing more is written until it drains
+    subscriber.pauseProducing()
+    stats = {'blocknumber': 0, 'activity': {'active': 0}}
+    for block in range(1, 4):
+        previous, stats = stats, {'blocknumber': block, 'activity': {'active': 1}}
+        resource.publish(previous=previous, current=stats, etag=str(block))
+    clock.advance(StatsEventResource.KEEPALIVE_INTERVAL)
+    assert read_events(request) == []
+
+    subscriber.resumeProducing()
+    assert read_events(request) == [('3', {'etag': '3', 'changed': {'blocknumber': 3, 'activity': {'active': 1}}})]
+    assert subscriber.pending is None
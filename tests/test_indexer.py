@@ -0,0 +1,205 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from web3 import Web3
+
+from monitor.crawler import CrawlerStorage
+from monitor.indexer import StakingEscrowIndexer
+
+STAKING_ESCROW_ABI = [
+    {'type': 'event', 'name': 'CommitmentMade', 'anonymous': False,
+     'inputs': [{'name': 'staker', 'type': 'address', 'indexed': True},
+                {'name': 'period', 'type': 'uint16', 'indexed': True},
+                {'name': 'value', 'type': 'uint256', 'indexed': False}]},
+    {'type': 'event', 'name': 'WorkerBonded', 'anonymous': False,
+     'inputs': [{'name': 'staker', 'type': 'address', 'indexed': True},
+                {'name': 'worker', 'type': 'address', 'indexed': True},
+                {'name': 'startPeriod', 'type': 'uint16', 'indexed': True}]},
+    {'type': 'event', 'name': 'Deposited', 'anonymous': False,
+     'inputs': [{'name': 'staker', 'type': 'address', 'indexed': True},
+                {'name': 'value', 'type': 'uint256', 'indexed': False},
+                {'name': 'periods', 'type': 'uint16', 'indexed': False}]},
+    {'type': 'event', 'name': 'Minted', 'anonymous': False,
+     'inputs': [{'name': 'staker', 'type': 'address', 'indexed': True},
+                {'name': 'period', 'type': 'uint16', 'indexed': True},
+                {'name': 'value', 'type': 'uint256', 'indexed': False}]},
+]
+STAKING_ESCROW_ADDRESS = to_checksum_address('0x' + 'ee' * 20)
+
+
+def address(i: int) -> str:
+    return to_checksum_address(f'0x{i:040x}')
+
+
+class FakeChain:
+    """StakingEscrow logs answering `eth_getLogs` filters, refusing ranges with more than `max_results` logs"""
+
+    def __init__(self, max_results: int = 1000):
+        self.w3 = Web3()
+        self.max_results = max_results
+        self.logs = list()
+        self.requests = list()
+        self._lock = threading.Lock()
+
+    def emit(self, block_number: int, event_name: str, **args):
+        event_abi = next(item for item in STAKING_ESCROW_ABI if item['name'] == event_name)
+        indexed = [i for i in event_abi['inputs'] if i['indexed']]
+        not_indexed = [i for i in event_abi['inputs'] if not i['indexed']]
+        topics = [HexBytes(event_abi_to_log_topic(event_abi))]
+        topics += [HexBytes(self.w3.codec.encode_single(i['type'], args[i['name']])) for i in indexed]
+        data = self.w3.codec.encode_abi([i['type'] for i in not_indexed], [args[i['name']] for i in not_indexed])
+        log_index = sum(1 for log in self.logs if log['blockNumber'] == block_number)
+        self.logs.append({'address': STAKING_ESCROW_ADDRESS, 'topics': topics, 'data': HexBytes(data).hex(),
+                          'blockNumber': block_number, 'logIndex': log_index, 'transactionIndex': 0,
+                          'transactionHash': HexBytes(b'\x01' * 32), 'blockHash': HexBytes(b'\x02' * 32)})
+
+    def get_logs(self, log_filter: dict) -> list:
+        with self._lock:
+            self.requests.append((log_filter['fromBlock'], log_filter['toBlock']))
+        assert log_filter['address'] == STAKING_ESCROW_ADDRESS
+        topics = log_filter['topics'][0]
+        logs = [log for log in self.logs
+                if log_filter['fromBlock'] <= log['blockNumber'] <= log_filter['toBlock']
+                and log['topics'][0].hex() in topics]
+        if len(logs) > self.max_results:
+            raise ValueError({'code': -32005, 'message': f'query returned more than {self.max_results} results'})
+        return list(reversed(logs))  # applied in chain order regardless
+
+
+def create_indexer(chain: FakeChain, storage: CrawlerStorage, **kwargs) -> StakingEscrowIndexer:
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.contract = Web3().eth.contract(address=STAKING_ESCROW_ADDRESS, abi=STAKING_ESCROW_ABI)
+    staking_agent.contract_address = STAKING_ESCROW_ADDRESS
+    staking_agent.blockchain.client.w3.eth.getLogs.side_effect = chain.get_logs
+    return StakingEscrowIndexer(staking_agent=staking_agent, storage=storage, **kwargs)
+
+
+def staker_states(storage: CrawlerStorage) -> dict:
+    rows = storage._db_conn.execute(f"SELECT * FROM {CrawlerStorage.STAKER_STATE_DB_NAME}").fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def test_indexer_backfill_and_incremental_update(tempfile_path):
+    chain = FakeChain()
+    chain.emit(10, 'Deposited', staker=address(1), value=100, periods=30)
+    chain.emit(10, 'WorkerBonded', staker=address(1), worker=address(11), startPeriod=5)
+    chain.emit(20, 'CommitmentMade', staker=address(1), period=6, value=0)
+    chain.emit(30, 'CommitmentMade', staker=address(1), period=7, value=0)
+    chain.emit(30, 'Minted', staker=address(1), period=6, value=1)  # not indexed
+    chain.emit(35, 'Deposited', staker=address(2), value=200, periods=30)
+
+    storage = CrawlerStorage(db_filepath=tempfile_path)
+    indexer = create_indexer(chain, storage, chunk_size=10, max_workers=2, confirmations=0)
+    assert indexer.cursor is None
+
+    assert indexer.update(to_block=40) == 40
+    assert indexer.cursor == 40
+    assert sorted(chain.requests) == [(0, 9), (10, 19), (20, 29), (30, 39), (40, 40)]
+    assert staker_states(storage) == {address(1): (address(11), 7, 10, 30),
+                                      address(2): (None, None, 35, 35)}
+
+    # only new blocks are read
+    chain.requests.clear()
+    chain.emit(41, 'WorkerBonded', staker=address(2), worker=address(22), startPeriod=7)
+    chain.emit(42, 'CommitmentMade', staker=address(2), period=8, value=0)
+    chain.emit(42, 'WorkerBonded', staker=address(1), worker=address(12), startPeriod=7)
+    assert indexer.update(to_block=45) == 45
+    assert chain.requests == [(41, 45)]
+    assert staker_states(storage) == {address(1): (address(12), 7, 10, 42),
+                                      address(2): (address(22), 8, 35, 42)}
+
+    # nothing to do when up to date, or when the head moved back
+    chain.requests.clear()
+    assert indexer.update(to_block=45) == 45
+    assert indexer.update(to_block=44) == 45
+    assert chain.requests == []
+
+
+def test_indexer_splits_refused_ranges(tempfile_path):
+    chain = FakeChain(max_results=2)
+    for block_number in range(8):
+        chain.emit(block_number, 'CommitmentMade', staker=address(1), period=block_number, value=0)
+
+    storage = CrawlerStorage(db_filepath=tempfile_path)
+    indexer = create_indexer(chain, storage, chunk_size=8, confirmations=0)
+    assert indexer.update(to_block=7) == 7
+    assert (0, 7) in chain.requests and (0, 1) in chain.requests and (6, 7) in chain.requests
+    assert staker_states(storage)[address(1)] == (None, 7, 0, 7)
+
+    # a single block the node refuses can't be split
+    chain.emit(9, 'CommitmentMade', staker=address(2), period=1, value=0)
+    chain.emit(9, 'CommitmentMade', staker=address(3), period=1, value=0)
+    chain.emit(9, 'CommitmentMade', staker=address(4), period=1, value=0)
+    with pytest.raises(ValueError):
+        indexer.update(to_block=9)
+    assert indexer.cursor == 7
+
+
+def test_indexer_resumes_from_last_committed_batch(tempfile_path):
+    chain = FakeChain()
+    chain.emit(5, 'CommitmentMade', staker=address(1), period=1, value=0)
+    chain.emit(25, 'CommitmentMade', staker=address(1), period=2, value=0)
+
+    storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    indexer = create_indexer(chain, storage, chunk_size=10, max_workers=1, confirmations=0)
+
+    # the node fails part way through the backfill
+    def get_logs(log_filter):
+        if log_filter['fromBlock'] >= 20:
+            raise ConnectionError()
+        return chain.get_logs(log_filter)
+    indexer.staking_agent.blockchain.client.w3.eth.getLogs.side_effect = get_logs
+    with pytest.raises(ConnectionError):
+        indexer.update(to_block=30)
+    assert indexer.cursor == 19
+    assert staker_states(storage)[address(1)][1] == 1
+    del storage
+
+    # restarted crawler picks up where it left off
+    storage = CrawlerStorage(db_filepath=tempfile_path, persistent=True)
+    indexer = create_indexer(chain, storage, chunk_size=10, max_workers=1, confirmations=0)
+    chain.requests.clear()
+    assert indexer.update(to_block=30) == 30
+    assert chain.requests == [(20, 29), (30, 30)]
+    assert staker_states(storage)[address(1)] == (None, 2, 5, 25)
+
+
+def test_indexer_only_stores_confirmed_blocks(tempfile_path):
+    chain = FakeChain()
+    chain.emit(105, 'Deposited', staker=address(1), value=100, periods=30)
+    chain.emit(105, 'WorkerBonded', staker=address(1), worker=address(11), startPeriod=5)
+    chain.emit(108, 'CommitmentMade', staker=address(1), period=6, value=0)
+
+    storage = CrawlerStorage(db_filepath=tempfile_path)
+    indexer = create_indexer(chain, storage, chunk_size=100, start_block=100, confirmations=5)
+    assert indexer.indexed_block is None
+
+    assert indexer.update(to_block=110) == 105
+    assert sorted(chain.requests) == [(100, 105), (106, 110)]  # from the deployment block, not genesis
+    assert indexer.indexed_block == 110
+    assert staker_states(storage) == {address(1): (address(11), None, 105, 105)}
+
+    # the unconfirmed commitment is overlaid on the stored state
+    stored_states = {address(1): {'staker_address': address(1), 'worker': address(11), 'last_committed_period': None,
+                                  'first_block': 105, 'updated_block': 105}}
+    assert indexer.staker_states(stored_states)[address(1)]['last_committed_period'] == 6
+    assert stored_states[address(1)]['last_committed_period'] is None
+
+    # the commitment is reorged out, and made again in a later block
+    chain.logs = [log for log in chain.logs if log['blockNumber'] != 108]
+    chain.emit(109, 'CommitmentMade', staker=address(2), period=6, value=0)
+    assert indexer.update(to_block=111) == 106
+    assert staker_states(storage) == {address(1): (address(11), None, 105, 105)}
+    recent_states = indexer.staker_states(stored_states)
+    assert recent_states[address(1)]['last_committed_period'] is None
+    assert recent_states[address(2)]['last_committed_period'] == 6
+
+    # the head moves back, dropping that block again
+    chain.logs = [log for log in chain.logs if log['blockNumber'] != 109]
+    assert indexer.update(to_block=109) == 106
+    assert indexer.indexed_block == 109
+    assert address(2) not in indexer.staker_states(stored_states)
@@ -0,0 +1,80 @@
+import math
+from unittest.mock import MagicMock
+
+import pytest
+
+from monitor.metrics import MetricsRegistry, rpc_metrics_middleware, RPC_ERRORS, RPC_REQUESTS
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    runs = registry.counter('runs_total', 'Runs', labelnames=('result',))
+    runs.inc(result='success')
+    runs.inc(2, result='success')
+    runs.inc(result='error')
+    assert runs.value(result='success') == 3
+    assert runs.value(result='error') == 1
+
+    with pytest.raises(ValueError):
+        runs.inc(-1, result='success')
+    with pytest.raises(ValueError):
+        runs.inc(collector='unknown label')
+
+    # registering again returns the same metric, unless it doesn't match
+    assert registry.counter('runs_total', 'Runs', labelnames=('result',)) is runs
+    with pytest.raises(ValueError):
+        registry.gauge('runs_total', 'Runs', labelnames=('result',))
+
+    last_run = registry.gauge('last_run', 'Last run')
+    last_run.set(10.5)
+    assert last_run.value() == 10.5
+    last_run.inc(-0.5)
+    assert last_run.value() == 10
+
+
+def test_histogram():
+    registry = MetricsRegistry()
+    duration = registry.histogram('duration_seconds', 'Duration', labelnames=('collector',), buckets=(0.1, 1))
+    assert duration.buckets == (0.1, 1, math.inf)
+    for value in (0.05, 0.5, 0.5, 5):
+        duration.observe(value, collector='Known Nodes')
+    count, total = duration.value(collector='Known Nodes')
+    assert count == 4 and total == pytest.approx(6.05)
+    assert duration.value(collector='Top Stakes') == (0, 0)
+
+
+def test_render():
+    registry = MetricsRegistry()
+    registry.counter('runs_total', 'Collector runs', labelnames=('collector',)).inc(collector='Say "hi"\n')
+    registry.histogram('duration_seconds', 'Duration', buckets=(1,)).observe(0.25)
+    registry.gauge('unset', 'Nothing yet')
+
+    assert registry.render() == (
+        '# HELP duration_seconds Duration\n'
+        '# TYPE duration_seconds histogram\n'
+        'duration_seconds_bucket{le="1"} 1\n'
+        'duration_seconds_bucket{le="+Inf"} 1\n'
+        'duration_seconds_sum 0.25\n'
+        'duration_seconds_count 1\n'
+        '# HELP runs_total Collector runs\n'
+        '# TYPE runs_total counter\n'
+        'runs_total{collector="Say \\"hi\\"\\n"} 1\n'
+        '# HELP unset Nothing yet\n'
+        '# TYPE unset gauge\n'
+    )
+
+
+def test_rpc_metrics_middleware():
+    make_request = MagicMock(return_value={'result': '0x1'})
+    middleware = rpc_metrics_middleware(make_request, w3=None)
+    requests, errors = RPC_REQUESTS.value(method='eth_blockNumber'), RPC_ERRORS.value(method='eth_blockNumber')
+
+    assert middleware('eth_blockNumber', []) == {'result': '0x1'}
+    make_request.return_value = {'error': {'code': -32000, 'message': 'header not found'}}
+    middleware('eth_blockNumber', [])
+    make_request.side_effect = ConnectionError
+    with pytest.raises(ConnectionError):
+        middleware('eth_blockNumber', [])
+
+    assert RPC_REQUESTS.value(method='eth_blockNumber') == requests + 3
+    assert RPC_ERRORS.value(method='eth_blockNumber') == errors + 2
@@ -0,0 +1,115 @@
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask
+
+from monitor.profiling import add_profile_endpoint, profile_flask_requests, SamplingProfiler
+
+
+def busy_wait(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def read_profile(filepath: str) -> dict:
+    with open(filepath) as profile_file:
+        lines = profile_file.read().splitlines()
+    return {line.rsplit(' ', 1)[0]: int(line.rsplit(' ', 1)[1]) for line in lines}
+
+
+def test_profiler_not_armed(tmpdir):
+    profiler = SamplingProfiler(name='test', output_dir=str(tmpdir), interval=0.001)
+    with profiler.profile('round-1') as session:
+        assert session is None
+    assert profiler.written == []
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_profiler_samples_pool_threads(tmpdir):
+    profiler = SamplingProfiler(name='test', output_dir=str(tmpdir), interval=0.001)
+    profiler.arm(count=1)
+
+    # work handed off to another pool, like collectors run by a round on the reactor thread pool
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='collector') as executor:
+        with profiler.profile('round-1') as session:
+            assert session is not None
+            executor.submit(busy_wait, 0.2).result()
+        with profiler.profile('round-2') as session:
+            assert session is None  # only armed for one
+
+    assert profiler.remaining == 0
+    assert len(profiler.written) == 1
+    filepath = profiler.written[0]
+    assert os.path.basename(filepath).startswith('test-round-1-')
+    assert filepath.endswith('.collapsed')
+
+    stacks = read_profile(filepath)
+    busy = {stack: count for stack, count in stacks.items() if 'busy_wait (test_profiling.py:' in stack}
+    assert busy
+    assert all(stack.startswith('collector_0;') for stack in busy)
+    # the waiting thread is idle, so left out
+    assert not any(stack.startswith(f'{threading.current_thread().name};') for stack in stacks)
+
+
+def test_profiler_one_section_at_a_time(tmpdir):
+    profiler = SamplingProfiler(name='test', output_dir=str(tmpdir), interval=0.001)
+    profiler.arm(count=2)
+    with profiler.profile('outer') as outer:
+        with profiler.profile('inner') as inner:
+            assert outer is not None and inner is None
+    assert profiler.remaining == 1
+
+    with pytest.raises(ValueError):
+        profiler.arm(count=-1)
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR2'), reason="No SIGUSR2 on this platform")
+def test_profiler_signal_handler(tmpdir):
+    profiler = SamplingProfiler(name='test', output_dir=str(tmpdir))
+    previous_handler = signal.getsignal(signal.SIGUSR2)
+    try:
+        assert profiler.install_signal_handler(count=2)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert profiler.remaining == 2
+    finally:
+        signal.signal(signal.SIGUSR2, previous_handler)
+
+    # signal handlers can only be installed from the main thread
+    installed = list()
+    thread = threading.Thread(target=lambda: installed.append(profiler.install_signal_handler()))
+    thread.start()
+    thread.join()
+    assert installed == [False]
+
+
+def test_profile_endpoint_and_requests(tmpdir):
+    flask = Flask('test')
+    profiler = SamplingProfiler(name='dashboard', output_dir=str(tmpdir), interval=0.001)
+    profile_flask_requests(flask_server=flask, profiler=profiler)
+    add_profile_endpoint(flask_server=flask, profiler=profiler, unit='requests')
+
+    @flask.route('/supply_information')
+    def supply_information():
+        busy_wait(0.05)
+        return 'ok'
+
+    client = flask.test_client()
+    response = client.post('/admin/profile?count=1', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 403
+    assert client.post('/admin/profile?count=x', environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code == 400
+    assert profiler.remaining == 0
+
+    response = client.post('/admin/profile?count=1', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 200
+    assert profiler.remaining == 1
+
+    client.get('/supply_information')
+    client.get('/supply_information')
+    assert len(profiler.written) == 1
+    assert os.path.basename(profiler.written[0]).startswith('dashboard-supply_information-')
+    assert any('supply_information (test_profiling.py:' in stack for stack in read_profile(profiler.written[0]))
@@ -0,0 +1,102 @@
+from collections import namedtuple
+
+from nucypher.blockchain.eth.token import NU
+
+from monitor.projection import LockedTokensProjection
+
+SubStake = namedtuple('SubStake', ['first_period', 'last_period', 'locked_value'])
+
+CURRENT_PERIOD = 1000
+
+
+class FakeStakingAgent:
+    """Answers get_all_active_stakers by walking every sub-stake, like StakingEscrow does per period"""
+
+    def __init__(self, sub_stakes):
+        self.sub_stakes = sub_stakes
+        self.current_period = CURRENT_PERIOD
+        self.get_all_stakes_calls = 0
+
+    def get_current_period(self):
+        return self.current_period
+
+    def get_all_stakes(self, staker_address):
+        self.get_all_stakes_calls += 1
+        return list(self.sub_stakes[staker_address])
+
+    def get_all_active_stakers(self, periods, pagination_size=None):
+        period = self.current_period + periods
+        stakers = dict()
+        for staker_address, sub_stakes in self.sub_stakes.items():
+            locked = sum(s.locked_value for s in sub_stakes if s.first_period <= period <= s.last_period)
+            if locked:
+                stakers[staker_address] = locked
+        return sum(stakers.values()), stakers
+
+
+def legacy_projection(staking_agent, periods):
+    token_counter = dict()
+    for day in range(1, periods + 1):
+        tokens, stakers = staking_agent.get_all_active_stakers(periods=day)
+        token_counter[day] = (float(NU.from_nunits(tokens).to_tokens()), len(stakers))
+    return token_counter
+
+
+def sub_stakes():
+    nu = 10 ** 18
+    return {
+        '0xA': [SubStake(CURRENT_PERIOD - 10, CURRENT_PERIOD + 30, 15_000 * nu),
+                SubStake(CURRENT_PERIOD + 1, CURRENT_PERIOD + 400, 2_500_000 * nu)],
+        '0xB': [SubStake(CURRENT_PERIOD - 100, CURRENT_PERIOD + 1, 40_000 * nu + 1)],
+        '0xC': [SubStake(CURRENT_PERIOD - 5, CURRENT_PERIOD + 5, 15_000 * nu),
+                SubStake(CURRENT_PERIOD - 5, CURRENT_PERIOD + 90, 30_000 * nu),
+                SubStake(CURRENT_PERIOD - 50, CURRENT_PERIOD - 1, 99_999 * nu)],  # already unlocked
+        '0xD': [SubStake(CURRENT_PERIOD - 5, CURRENT_PERIOD, 15_000 * nu)],  # unlocks next period
+    }
+
+
+def test_projection_matches_per_period_queries():
+    staking_agent = FakeStakingAgent(sub_stakes())
+    projection = LockedTokensProjection(staking_agent=staking_agent)
+
+    assert projection.project(periods=365) == legacy_projection(staking_agent, periods=365)
+    assert projection.project(periods=7) == legacy_projection(staking_agent, periods=7)
+
+
+def test_projection_refreshes_cached_schedules():
+    staking_agent = FakeStakingAgent(sub_stakes())
+    projection = LockedTokensProjection(staking_agent=staking_agent)
+
+    projection.project(periods=30)
+    assert staking_agent.get_all_stakes_calls == 3  # 0xD has nothing locked next period
+
+    # same period, no changes
+    projection.project(periods=30)
+    assert staking_agent.get_all_stakes_calls == 3
+
+    # a staker adds a sub-stake
+    staking_agent.sub_stakes['0xB'].append(SubStake(CURRENT_PERIOD + 1, CURRENT_PERIOD + 20, 15_000 * 10 ** 18))
+    assert projection.project(periods=30) == legacy_projection(staking_agent, periods=30)
+    assert staking_agent.get_all_stakes_calls == 4
+
+    # a staker prolongs a sub-stake, which doesn't change next period's locked tokens
+    first_period, last_period, locked_value = staking_agent.sub_stakes['0xC'][0]
+    staking_agent.sub_stakes['0xC'][0] = SubStake(first_period, last_period + 10, locked_value)
+    projection.invalidate(['0xC'])
+    assert projection.project(periods=30) == legacy_projection(staking_agent, periods=30)
+    assert staking_agent.get_all_stakes_calls == 5
+
+    projection.invalidate()
+    projection.project(periods=30)
+    assert staking_agent.get_all_stakes_calls == 8
+
+    # new period
+    staking_agent.current_period += 1
+    assert projection.project(periods=30) == legacy_projection(staking_agent, periods=30)
+    assert staking_agent.get_all_stakes_calls == 11
+
+
+def test_projection_without_stakers():
+    staking_agent = FakeStakingAgent(dict())
+    projection = LockedTokensProjection(staking_agent=staking_agent)
+    assert projection.project(periods=3) == {1: (0.0, 0), 2: (0.0, 0), 3: (0.0, 0)}
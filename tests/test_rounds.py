@@ -0,0 +1,213 @@
+import threading
+import time
+
+import pytest
+
+from monitor.rounds import CollectorTask, Every, EveryBlock, EveryPeriod, RoundContext, RoundExecutor, Schedule
+
+
+def test_round_executor_runs_independent_collectors_concurrently():
+    def slow(value):
+        def measure():
+            time.sleep(0.3)
+            return value
+        return measure
+
+    executor = RoundExecutor(tasks=[CollectorTask(name, slow(name)) for name in ('a', 'b', 'c', 'd')], max_workers=4)
+    start = time.monotonic()
+    result = executor.run()
+    duration = time.monotonic() - start
+
+    assert result.values == {'a': 'a', 'b': 'b', 'c': 'c', 'd': 'd'}
+    assert not result.failed
+    assert set(result.durations) == {'a', 'b', 'c', 'd'}
+    assert duration < 1.0  # roughly the slowest collector, not the sum
+    executor.shutdown()
+
+
+def test_round_executor_dependencies():
+    order = list()
+    lock = threading.Lock()
+
+    def record(name, value):
+        def measure(**dependencies):
+            with lock:
+                order.append(name)
+            return value, dependencies
+        return measure
+
+    executor = RoundExecutor(tasks=[
+        CollectorTask('totals', record('totals', 3), depends_on=('nodes', 'stakers')),
+        CollectorTask('nodes', record('nodes', 1)),
+        CollectorTask('stakers', record('stakers', 2), depends_on=('nodes',)),
+    ])
+    result = executor.run()
+
+    assert order == ['nodes', 'stakers', 'totals']
+    assert result.values['totals'] == (3, {'nodes': (1, {}), 'stakers': (2, {'nodes': (1, {})})})
+    executor.shutdown()
+
+
+def test_round_executor_timeouts_and_failures_use_previous_values():
+    release = threading.Event()
+
+    hangs_calls = list()
+
+    def hangs():
+        hangs_calls.append(1)
+        release.wait(5)
+        return 'late'
+
+    def fails():
+        raise ConnectionError("provider went away")
+
+    executor = RoundExecutor(tasks=[
+        CollectorTask('hangs', hangs, timeout=0.2),
+        CollectorTask('fails', fails),
+        CollectorTask('depends', lambda hangs, fails: (hangs, fails), depends_on=('hangs', 'fails')),
+        CollectorTask('fine', lambda: 'fresh', timeout=0.2),
+    ], max_workers=2)
+
+    start = time.monotonic()
+    result = executor.run(previous={'hangs': 'old hangs', 'fails': 'old fails', 'fine': 'stale'})
+    assert time.monotonic() - start < 2
+
+    assert result.values == {'hangs': 'old hangs',
+                             'fails': 'old fails',
+                             'depends': ('old hangs', 'old fails'),
+                             'fine': 'fresh'}
+    assert set(result.failed) == {'hangs', 'fails'}
+    assert 'hangs' not in result.durations
+
+    # not submitted again while the timed out run is still going
+    result = executor.run(previous={'hangs': 'old hangs'})
+    assert result.values['hangs'] == 'old hangs'
+    assert 'hangs' in result.failed
+    assert hangs_calls == [1]
+
+    # no previous round
+    release.set()
+    time.sleep(0.1)
+    result = executor.run()
+    assert result.values['fails'] is None
+    assert result.values['hangs'] == 'late'
+
+    executor.shutdown()
+    assert executor.run().values['fine'] == 'fresh'  # restarts after shutdown
+    executor.shutdown()
+
+
+def test_round_executor_invalid_dependencies():
+    with pytest.raises(RoundExecutor.UnknownDependency):
+        RoundExecutor(tasks=[CollectorTask('a', lambda b: b, depends_on=('b',))])
+
+    with pytest.raises(RoundExecutor.CyclicDependency):
+        RoundExecutor(tasks=[CollectorTask('a', lambda b: b, depends_on=('b',)),
+                             CollectorTask('b', lambda a: a, depends_on=('a',))])
+
+
+def test_schedule_is_abstract():
+    with pytest.raises(TypeError):
+        Schedule()
+
+    class Incomplete(Schedule):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_round_executor_schedules():
+    calls = {'always': 0, 'seconds': 0, 'block': 0, 'period': 0}
+
+    def count(name):
+        def measure():
+            calls[name] += 1
+            return calls[name]
+        return measure
+
+    executor = RoundExecutor(tasks=[
+        CollectorTask('always', count('always')),
+        CollectorTask('seconds', count('seconds'), schedule=Every(seconds=60)),
+        CollectorTask('block', count('block'), schedule=EveryBlock()),
+        CollectorTask('period', count('period'), schedule=EveryPeriod()),
+        CollectorTask('sum', lambda block, period: block + period, depends_on=('block', 'period'),
+                      schedule=EveryBlock()),
+    ])
+
+    def round_at(timestamp, block_number, period):
+        return executor.run(context=RoundContext(timestamp=timestamp, block_number=block_number, period=period))
+
+    result = round_at(1000, block_number=1, period=10)
+    assert calls == {'always': 1, 'seconds': 1, 'block': 1, 'period': 1}
+    assert result.values['sum'] == 2
+
+    result = round_at(1015, block_number=1, period=10)  # nothing new
+    assert calls == {'always': 2, 'seconds': 1, 'block': 1, 'period': 1}
+    assert result.values == {'always': 2, 'seconds': 1, 'block': 1, 'period': 1, 'sum': 2}
+    assert set(result.durations) == {'always'}
+    assert result.ages(now=1015) == {'always': 0, 'seconds': 15, 'block': 15, 'period': 15, 'sum': 15}
+
+    result = round_at(1030, block_number=2, period=10)  # new block
+    assert calls == {'always': 3, 'seconds': 1, 'block': 2, 'period': 1}
+    assert result.values['sum'] == 3  # cached dependency values are passed on
+
+    round_at(1060, block_number=3, period=11)  # new period, a minute after the first round
+    assert calls == {'always': 4, 'seconds': 2, 'block': 3, 'period': 2}
+    executor.shutdown()
+
+
+def test_round_executor_retries_failed_scheduled_collectors():
+    outcomes = [RuntimeError, 'ok']
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if outcome is RuntimeError:
+            raise outcome
+        return outcome
+
+    executor = RoundExecutor(tasks=[CollectorTask('flaky', flaky, schedule=EveryPeriod())])
+    result = executor.run(context=RoundContext(timestamp=1, period=1), previous={'flaky': 'before restart'})
+    assert result.values['flaky'] == 'before restart'
+    assert result.ages(now=2) == {'flaky': None}
+
+    result = executor.run(context=RoundContext(timestamp=2, period=1))  # same period, but never refreshed
+    assert result.values['flaky'] == 'ok'
+    executor.shutdown()
+
+
+def test_round_executor_inputs():
+    calls = {'staking': 0, 'storage': 0}
+
+    def count(name):
+        def measure():
+            calls[name] += 1
+            return calls[name]
+        return measure
+
+    executor = RoundExecutor(tasks=[
+        CollectorTask('staking', count('staking'), inputs=frozenset(('staking',))),
+        CollectorTask('storage', count('storage'), schedule=Every(seconds=60), inputs=frozenset(('storage',))),
+    ])
+
+    def round_at(timestamp, *changed):
+        return executor.run(context=RoundContext(timestamp=timestamp, changed=frozenset(changed)))
+
+    assert not round_at(0).noop  # first round always refreshes
+    assert calls == {'staking': 1, 'storage': 1}
+
+    result = round_at(15)
+    assert result.noop
+    assert result.values == {'staking': 1, 'storage': 1}
+
+    round_at(30, 'staking', 'storage')  # storage changed, but it is not due yet
+    assert calls == {'staking': 2, 'storage': 1}
+
+    round_at(60)  # the change is remembered until it is due
+    assert calls == {'staking': 2, 'storage': 2}
+
+    assert round_at(120).noop
+
+    executor.run(context=RoundContext(timestamp=180))  # changes unknown
+    assert calls == {'staking': 3, 'storage': 3}
+    executor.shutdown()
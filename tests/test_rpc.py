@@ -0,0 +1,273 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from eth_utils import function_abi_to_4byte_selector, to_checksum_address
+from hexbytes import HexBytes
+from nucypher.blockchain.eth.agents import StakingEscrowAgent
+from nucypher.blockchain.eth.constants import NULL_ADDRESS
+from web3 import Web3
+
+from monitor.rpc import (
+    BatchingNotSupported,
+    BlockPinnedAgent,
+    BlockReadCache,
+    ContractBatchReader,
+    JSONRPCBatchTransport,
+    StakerInfo,
+    StakingEscrowBatchReader
+)
+
+STAKING_ESCROW_ABI = [
+    {'type': 'function', 'name': 'getLockedTokens', 'stateMutability': 'view',
+     'inputs': [{'name': '_staker', 'type': 'address'}, {'name': '_periods', 'type': 'uint16'}],
+     'outputs': [{'name': 'lockedValue', 'type': 'uint256'}]},
+    {'type': 'function', 'name': 'getLastCommittedPeriod', 'stateMutability': 'view',
+     'inputs': [{'name': '_staker', 'type': 'address'}],
+     'outputs': [{'name': '', 'type': 'uint16'}]},
+    {'type': 'function', 'name': 'getWorkerFromStaker', 'stateMutability': 'view',
+     'inputs': [{'name': '_staker', 'type': 'address'}],
+     'outputs': [{'name': '', 'type': 'address'}]},
+]
+STAKING_ESCROW_ADDRESS = to_checksum_address('0x' + 'ee' * 20)
+
+
+def staker(i: int) -> str:
+    return to_checksum_address(f'0x{i:040x}')
+
+
+class FakeNode:
+    """Local JSON-RPC endpoint answering batched eth_calls from in-memory staker state"""
+
+    def __init__(self, stakers: dict, supports_batches: bool = True):
+        self.w3 = Web3()
+        self.stakers = stakers  # staker -> (locked current, locked next, last committed period, worker)
+        self.supports_batches = supports_batches
+        self.batches = list()
+        self.functions = {HexBytes(function_abi_to_4byte_selector(fn_abi)): fn_abi for fn_abi in STAKING_ESCROW_ABI}
+
+    def eth_call(self, params):
+        transaction, block_identifier = params
+        assert transaction['to'] == STAKING_ESCROW_ADDRESS
+        data = HexBytes(transaction['data'])
+        fn_abi = self.functions[data[:4]]
+        args = self.w3.codec.decode_abi([i['type'] for i in fn_abi['inputs']], data[4:])
+        locked_current, locked_next, last_committed_period, worker = self.stakers[to_checksum_address(args[0])]
+        value = {'getLockedTokens': lambda: locked_next if args[1] else locked_current,
+                 'getLastCommittedPeriod': lambda: last_committed_period,
+                 'getWorkerFromStaker': lambda: worker}[fn_abi['name']]()
+        return HexBytes(self.w3.codec.encode_abi([o['type'] for o in fn_abi['outputs']], [value])).hex()
+
+    def __call__(self, batch):
+        self.batches.append(batch)
+        if not self.supports_batches:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch requests not supported'}}
+        responses = list()
+        for request in batch:
+            assert request['method'] == 'eth_call'
+            if to_checksum_address(HexBytes(request['params'][0]['data'])[16:36]) == staker(666):
+                responses.append({'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': 'revert'}})
+                continue
+            responses.append({'jsonrpc': '2.0', 'id': request['id'], 'result': self.eth_call(request['params'])})
+        return list(reversed(responses))  # batch responses are unordered
+
+
+def staking_escrow():
+    return Web3().eth.contract(address=STAKING_ESCROW_ADDRESS, abi=STAKING_ESCROW_ABI)
+
+
+def staking_agent_for(node: FakeNode):
+    staking_agent = MagicMock(spec=StakingEscrowAgent)
+    staking_agent.contract = staking_escrow()
+    staking_agent.get_locked_tokens.side_effect = lambda staker_address, periods=0: node.stakers[staker_address][periods]
+    staking_agent.get_last_committed_period.side_effect = lambda staker_address: node.stakers[staker_address][2]
+    staking_agent.get_worker_from_staker.side_effect = lambda staker_address: node.stakers[staker_address][3]
+    return staking_agent
+
+
+def fake_stakers(n: int) -> dict:
+    stakers = dict()
+    for i in range(1, n + 1):
+        worker = NULL_ADDRESS if i % 5 == 0 else staker(1000 + i)
+        locked = 0 if i % 7 == 0 else i * 10 ** 21
+        stakers[staker(i)] = (locked, locked // 2, 100 + i, worker)
+    return stakers
+
+
+def test_contract_batch_reader_chunks_and_decodes():
+    node = FakeNode(fake_stakers(10))
+    reader = ContractBatchReader(contract=staking_escrow(), transport=node, chunk_size=4)
+
+    calls = [('getLockedTokens', (staker(i), 1)) for i in range(1, 11)] + [('getWorkerFromStaker', (staker(1),))]
+    results = reader.call(calls, block_identifier=12345)
+
+    assert len(node.batches) == 3  # 11 calls in chunks of 4
+    assert all(request['params'][1] == hex(12345) for batch in node.batches for request in batch)
+    assert results[:10] == [node.stakers[staker(i)][1] for i in range(1, 11)]
+    assert results[10] == staker(1001)  # checksummed, like web3
+
+
+def test_contract_batch_reader_errors():
+    with pytest.raises(ValueError):
+        ContractBatchReader(contract=staking_escrow(), transport=FakeNode(dict()), chunk_size=0)
+
+    stakers = fake_stakers(2)
+    stakers[staker(666)] = (0, 0, 0, NULL_ADDRESS)
+    reader = ContractBatchReader(contract=staking_escrow(), transport=FakeNode(stakers))
+    with pytest.raises(ValueError, match='revert'):
+        reader.call([('getLockedTokens', (staker(1), 0)), ('getLockedTokens', (staker(666), 0))])
+
+    node = FakeNode(stakers)
+    reader = ContractBatchReader(contract=staking_escrow(), transport=node)
+    with pytest.raises(ValueError, match='no function getStaker taking 1 argument'):
+        reader.call([('getStaker', (staker(1),))])
+    with pytest.raises(ValueError, match='no function getLockedTokens taking 1 argument'):
+        reader.call([('getLockedTokens', (staker(1),))])
+    assert not node.batches
+
+    reader = ContractBatchReader(contract=staking_escrow(), transport=FakeNode(stakers, supports_batches=False))
+    with pytest.raises(BatchingNotSupported):
+        reader.call([('getLockedTokens', (staker(1), 0))])
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_staking_escrow_batch_reader_matches_agent(chunk_size):
+    node = FakeNode(fake_stakers(30))
+    staking_agent = staking_agent_for(node)
+
+    batched = StakingEscrowBatchReader(staking_agent=staking_agent, chunk_size=chunk_size, transport=node)
+    assert batched.batching
+    stakers_info = batched.get_stakers_info(node.stakers)
+    assert len(node.batches) == -(-30 * 4 // chunk_size)
+    staking_agent.get_locked_tokens.assert_not_called()
+
+    # provider without batching falls back to the agent
+    staking_agent.blockchain.client.w3.provider = MagicMock()
+    sequential = StakingEscrowBatchReader(staking_agent=staking_agent, chunk_size=chunk_size)
+    assert not sequential.batching
+    assert sequential.get_stakers_info(node.stakers) == stakers_info
+
+    assert list(stakers_info) == list(node.stakers)
+    assert stakers_info[staker(3)] == StakerInfo(3 * 10 ** 21, 3 * 10 ** 21 // 2, 103, staker(1003))
+    assert stakers_info[staker(5)].worker == NULL_ADDRESS
+    assert batched.get_expired_stakers(node.stakers) == {staker(7), staker(14), staker(21), staker(28)}
+    assert batched.get_expired_stakers([]) == set()
+
+
+@pytest.mark.parametrize('status_code, body', [(200, [{'jsonrpc': '2.0', 'id': 1, 'result': '0x'}]),
+                                                (405, {'error': 'batch requests are not allowed'}),
+                                                (500, 'Internal Server Error'),
+                                                (200, {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600}})])
+def test_json_rpc_batch_transport_rejected_batches(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = (body if isinstance(body, str) else json.dumps(body)).encode()
+    transport = JSONRPCBatchTransport(endpoint_uri='http://localhost:8545')
+    batch = [{'jsonrpc': '2.0', 'id': 1, 'method': 'eth_call', 'params': []}]
+
+    with patch.object(requests, 'post', return_value=response) as post:
+        if isinstance(body, list):
+            assert transport(batch) == body
+        else:
+            with pytest.raises(BatchingNotSupported):
+                transport(batch)
+    assert json.loads(post.call_args[1]['data']) == batch
+
+
+def test_staking_escrow_batch_reader_falls_back_when_batches_rejected():
+    node = FakeNode(fake_stakers(10), supports_batches=False)
+    staking_agent = staking_agent_for(node)
+    reader = StakingEscrowBatchReader(staking_agent=staking_agent, transport=node)
+
+    expired = reader.get_expired_stakers(node.stakers)
+    assert expired == {staker(7)}
+    assert not reader.batching
+
+    reader.get_expired_stakers(node.stakers)
+    assert len(node.batches) == 1  # batching is not retried
+
+
+class FakeContractFunction:
+    def __init__(self, contract, fn_name, args):
+        self.contract, self.fn_name, self.args = contract, fn_name, args
+
+    def call(self, transaction=None, block_identifier='latest'):
+        self.contract.calls.append((self.fn_name, self.args, block_identifier))
+        if self.fn_name == 'getSubStakesLength':
+            return 2
+        return self.args[-1]
+
+
+class FakeContract:
+    def __init__(self):
+        self.calls = list()
+        self.functions = self
+
+    def __getattr__(self, fn_name):
+        return lambda *args: FakeContractFunction(self, fn_name, args)
+
+
+class FakeStakingAgent:
+    """Reads through its contract, like the nucypher agents do"""
+
+    def __init__(self):
+        self.contract = FakeContract()
+
+    def get_locked_tokens(self, staker_address, periods=0):
+        return self.contract.functions.getLockedTokens(staker_address, periods).call()
+
+    def get_all_stakes(self, staker_address):
+        length = self.contract.functions.getSubStakesLength(staker_address).call()
+        for index in range(length):
+            yield self.contract.functions.getSubStakeInfo(staker_address, index).call()
+
+
+def test_block_read_cache_pins_reads_to_block():
+    read_cache = BlockReadCache()
+    staking_agent = FakeStakingAgent()
+    contract = staking_agent.contract
+    agent_reads = BlockPinnedAgent(staking_agent, read_cache=read_cache)
+
+    # not pinned, not cached
+    agent_reads.get_locked_tokens(staker_address=staker(1))
+    agent_reads.get_locked_tokens(staker_address=staker(1))
+    assert [block for *_, block in contract.calls] == ['latest', 'latest']
+
+    contract.calls.clear()
+    with read_cache.pinned(100):
+        assert agent_reads.get_locked_tokens(staker_address=staker(1)) == 0
+        assert agent_reads.get_locked_tokens(staker_address=staker(1)) == 0
+        assert agent_reads.get_locked_tokens(staker_address=staker(1), periods=1) == 1
+        assert list(agent_reads.get_all_stakes(staker_address=staker(1))) == [0, 1]
+        assert list(agent_reads.get_all_stakes(staker_address=staker(1))) == [0, 1]  # not an exhausted generator
+        assert len(contract.calls) == 5
+        assert all(block == 100 for *_, block in contract.calls)  # every read passed the pinned block
+    assert read_cache.pinned_block is None
+    assert agent_reads.contract is contract  # everything else passes through
+
+    with read_cache.pinned(100):
+        agent_reads.get_locked_tokens(staker_address=staker(1))
+        assert len(contract.calls) == 5
+
+    with read_cache.pinned(101):
+        agent_reads.get_locked_tokens(staker_address=staker(1))
+        assert contract.calls[-1] == ('getLockedTokens', (staker(1), 0), 101)
+
+
+def test_staking_escrow_batch_reader_shares_pinned_reads():
+    node = FakeNode(fake_stakers(10))
+    read_cache = BlockReadCache()
+    reader = StakingEscrowBatchReader(staking_agent=staking_agent_for(node), transport=node, read_cache=read_cache)
+
+    with read_cache.pinned(1234):
+        expired = reader.get_expired_stakers(node.stakers)
+        stakers_info = reader.get_stakers_info(node.stakers)
+        assert reader.get_stakers_info(node.stakers) == stakers_info
+
+    assert expired == {staker(7)}
+    assert [len(batch) for batch in node.batches] == [20, 20]  # locked tokens were only read once
+    assert all(request['params'][1] == hex(1234) for batch in node.batches for request in batch)
+
+    reader.get_expired_stakers(node.stakers)
+    assert node.batches[-1][0]['params'][1] == 'latest'
@@ -0,0 +1,213 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask, request
+
+from monitor import snapshots
+from monitor.snapshots import iter_ndjson, parse_list, project_stats, SerializedSnapshot, serialize
+
+STATS = {'blocknumber': 1234, 'node_details': {'confirmed': [{'staker_address': f'0x{i:040x}'} for i in range(50)]}}
+
+
+def create_app(snapshot: SerializedSnapshot) -> Flask:
+    flask = Flask('test')
+
+    @flask.route('/stats')
+    def stats():
+        return snapshot.make_response(flask_server=flask, request=request)
+
+    return flask
+
+
+def test_serialize():
+    assert serialize({'a': [1, 2]}) == b'{"a":[1,2]}'
+    assert json.loads(serialize(STATS, pretty=True)) == STATS
+
+
+def test_snapshot_encodings():
+    snapshot = SerializedSnapshot(STATS)
+    assert json.loads(snapshot.body) == STATS
+    assert gzip.decompress(snapshot.encoded['gzip']) == snapshot.body
+    assert SerializedSnapshot(dict(STATS)).etag == snapshot.etag
+    assert SerializedSnapshot({'blocknumber': 1235}).etag != snapshot.etag
+
+    client = create_app(snapshot).test_client()
+    response = client.get('/stats')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'application/json'
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == f'"{snapshot.etag}"'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.get_json() == STATS
+
+    response = client.get('/stats', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == STATS
+
+    response = client.get('/stats', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_snapshot_brotli():
+    brotli = pytest.importorskip('brotli')
+    snapshot = SerializedSnapshot(STATS)
+    client = create_app(snapshot).test_client()
+    response = client.get('/stats', headers={'Accept-Encoding': 'gzip, deflate, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == STATS
+
+
+def test_snapshot_without_brotli(monkeypatch):
+    monkeypatch.setattr(snapshots, 'brotli', None)
+    snapshot = SerializedSnapshot(STATS)
+    assert set(snapshot.encoded) == {'identity', 'gzip'}
+    response = create_app(snapshot).test_client().get('/stats', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_snapshot_not_modified():
+    snapshot = SerializedSnapshot(STATS)
+    client = create_app(snapshot).test_client()
+
+    response = client.get('/stats', headers={'If-None-Match': f'"{snapshot.etag}"', 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == f'"{snapshot.etag}"'
+
+    response = client.get('/stats', headers={'If-None-Match': '"outdated", W/"' + snapshot.etag + '"'})
+    assert response.status_code == 304
+
+    response = client.get('/stats', headers={'If-None-Match': '"outdated"'})
+    assert response.status_code == 200
+
+
+def test_project_stats():
+    stats = {'current_period': 10,
+             'activity': {'active': 1},
+             'node_details': {'confirmed': [{'id': 1}, {'id': 2}], 'unconfirmed': [{'id': 3}]}}
+    assert project_stats(stats) is stats
+    assert project_stats(stats, fields=('activity', 'current_period')) == {'activity': {'active': 1},
+                                                                         'current_period': 10}
+    assert project_stats(stats, statuses=('unconfirmed',)) == {'current_period': 10,
+                                                               'activity': {'active': 1},
+                                                               'node_details': {'unconfirmed': [{'id': 3}]}}
+    assert project_stats(stats, fields=('current_period',), statuses=('unconfirmed',)) == {'current_period': 10}
+    assert len(stats['node_details']) == 2  # not modified
+    with pytest.raises(KeyError):
+        project_stats(stats, fields=('activity', 'unknown'))
+
+    assert parse_list(None) is None
+    assert parse_list(' , ') is None
+    assert parse_list('top_stakers, activity,activity') == ('activity', 'top_stakers')
+    assert parse_list('Unconfirmed,pending', lower=True) == ('pending', 'unconfirmed')
+
+    lines = list(iter_ndjson(stats['node_details']))
+    assert lines == [b'{"id":1}\n', b'{"id":2}\n', b'{"id":3}\n']
+    assert list(iter_ndjson(stats['node_details'], statuses=('unconfirmed',))) == [b'{"id":3}\n']
+
+
+def test_snapshot_projections():
+    snapshot = SerializedSnapshot(STATS)
+    assert snapshot.project() is snapshot
+
+    projection = snapshot.project(fields=('blocknumber',))
+    assert json.loads(projection.body) == {'blocknumber': 1234}
+    assert projection.etag != snapshot.etag
+    assert snapshot.project(fields=('blocknumber',)) is projection  # serialized once
+
+    # least recently used projections are dropped
+    snapshot.MAX_PROJECTIONS = 2
+    snapshot.project(statuses=('confirmed',))
+    snapshot.project(statuses=('pending',))
+    assert snapshot.project(fields=('blocknumber',)) is not projection
+
+
+
+def test_diff_stats():
+    old = {'round': 1, 'blocknumber': 10, 'dropped': 1,
+           'node_details': {'confirmed': [{'staker_address': '0xA', 'uptime': 1}, {'staker_address': '0xB'}],
+                            'pending': [{'staker_address': '0xC'}]}}
+    new = {'round': 2, 'blocknumber': 10,
+           'node_details': {'confirmed': [{'staker_address': '0xA', 'uptime': 2}, {'staker_address': '0xC'}],
+                            'pending': [{'staker_address': '0xD'}]}}
+    assert snapshots.diff_stats(old, new) == {
+        'changed': {'round': 2},
+        'removed': ['dropped'],
+        'node_details': {'added': {'pending': [{'staker_address': '0xD'}]},
+                         'changed': {'confirmed': [{'staker_address': '0xA', 'uptime': 2}, {'staker_address': '0xC'}]},
+                         'removed': ['0xB']}}
+    assert snapshots.diff_stats(new, new) == {'changed': {}, 'removed': [],
+                                              'node_details': {'added': {}, 'changed': {}, 'removed': []}}
+
+
+def stats_snapshot(round_number: int, data: dict) -> snapshots.StatsSnapshot:
+    return snapshots.StatsSnapshot(round=round_number, block_number=round_number + 100, started=0, duration=0.1,
+                                   serialized=SerializedSnapshot(data))
+
+
+def test_snapshot_history():
+    history = snapshots.SnapshotHistory(initial=stats_snapshot(0, {'status': 'initializing'}), size=3)
+    latest = history.latest
+    assert latest.round == 0 and latest.data == {'status': 'initializing'}
+
+    for round_number in range(1, 5):
+        history.publish(stats_snapshot(round_number, {'round': round_number}))
+    assert history.rounds == (2, 3, 4)
+    assert history.latest.round == 4 and history.latest.block_number == 104
+    assert history.get(3).data == {'round': 3}
+    assert history.get(1) is None
+    assert latest.data == {'status': 'initializing'}  # readers keep the snapshot they got
+
+    # limited in size too, though the latest is always kept
+    large = stats_snapshot(5, {'round': 5, 'nodes': [f'0x{i:040x}' for i in range(100)]})
+    history.max_bytes = large.size + history.get(4).size
+    history.publish(large)
+    assert history.rounds == (4, 5)
+    history.max_bytes = 1
+    history.publish(stats_snapshot(6, {'round': 6}))
+    assert history.rounds == (6, )
+
+
+def test_snapshot_history_deltas():
+    stats = {'round': 1, 'node_details': {'confirmed': [{'staker_address': '0xA'}]}}
+    history = snapshots.SnapshotHistory(initial=stats_snapshot(1, stats), size=2)
+    for round_number in (2, 3):
+        stats = dict(stats, round=round_number)
+        history.publish(stats_snapshot(round_number, stats))
+    assert history.rounds == (2, 3)
+
+    etag = history.get(2).serialized.etag
+    latest_etag = history.latest.serialized.etag
+    delta = history.delta(since=2, etag=etag)
+    assert json.loads(delta.body) == {'round': 3, 'etag': latest_etag, 'since': 2, 'full': False,
+                                      'changed': {'round': 3}, 'removed': [],
+                                      'node_details': {'added': {}, 'changed': {}, 'removed': []}}
+    assert history.delta(since=2, etag=etag) is delta  # computed once per round
+    assert history.delta(since=2) is delta  # without an ETag, round 2 is taken to be the client's
+
+    # too old, never published, or another process' round 2 (from before a restart)
+    for since, since_etag in ((1, etag), (1, None), (7, etag), (2, 'other')):
+        assert json.loads(history.delta(since=since, etag=since_etag).body) == {'round': 3, 'etag': latest_etag,
+                                                                                'full': True, 'stats': stats}
+
+    history.publish(stats_snapshot(4, dict(stats, round=4)))
+    assert history.delta(since=2, etag=etag) is not delta
+    assert json.loads(history.delta(since=2, etag=etag).body)['full'] is True
+
+
+def test_snapshot_file(tmpdir):
+    filepath = str(tmpdir.join('monitor', 'stats.json'))
+    stats_file = snapshots.SnapshotFile(filepath=filepath)
+    assert stats_file.current() is None  # not written yet
+
+    written = SerializedSnapshot(STATS)
+    snapshots.write_snapshot_file(filepath=filepath, snapshot=written)
+    current = stats_file.current()
+    assert current.data == STATS
+    assert current.etag == written.etag  # same document, same ETag from either process
+    assert stats_file.current() is current  # only read again once replaced
+
+    snapshots.write_snapshot_file(filepath=filepath, snapshot=SerializedSnapshot({'blocknumber': 1235}))
+    assert stats_file.current().data == {'blocknumber': 1235}
+    assert tmpdir.join('monitor').listdir() == [tmpdir.join('monitor', 'stats.json')]  # no temporary files left
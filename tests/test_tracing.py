@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+from eth_utils import function_abi_to_4byte_selector, to_checksum_address
+from flask import Flask
+from hexbytes import HexBytes
+from web3 import Web3
+
+from monitor.tracing import add_trace_endpoint, attribute_flask_requests, caller, current_caller, RPCTracer
+
+STAKING_ESCROW_ABI = [
+    {'type': 'function', 'name': 'getLockedTokens', 'stateMutability': 'view',
+     'inputs': [{'name': '_staker', 'type': 'address'}, {'name': '_periods', 'type': 'uint16'}],
+     'outputs': [{'name': 'lockedValue', 'type': 'uint256'}]},
+]
+STAKING_ESCROW_ADDRESS = to_checksum_address('0x' + 'ee' * 20)
+GET_LOCKED_TOKENS = HexBytes(function_abi_to_4byte_selector(STAKING_ESCROW_ABI[0])).hex()
+
+
+def eth_call(data: str, block: str = 'latest') -> list:
+    return [{'to': STAKING_ESCROW_ADDRESS, 'data': data}, block]
+
+
+def create_tracer() -> RPCTracer:
+    tracer = RPCTracer()
+    tracer.register_contract('StakingEscrow', Web3().eth.contract(address=STAKING_ESCROW_ADDRESS,
+                                                                  abi=STAKING_ESCROW_ABI))
+    return tracer
+
+
+def test_caller_context():
+    assert current_caller() == 'unknown'
+    with caller('Known Nodes'):
+        with caller('node_details'):
+            assert current_caller() == 'node_details'
+        assert current_caller() == 'Known Nodes'
+
+        # per thread
+        other_thread_caller = list()
+        thread = threading.Thread(target=lambda: other_thread_caller.append(current_caller()))
+        thread.start()
+        thread.join()
+        assert other_thread_caller == ['unknown']
+    assert current_caller() == 'unknown'
+
+
+def test_tracer_middleware():
+    tracer = create_tracer()
+    responses = {'eth_call': {'jsonrpc': '2.0', 'result': '0x' + '00' * 32},
+                 'eth_blockNumber': {'jsonrpc': '2.0', 'error': {'code': -32000, 'message': 'unavailable'}}}
+    middleware = tracer.middleware(lambda method, params: responses[method], w3=None)
+
+    with caller('Known Nodes'):
+        middleware('eth_call', eth_call(GET_LOCKED_TOKENS + '01'))
+        middleware('eth_call', eth_call(GET_LOCKED_TOKENS + '01'))  # redundant
+        middleware('eth_call', eth_call(GET_LOCKED_TOKENS + '01', block='0x10'))  # different block
+        middleware('eth_call', eth_call('0xdeadbeef'))
+    middleware('eth_blockNumber', [])
+    with pytest.raises(KeyError):
+        middleware('eth_chainId', [])
+
+    rows = {(row['caller'], row['call']): row for row in tracer.summary(sort='count')}
+    locked_tokens = rows[('Known Nodes', 'StakingEscrow.getLockedTokens')]
+    assert locked_tokens['count'] == 3
+    assert locked_tokens['redundant'] == 1
+    assert locked_tokens['response_bytes'] > 64
+    assert rows[('Known Nodes', f'eth_call 0xdeadbeef@{STAKING_ESCROW_ADDRESS.lower()[:10]}')]['count'] == 1
+    assert rows[('unknown', 'eth_blockNumber')]['errors'] == 1
+    assert rows[('unknown', 'eth_chainId')]['errors'] == 1
+    assert tracer.summary(top=1, sort='count')[0]['call'] == 'StakingEscrow.getLockedTokens'
+
+    with pytest.raises(ValueError):
+        tracer.summary(sort='unknown')
+
+
+def test_tracer_rounds_and_batches():
+    tracer = create_tracer()
+
+    def transport(batch):
+        return [{'jsonrpc': '2.0', 'id': request['id'], 'result': '0x01'} for request in batch]
+
+    traced_transport = tracer.wrap_transport(transport)
+    assert tracer.wrap_transport(None) is None
+    batch = [{'jsonrpc': '2.0', 'id': i, 'method': 'eth_call', 'params': eth_call(GET_LOCKED_TOKENS + f'{i:02x}')}
+             for i in range(3)]
+    with caller('activity'):
+        assert traced_transport(batch) == transport(batch)
+
+    round_rows = tracer.end_round()
+    assert [(row['caller'], row['call'], row['count'], row['redundant']) for row in round_rows] == [
+        ('activity', 'StakingEscrow.getLockedTokens', 3, 0)]
+    assert tracer.end_round() == []  # nothing since
+
+    # totals are kept across rounds
+    assert tracer.summary()[0]['count'] == 3
+    tracer.reset()
+    assert tracer.summary() == []
+
+
+def test_trace_endpoint():
+    tracer = create_tracer()
+    flask = Flask('test')
+    attribute_flask_requests(flask_server=flask)
+    add_trace_endpoint(flask_server=flask, tracer=tracer)
+    middleware = tracer.middleware(lambda method, params: {'result': '0x1'}, w3=None)
+
+    @flask.route('/_dash-update-component', methods=['POST'])
+    def update_component():
+        middleware('eth_blockNumber', [])
+        return 'ok'
+
+    client = flask.test_client()
+    client.post('/_dash-update-component', json={'output': 'staked-tokens.children'})
+    assert current_caller() == 'unknown'
+
+    rows = client.get('/rpc_trace?top=5&sort=count').get_json()
+    assert [(row['caller'], row['call'], row['count']) for row in rows] == [
+        ('callback staked-tokens.children', 'eth_blockNumber', 1)]
+    assert client.get('/rpc_trace?sort=unknown').status_code == 400
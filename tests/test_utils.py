@@ -1,9 +1,11 @@
+import time
 from unittest import mock
 
 import pytest
 from nucypher.blockchain.eth.networks import NetworksInventory
 
-from monitor.utils import get_etherscan_url, EtherscanURLType
+from monitor.metrics import COLLECTOR_DURATION, COLLECTOR_LAST_RUN, COLLECTOR_RUNS
+from monitor.utils import collector, get_etherscan_url, EtherscanURLType
 
 ADDRESS_OR_TX_HASH = "0xdeadbeef"
 
@@ -77,3 +79,26 @@ def test_etherscan_url_goerli(chain_id_func):
                             url_type=EtherscanURLType.TRANSACTION,
                             address_or_tx_hash=ADDRESS_OR_TX_HASH)
     assert url == f"https://goerli.etherscan.io/tx/{ADDRESS_OR_TX_HASH}"
+
+
+def test_collector_metrics():
+    @collector(label="Test Measurement")
+    def measure(fail: bool = False):
+        if fail:
+            raise RuntimeError
+        return 42
+
+    # the registry is process wide, so only the changes made here are checked
+    successes = COLLECTOR_RUNS.value(collector="Test Measurement", result='success')
+    errors = COLLECTOR_RUNS.value(collector="Test Measurement", result='error')
+    observations, _ = COLLECTOR_DURATION.value(collector="Test Measurement")
+    before = time.time()
+
+    assert measure() == 42
+    with pytest.raises(RuntimeError):
+        measure(fail=True)
+
+    assert COLLECTOR_RUNS.value(collector="Test Measurement", result='success') == successes + 1
+    assert COLLECTOR_RUNS.value(collector="Test Measurement", result='error') == errors + 1
+    assert COLLECTOR_DURATION.value(collector="Test Measurement")[0] == observations + 2
+    assert COLLECTOR_LAST_RUN.value(collector="Test Measurement") >= before